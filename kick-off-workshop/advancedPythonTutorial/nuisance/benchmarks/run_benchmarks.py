@@ -0,0 +1,286 @@
+# -*- coding: utf-8 -*-
+# Name: run_benchmarks.py
+# Authors: Stephan Meighen-Berger
+# Benchmarks of the oscillation kernels and the grid construction
+#
+# Usage:
+#   python run_benchmarks.py --save before
+#   ... change something ...
+#   python run_benchmarks.py --compare before
+#
+# Results are stored in results/<name>.json, which is not tracked since
+# the timings depend on the machine. Make the baseline on the same machine,
+# e.g. by running with --save before applying a change. The first call of
+# each benchmark is timed separately and the time spent compiling is taken
+# from numba's compile events. The steady state is the median of the
+# following calls.
+
+import argparse
+import json
+import os
+import platform
+import sys
+from time import perf_counter
+
+import numba
+import numpy as np
+from numba.core import event
+
+# Module import
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from nu_isance import config
+from nu_isance.constants import mixing_angles, mdiff, Vearth
+from nu_isance.nu_oscillations import NuOsc
+from nu_isance.utils.oscillations import (
+    rotmatrix, buildmixingmatrix, effective_matrices, wp_prob,
+    wp_prob_effective, oscillation_calc_func
+)
+
+_results_folder = os.path.join(os.path.dirname(__file__), "results")
+
+# ------------------------------------------------------------------------------
+# Benchmarks
+# ------------------------------------------------------------------------------
+# Each benchmark returns the function to time. Benchmarks sharing kernels
+# are ordered from the inside out, so the compile time of a kernel is only
+# attributed to the first benchmark using it
+
+
+def bench_rotmatrix():
+    ang = np.deg2rad(mixing_angles[0, 2])
+    return lambda: rotmatrix(3, 0, 1, ang, 0.)
+
+
+def bench_buildmixingmatrix():
+    return lambda: buildmixingmatrix(mixing_angles)
+
+
+def bench_effective_matrices():
+    matter = Vearth * 10.
+    return lambda: effective_matrices(mixing_angles, mdiff, matter)
+
+
+def bench_wp_prob_vacuum():
+    return lambda: wp_prob(1, 0, 10., 5000., mixing_angles)
+
+
+def bench_wp_prob_matter():
+    return lambda: wp_prob(1, 0, 10., 5000., mixing_angles, matter=Vearth)
+
+
+def bench_wp_prob_effective():
+    U, M, _ = effective_matrices(mixing_angles, mdiff, Vearth * 10.)
+    return lambda: wp_prob_effective(1, 0, 10., 5000., U, M)
+
+
+def bench_oscillation_calc_func():
+    e_grid = np.logspace(-2, 2, 1000)
+    return lambda: oscillation_calc_func(
+        1, e_grid, 2.5, mixing_angles, matter=Vearth
+    )
+
+
+def nuosc_build(n_e: int, n_z: int, matter: bool):
+    """ a full grid build of NuOsc
+
+    Parameters
+    ----------
+    n_e, n_z: int
+        Size of the energy and angle grids
+    matter: bool
+        Propagate through matter
+
+    Returns
+    -------
+    build: function
+        Builds the grids of all initial flavors
+    """
+    def bench():
+        # The settings of this case only, the global config is not changed
+        settings = config.snapshot({"oscillation": {
+            "energy grid": np.logspace(-2, 2, n_e),
+            "angle grid": np.linspace(-1, 1., n_z),
+            "matter": matter,
+            "precalc": False,
+        }})
+
+        def build():
+            osc = NuOsc(settings)
+            osc.oscillation_prob_e
+            osc.oscillation_prob_mu
+            osc.oscillation_prob_tau
+        return build
+    return bench
+
+
+_benchmarks = {
+    "rotmatrix": bench_rotmatrix,
+    "buildmixingmatrix": bench_buildmixingmatrix,
+    "effective_matrices": bench_effective_matrices,
+    "wp_prob (vacuum)": bench_wp_prob_vacuum,
+    "wp_prob (matter)": bench_wp_prob_matter,
+    "wp_prob_effective": bench_wp_prob_effective,
+    "oscillation_calc_func": bench_oscillation_calc_func,
+}
+for _n_e, _n_z in [(100, 40), (300, 120), (1000, 400)]:
+    for _matter in [False, True]:
+        _benchmarks["NuOsc %dx%d (%s)" % (
+            _n_e, _n_z, "matter" if _matter else "vacuum"
+        )] = nuosc_build(_n_e, _n_z, _matter)
+
+
+# ------------------------------------------------------------------------------
+# Timing
+# ------------------------------------------------------------------------------
+def time_benchmark(func, repeat: int, min_time: float) -> dict:
+    """ times a benchmark
+
+    Parameters
+    ----------
+    func: function
+        The function to time
+    repeat: int
+        Minimum number of steady state measurements
+    min_time: float
+        Minimum time in seconds spent on the steady state. Fast functions
+        are called in batches so each measurement takes at least 1 ms
+
+    Returns
+    -------
+    timings: dict
+        The first call, the compile time and the steady state statistics
+        in seconds
+    """
+    compile_time = [0.]
+
+    def record(elapsed):
+        compile_time[0] += elapsed
+
+    with event.install_timer("numba:compile", record):
+        start = perf_counter()
+        func()
+        first = perf_counter() - start
+    # Calls per measurement
+    number = 1
+    while True:
+        start = perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = perf_counter() - start
+        if elapsed > 1e-3:
+            break
+        number *= 10
+    runs = [elapsed / number]
+    total = elapsed
+    while len(runs) < repeat or total < min_time:
+        start = perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = perf_counter() - start
+        runs.append(elapsed / number)
+        total += elapsed
+    return {
+        "first call": first,
+        "jit": compile_time[0],
+        "median": float(np.median(runs)),
+        "min": float(np.min(runs)),
+        "runs": len(runs),
+        "number": number,
+    }
+
+
+def machine_info() -> dict:
+    """ the environment the benchmarks were run in
+    """
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "numba": numba.__version__,
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "cpus": os.cpu_count(),
+        "numba threads": numba.config.NUMBA_NUM_THREADS,
+    }
+
+
+def format_time(seconds: float) -> str:
+    """ human readable time
+    """
+    for unit, scale in [("s", 1.), ("ms", 1e-3), ("us", 1e-6)]:
+        if seconds >= scale:
+            return "%.3g %s" % (seconds / scale, unit)
+    return "%.3g ns" % (seconds / 1e-9)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmarks of the nu_isance oscillations"
+    )
+    parser.add_argument(
+        "--save", help="Store the results as results/SAVE.json"
+    )
+    parser.add_argument(
+        "--compare", help="Compare to the stored results/COMPARE.json"
+    )
+    parser.add_argument(
+        "--tolerance", type=float, default=1.2,
+        help="Slowdown factor reported as a regression"
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--min-time", type=float, default=0.2)
+    parser.add_argument(
+        "-k", dest="select", default="",
+        help="Only run benchmarks containing this string"
+    )
+    args = parser.parse_args()
+
+    baseline = None
+    if args.compare is not None:
+        baseline_path = os.path.join(_results_folder, args.compare + ".json")
+        if not os.path.isfile(baseline_path):
+            parser.error(
+                "No stored results %s. Run with --save %s on this machine "
+                "first, e.g. before applying the change" % (
+                    baseline_path, args.compare
+                )
+            )
+        with open(baseline_path) as f:
+            baseline = json.load(f)["benchmarks"]
+
+    results = {}
+    regressions = []
+    print("%-32s %10s %10s %10s %10s" % (
+        "benchmark", "first", "jit", "median", "ratio"
+    ))
+    for name, setup in _benchmarks.items():
+        if args.select not in name:
+            continue
+        timings = time_benchmark(setup(), args.repeat, args.min_time)
+        results[name] = timings
+        ratio = ""
+        if baseline is not None and name in baseline:
+            factor = timings["median"] / baseline[name]["median"]
+            ratio = "%.2f" % factor
+            if factor > args.tolerance:
+                ratio += " !"
+                regressions.append(name)
+        print("%-32s %10s %10s %10s %10s" % (
+            name, format_time(timings["first call"]),
+            format_time(timings["jit"]), format_time(timings["median"]),
+            ratio
+        ))
+
+    if args.save is not None:
+        os.makedirs(_results_folder, exist_ok=True)
+        with open(os.path.join(_results_folder, args.save + ".json"), "w") as f:
+            json.dump(
+                {"machine": machine_info(), "benchmarks": results}, f,
+                indent=2
+            )
+    if regressions:
+        print("Slower than the baseline: %s" % ", ".join(regressions))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,11 +2,13 @@
 
 from .nu_isance import Nuisance
 from .config import config
+from .warmup import warmup
 from .errors import __init__
 from .nu_oscillations import __init__
+from .nu_fluxes import __init__
 from .utils import __init__
 
-__all__ = (Nuisance, config)
+__all__ = (Nuisance, config, warmup)
 
 # Version of the nuisance package
 __version__ = "1.0.2"
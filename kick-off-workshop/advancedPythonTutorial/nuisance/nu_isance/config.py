@@ -4,7 +4,9 @@
 # Config file for the nuisance package.
 
 import logging
-from typing import Dict, Any
+from collections.abc import Mapping
+from copy import deepcopy
+from typing import Dict, Any, Union
 import yaml
 import numpy as np
 
@@ -26,6 +28,9 @@ _baseconfig = {
         "log file handler": "nuisance.log",
         # Dump experiment config to this location
         "config location": "nuisance.txt",
+        # Reset the peak memory of the process at the start of each
+        # profiled stage. Changes the peak seen by other tools, Linux only
+        "reset peak memory": False,
     },
     ###########################################################################
     # Oscillation setup
@@ -33,9 +38,49 @@ _baseconfig = {
     "oscillation": {
         # If to use pre-calculated grids
         "precalc": False,
+        # Folder and maximum size (in bytes) of the pre-calculated grids.
+        # The least recently used grids are removed once this is exceeded
+        "precalc location": "./nuisance_grids/",
+        "precalc size": 2 * 1024**3,
         "energy grid": np.logspace(-2, 2, 1000),
         "angle grid": np.linspace(-1, 1., 400),
         "matter": True,
+        # Build the anti neutrino grids together with the neutrino grids.
+        # Only in vacuum are they filled in one shared pass. In matter they
+        # are built one after the other and only share the baselines
+        "anti neutrinos": False,
+        # Matter model: 'constant' potential or 'layered' Earth. The layers
+        # are rows of (outer radius in km, density in g/cm^3, electron
+        # fraction). None uses the simplified PREM model in constants
+        "earth model": "constant",
+        "earth layers": None,
+        # How the effective hamiltonian in matter is diagonalized:
+        # 'eigh' (general) or 'analytic' (closed-form, three flavors only)
+        "eigensolver": "eigh",
+        # Number of threads used to build the grids. None uses all cores.
+        # The grids are identical for any number of workers
+        "workers": 1,
+        # Size (cosZ, E) of the tiles calculated for NuOsc.prob queries
+        "tile size": [50, 100],
+        # Size (cosZ, E) of the chunks written by NuOsc.write_grid.
+        # Only a single chunk is kept in memory
+        "chunk size": [500, 2000],
+        # Storage of the grids: 'float64' or 'float32'. In compact mode
+        # nu_tau is not stored and follows from unitarity when accessed
+        "precision": "float64",
+        "compact": False,
+        # Averaging of the probabilities over the energy resolution:
+        # None, 'gaussian' or 'box' (uniform). The width is relative in L/E,
+        # i.e. roughly sigma_E / E, and the box extends over +- the width.
+        # Not available for the layered Earth model
+        "smearing": None,
+        "smearing width": 0.1,
+        # Calculate the derivatives with respect to the oscillation
+        # parameters (see constants.oscillation_parameters) together with
+        # the grids. They are otherwise built on first access of
+        # NuOsc.oscillation_grad_*. Only for vacuum and constant matter
+        # without smearing
+        "gradients": False,
     },
 }
 
@@ -83,5 +128,103 @@ class ConfigClass(dict):
         """
         self.update(user_dict)
 
+    def snapshot(
+        self, userconfig: Union[None, dict, str]=None
+    ) -> "ConfigSnapshot":
+        """ Creates an immutable copy of the config. Later changes of the
+        config do not affect the copy
+        Parameters
+        ----------
+        userconfig : dic, str or None
+            Settings (or the path to a yaml file) replacing the ones of
+            the config. Sections are updated key by key
+        Returns
+        -------
+        snapshot : ConfigSnapshot
+            The read-only config
+        """
+        settings = deepcopy(dict(self))
+        if isinstance(userconfig, str):
+            userconfig = yaml.load(open(userconfig), Loader=yaml.SafeLoader)
+        if userconfig is not None:
+            for key, value in userconfig.items():
+                if isinstance(value, dict) and isinstance(
+                        settings.get(key), dict):
+                    settings[key].update(deepcopy(value))
+                else:
+                    settings[key] = deepcopy(value)
+        return ConfigSnapshot(settings)
+
+
+class ConfigSnapshot(Mapping):
+    """ A read-only config, see ConfigClass.snapshot. Each Nuisance and
+    NuOsc instance holds its own snapshot, so differently configured
+    instances can be used side by side
+    Parameters
+    ----------
+    settings : dic
+        The config dictionary. Sections are stored as ConfigSnapshots,
+        lists as tuples and arrays as read-only copies
+    Returns
+    -------
+    None
+    """
+
+    def __init__(self, settings: Dict[Any, Any]):
+        self._settings = {
+            key: _freeze(value) for key, value in settings.items()
+        }
+
+    def __getitem__(self, key):
+        return self._settings[key]
+
+    def __iter__(self):
+        return iter(self._settings)
+
+    def __len__(self) -> int:
+        return len(self._settings)
+
+    def __repr__(self) -> str:
+        return "ConfigSnapshot(%r)" % self._settings
+
+    def to_dict(self) -> Dict[Any, Any]:
+        """ A mutable copy of the settings, e.g. to dump them
+        Parameters
+        ----------
+        None
+        Returns
+        -------
+        settings : dic
+            The config dictionary
+        """
+        return {
+            key: value.to_dict() if isinstance(value, ConfigSnapshot)
+            else list(value) if isinstance(value, tuple)
+            else np.array(value) if isinstance(value, np.ndarray)
+            else value
+            for key, value in self._settings.items()
+        }
+
+
+def _freeze(value):
+    """ Read-only version of a config value
+    Parameters
+    ----------
+    value : object
+        The value
+    Returns
+    -------
+    frozen : object
+        The read-only value
+    """
+    if isinstance(value, Mapping):
+        return ConfigSnapshot(value)
+    if isinstance(value, list):
+        return tuple(_freeze(item) for item in value)
+    if isinstance(value, np.ndarray):
+        value = np.array(value)
+        value.setflags(write=False)
+    return value
+
 
 config = ConfigClass(_baseconfig)
\ No newline at end of file
@@ -15,6 +15,20 @@ mdiff = np.array([1., 7.60e-5, 7.60e-5 + 2.35e-3]) * eV2GeV**2
 
 earth_pot_nucraft =  4 * 1e-22  # In GeV^{-2} and this includes density
 
+# 2 * sqrt(2) G_F N_A, i.e. earth_pot_nucraft per density (g/cm^3) and
+# electron fraction
+matter_pot_density = 1.526 * 1e-22
+
+# Simplified PREM Earth model
+# Outer radius in km, average density in g/cm^3 and electron fraction
+earth_layers = np.array([
+    [1221.5, 13.0, 0.466],  # Inner core
+    [3480., 11.3, 0.466],  # Outer core
+    [5701., 5.0, 0.496],  # Lower mantle
+    [6346.6, 3.9, 0.496],  # Upper mantle
+    [rEarth, 2.9, 0.496],  # Crust
+])
+
 # Mixing angles
 mixing_angles = np.array([
     [1, 2, np.arcsin(np.sqrt(0.307)) / np.pi * 180., 0.],  # 0.013
@@ -22,6 +36,12 @@ mixing_angles = np.array([
     [2, 3, np.arcsin(np.sqrt(0.512)) / np.pi * 180., 0.],  # 0.022
 ])
 
+# The oscillation parameters, e.g. of scan points and gradients.
+# The angles and the CP phase are in degrees, the mass differences in eV^2
+oscillation_parameters = [
+    "theta12", "theta13", "theta23", "delta_cp", "dm21", "dm31"
+]
+
 # Vearth can also be set to None for vacuum simulations
 Vearth = np.diag([
         earth_pot_nucraft,
@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+# Name: instrumentation.py
+# Authors: Stephan Meighen-Berger
+# Timing and memory measurements of the stages of a run
+
+# Native modules
+import json
+import logging
+import sys
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import perf_counter, process_time
+from numba.core import event
+
+_log = logging.getLogger(__name__)
+
+# The instrumentation kernel calls are counted for. Each thread has its own
+_active = ContextVar("instrumentation", default=None)
+
+
+def count_kernel(name: str) -> None:
+    """ counts a kernel call for the active instrumentation, if any
+
+    Parameters
+    ----------
+    name: str
+        Name of the kernel
+    """
+    instrumentation = _active.get()
+    if instrumentation is not None:
+        kernels = instrumentation._kernels
+        kernels[name] = kernels.get(name, 0) + 1
+
+
+def _memory() -> tuple:
+    """ the resident memory of the process in bytes
+
+    Returns
+    -------
+    current: int
+        The current resident memory. Where it is not available, e.g.
+        outside of Linux, this is the peak
+    peak: int
+        The peak resident memory, since the start or the last reset
+    """
+    try:
+        with open("/proc/self/status") as f:
+            status = f.read()
+    except OSError:
+        status = ""
+    values = {}
+    for line in status.splitlines():
+        if line.startswith(("VmRSS", "VmHWM")):
+            values[line[:5]] = int(line.split()[1]) * 1024
+    if len(values) == 2:
+        return values["VmRSS"], values["VmHWM"]
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    if sys.platform != "darwin":
+        peak *= 1024
+    return peak, peak
+
+
+def _reset_peak() -> None:
+    """ resets the peak memory of the process to the current memory.
+    Only available on Linux. This changes the peak for everyone reading
+    it, e.g. other tools profiling the process
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+class Instrumentation(object):
+    """ collects the wall time, CPU time, time spent compiling and the
+    memory of the stages of a run as well as the number of kernel calls.
+    Repeated stages are accumulated and nested stages are included in the
+    outer ones. The memory is measured relative to the resident memory of
+    the process at the start of each stage, so other threads contribute
+    to it
+    """
+    def __init__(self, reset_peak=False):
+        """ initializes the Instrumentation object
+
+        Parameters
+        ----------
+        reset_peak: bool
+            Optional: Reset the peak memory of the process at the start of
+            each stage. This measures peaks below earlier ones, but changes
+            the peak seen by anything else reading it. Only on Linux
+        """
+        self._reset_peak = reset_peak
+        self._stages = {}
+        self._kernels = {}
+        # Peak memory seen by the stages currently running
+        self._open = []
+
+    @contextmanager
+    def stage(self, name: str):
+        """ measures a stage of the run. The "memory" is the change of the
+        resident memory, i.e. what the stage keeps. The "peak memory" is
+        how far the peak of the process rose during the stage. Without
+        reset_peak, peaks below an earlier peak of the process are not seen
+
+        Parameters
+        ----------
+        name: str
+            Name of the stage
+        """
+        record = self._stages.setdefault(name, {
+            "calls": 0,
+            "wall time": 0.,
+            "cpu time": 0.,
+            "jit time": 0.,
+            "memory": 0,
+            "peak memory": 0,
+        })
+        # Running stages keep the peak seen so far before a reset
+        self._update_peaks()
+        if self._reset_peak:
+            _reset_peak()
+        start_memory, start_peak = _memory()
+        if self._reset_peak:
+            start_peak = start_memory
+        self._open.append(start_peak)
+        jit_time = [0.]
+
+        def record_jit(elapsed):
+            jit_time[0] += elapsed
+
+        token = _active.set(self)
+        start_wall = perf_counter()
+        start_cpu = process_time()
+        try:
+            with event.install_timer("numba:compile", record_jit):
+                yield
+        finally:
+            record["calls"] += 1
+            record["wall time"] += perf_counter() - start_wall
+            record["cpu time"] += process_time() - start_cpu
+            record["jit time"] += jit_time[0]
+            _active.reset(token)
+            self._update_peaks()
+            record["memory"] += _memory()[0] - start_memory
+            record["peak memory"] = max(
+                record["peak memory"], self._open.pop() - start_peak
+            )
+
+    def _update_peaks(self) -> None:
+        """ adds the current peak memory to the running stages
+        """
+        peak = _memory()[1]
+        self._open = [max(stage_peak, peak) for stage_peak in self._open]
+
+    @property
+    def report(self) -> dict:
+        """ the measurements. Times are in seconds and memory in bytes.
+        The memory can be negative if a stage freed more than it allocated
+        """
+        return {
+            "stages": {
+                name: dict(record) for name, record in self._stages.items()
+            },
+            "kernels": dict(self._kernels),
+        }
+
+    def write(self, filename: str) -> None:
+        """ writes the measurements as json
+
+        Parameters
+        ----------
+        filename: str
+            The file to write to
+        """
+        _log.debug("Writing the instrumentation to %s", filename)
+        with open(filename, "w") as f:
+            json.dump(self.report, f, indent=2)
@@ -0,0 +1 @@
+from .nu_fluxes import NuFlux
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+# nu_fluxes.py
+# Authors: Stephan Meighen-Berger
+# Folds neutrino fluxes with the oscillation grids
+
+# imports
+import logging
+import numpy as np
+from scipy.interpolate import RegularGridInterpolator
+
+_log = logging.getLogger(__name__)
+
+
+class NuFlux(object):
+    """ applies the oscillation grids of a NuOsc to batches of fluxes.
+    The fluxes are arrays with shape (model, flavor, cosZ, E) on the grid
+    of the NuOsc. The flavor axis either holds (nu_e, nu_mu, nu_tau) or
+    additionally the anti neutrinos (nu_e, nu_mu, nu_tau, nu_e_bar,
+    nu_mu_bar, nu_tau_bar)
+    """
+    def __init__(self, osc):
+        """ initializes the NuFlux object
+
+        Parameters
+        ----------
+        osc: NuOsc
+            The oscillation grids
+        """
+        self._osc = osc
+        self._probs = {}
+
+    def load(self, filenames) -> np.ndarray:
+        """ loads flux tables and interpolates them onto the grid.
+        Each table has the columns E [GeV], cosZ and the fluxes of
+        nu_e, nu_mu, nu_tau and optionally of the anti neutrinos.
+        The (E, cosZ) points have to form a regular grid. The fluxes
+        are interpolated linearly in (log(E), cosZ) and points outside
+        of the table are set to the value of the closest edge
+
+        Parameters
+        ----------
+        filenames: str or list
+            The flux tables. Lines starting with # are ignored
+
+        Returns
+        -------
+        fluxes: np.ndarray
+            The fluxes with shape (model, flavor, cosZ, E)
+        """
+        if isinstance(filenames, str):
+            filenames = [filenames]
+        log_e = np.log(self._osc.e_grid)
+        points = np.stack(np.meshgrid(self._osc.cosZ, log_e, indexing="ij"))
+        fluxes = []
+        for filename in filenames:
+            _log.debug("Loading the flux table %s", filename)
+            table = np.loadtxt(filename, comments="#", ndmin=2)
+            e_table = np.unique(table[:, 0])
+            cosZ_table = np.unique(table[:, 1])
+            if len(table) != len(e_table) * len(cosZ_table):
+                raise ValueError(
+                    "The flux table %s is not a regular grid" % filename
+                )
+            # Sorting by (cosZ, E) to reshape the table into the grid
+            order = np.lexsort((table[:, 0], table[:, 1]))
+            values = table[order, 2:].reshape(
+                len(cosZ_table), len(e_table), -1
+            )
+            interpolator = RegularGridInterpolator(
+                (cosZ_table, np.log(e_table)), values,
+                bounds_error=False, fill_value=None
+            )
+            flux = interpolator(np.stack([
+                np.clip(points[0], cosZ_table[0], cosZ_table[-1]),
+                np.clip(points[1], np.log(e_table[0]), np.log(e_table[-1])),
+            ], axis=-1))
+            fluxes.append(np.moveaxis(flux, -1, 0))
+        return np.array(fluxes)
+
+    def fold(self, fluxes: np.ndarray) -> np.ndarray:
+        """ oscillated fluxes of a batch of flux models. All models are
+        folded in a single contraction over the initial flavors
+
+        Parameters
+        ----------
+        fluxes: np.ndarray
+            The fluxes with shape (model, flavor, cosZ, E). The cosZ and E
+            axes may also have length one, e.g. for zenith independent
+            fluxes
+
+        Returns
+        -------
+        oscillated: np.ndarray
+            The oscillated fluxes with shape (model, flavor, cosZ, E)
+        """
+        fluxes = np.asarray(fluxes)
+        if fluxes.ndim != 4:
+            raise ValueError(
+                "The fluxes need the shape (model, flavor, cosZ, E)," +
+                " got %s" % str(fluxes.shape)
+            )
+        n_flavors = len(self._probabilities(1))
+        if fluxes.shape[1] not in [n_flavors, 2 * n_flavors]:
+            raise ValueError(
+                "The fluxes need %d or %d flavors, got %d" % (
+                    n_flavors, 2 * n_flavors, fluxes.shape[1]
+                )
+            )
+        antis = [1, -1][:fluxes.shape[1] // n_flavors]
+        probs = [self._probabilities(anti) for anti in antis]
+        oscillated = []
+        with self._osc.instrumentation.stage("flux folding"):
+            for idA in range(len(antis)):
+                flux = np.broadcast_to(
+                    fluxes[:, idA * n_flavors:(idA + 1) * n_flavors],
+                    (len(fluxes), n_flavors) + probs[idA].shape[2:]
+                )
+                oscillated.append(np.einsum(
+                    "maze,abze->mbze", flux, probs[idA], optimize=True
+                ))
+            return np.concatenate(oscillated, axis=1)
+
+    def _probabilities(self, anti: int) -> np.ndarray:
+        """ the full probability grid, fetched once from the NuOsc
+
+        Parameters
+        ----------
+        anti: int
+            +1 for neutrinos and -1 for anti neutrinos
+
+        Returns
+        -------
+        oscillation_probs: np.ndarray
+            The oscillation probabilities with shape
+            (initial flavor, final flavor, cosZ, E)
+        """
+        if anti not in self._probs:
+            self._probs[anti] = self._osc.oscillation_probs(anti=anti)
+        return self._probs[anti]
@@ -5,6 +5,8 @@
 
 # Native modules
 import logging
+import os
+import threading
 from typing import Union
 from  time import time
 import numpy as np
@@ -15,6 +17,8 @@ import yaml
 # ---------------------------
 from .config import config
 from .nu_oscillations import NuOsc
+from .nu_fluxes import NuFlux
+from .instrumentation import Instrumentation
 
 
 # unless we put this class in __init__, __name__ will be nuisance.nuisance
@@ -28,6 +32,54 @@ numba_logger.setLevel(logging.WARNING)
 matplotlib_logger = logging.getLogger('matplotlib')
 matplotlib_logger.setLevel(logging.WARNING)
 
+# Handlers shared by all instances, with the number of instances using them
+_handlers = {}
+_handlers_lock = threading.Lock()
+
+
+def _acquire_handler(key: tuple, factory) -> logging.Handler:
+    """ attaches a handler to the logger, unless an instance already did
+
+    Parameters
+    ----------
+    key: tuple
+        Identifies the handler, e.g. by the file it writes to
+    factory: function
+        Creates the handler
+
+    Returns
+    -------
+    handler: logging.Handler
+        The shared handler
+    """
+    with _handlers_lock:
+        if key not in _handlers:
+            handler = factory()
+            _log.addHandler(handler)
+            _handlers[key] = [handler, 0]
+        _handlers[key][1] += 1
+        return _handlers[key][0]
+
+
+def _release_handler(key: tuple) -> None:
+    """ detaches and closes a handler once no instance uses it anymore
+
+    Parameters
+    ----------
+    key: tuple
+        Identifies the handler, see _acquire_handler
+
+    Returns
+    -------
+    None
+    """
+    with _handlers_lock:
+        _handlers[key][1] -= 1
+        if _handlers[key][1] == 0:
+            handler = _handlers.pop(key)[0]
+            _log.removeHandler(handler)
+            handler.close()
+
 
 class Nuisance(object):
     """ the Nuisance class. This object is the interface to the
@@ -41,59 +93,44 @@ class Nuisance(object):
         params
         ------
         userconfig: Configuration dictionary or
-        path to yaml file which specifies configuration
+        path to yaml file which specifies configuration.
+        The settings are applied on top of a snapshot of the global
+        config, which is not changed
 
         raises
         ------
         """
         start = time()
-        # The config
-        if userconfig is not None:
-            if isinstance(userconfig, dict):
-                config.from_dict(userconfig)
-            else:
-                config.from_yaml(userconfig)
+        # The config of this instance
+        self._config = config.snapshot(userconfig)
+        conf = self._config
+        self._instrumentation = Instrumentation(
+            reset_peak=conf["general"]["reset peak memory"]
+        )
 
         # Create RandomState
-        if config["general"]["random state seed"] is None:
+        if conf["general"]["random state seed"] is None:
             _log.warning("No random state seed given, constructing new state")
-            rstate = np.random.RandomState()
+            self._rstate = np.random.RandomState()
         else:
-            rstate = np.random.RandomState(
-                config["general"]["random state seed"]
+            self._rstate = np.random.RandomState(
+                conf["general"]["random state seed"]
             )
-        config["runtime"] = {"random state": rstate}
 
         # Logger
-        # Logging formatter
-        fmt = "%(levelname)s: %(message)s"
-        fmt_with_name = "[%(name)s] " + fmt
-        formatter_with_name = logging.Formatter(fmt=fmt_with_name)
-        # creating file handler with debug messages
-        if config["general"]["enable logging"]:
-            fh = logging.FileHandler(
-                config["general"]["log file handler"], mode="w"
-            )
-            fh.setLevel(logging.DEBUG)
-            fh.setFormatter(formatter_with_name)
-            _log.addHandler(fh)
-        else:
-            _log.disabled = True
-        # console logger with a higher log level
-        ch = logging.StreamHandler(sys.stdout)
-        ch.setLevel(config["general"]["debug level"])
-        # add class name to ch only when debugging
-        if config["general"]["debug level"] == logging.DEBUG:
-            ch.setFormatter(formatter_with_name)
-        else:
-            formatter = logging.Formatter(fmt=fmt)
-            ch.setFormatter(formatter)
-        _log.addHandler(ch)
+        # The handlers are shared, so instances used side by side do not
+        # repeat each message. Without logging no handlers are added
+        self._handler_keys = []
+        if conf["general"]["enable logging"]:
+            self._setup_logging()
         _log.setLevel(logging.DEBUG)
         _log.info("Starting")
         _log.info("Welcome to nuisance. I'm here to help")
-        self.osc = NuOsc()
-        _log.info("Setup took %.f seconds" % (start - time()))
+        # The grids are only built once they are used, which is when the
+        # stages are profiled
+        self.osc = NuOsc(conf, instrumentation=self._instrumentation)
+        self.flux = NuFlux(self.osc)
+        _log.info("Setup took %.f seconds" % (time() - start))
 
     def close(self):
         """ Wraps up the program
@@ -107,13 +144,18 @@ class Nuisance(object):
         _log.info('---------------------------------------------------')
         _log.info('---------------------------------------------------')
         # A new simulation
-        if config["general"]["enable logging"]:
+        conf = self._config
+        if conf["general"]["enable logging"]:
             _log.debug(
                 "Dumping run settings into %s",
-                config["general"]["config location"],
+                conf["general"]["config location"],
+            )
+            with open(conf["general"]["config location"], "w") as f:
+                yaml.dump(conf.to_dict(), f)
+            self._instrumentation.write(
+                os.path.splitext(conf["general"]["config location"])[0] +
+                "_profile.json"
             )
-            with open(config["general"]["config location"], "w") as f:
-                yaml.dump(config, f)
             _log.debug("Finished dump")
             _log.info("................................................................................")
             _log.info("................................................................................")
@@ -134,5 +176,67 @@ class Nuisance(object):
             _log.info("........................................................@ @.....................")
             _log.info("................................................................................")
             _log.info("Bye!")
-        # Closing log
-        logging.shutdown()
+        # Closing the handlers no other instance uses
+        for key in self._handler_keys:
+            _release_handler(key)
+        self._handler_keys = []
+
+    def _setup_logging(self) -> None:
+        """ attaches the file and console handlers. Instances writing to
+        the same file share one file handler and all instances share the
+        console handler. Its level is the most verbose one requested
+        Parameters
+        ----------
+        None
+        Returns
+        -------
+        None
+        """
+        conf = self._config
+        # Logging formatter
+        fmt = "%(levelname)s: %(message)s"
+        fmt_with_name = "[%(name)s] " + fmt
+        formatter_with_name = logging.Formatter(fmt=fmt_with_name)
+        # creating file handler with debug messages
+        log_file = os.path.abspath(conf["general"]["log file handler"])
+
+        def file_handler():
+            fh = logging.FileHandler(log_file, mode="w")
+            fh.setLevel(logging.DEBUG)
+            fh.setFormatter(formatter_with_name)
+            return fh
+        self._handler_keys.append(("file", log_file))
+        _acquire_handler(self._handler_keys[-1], file_handler)
+        # console logger with a higher log level
+        self._handler_keys.append(("console",))
+        ch = _acquire_handler(
+            self._handler_keys[-1], lambda: logging.StreamHandler(sys.stdout)
+        )
+        level = conf["general"]["debug level"]
+        if ch.formatter is None or level < ch.level:
+            ch.setLevel(level)
+            # add class name to ch only when debugging
+            if level == logging.DEBUG:
+                ch.setFormatter(formatter_with_name)
+            else:
+                ch.setFormatter(logging.Formatter(fmt=fmt))
+
+    @property
+    def config(self):
+        """ the read-only settings of this instance
+        """
+        return self._config
+
+    @property
+    def profile(self) -> dict:
+        """ the wall time, CPU time, compile time and memory (in bytes)
+        of each stage and the number of kernel calls so far. close() writes
+        it as json next to the config dump
+        """
+        return self._instrumentation.report
+
+    @property
+    def rstate(self) -> np.random.RandomState:
+        """ the random state of this instance
+        """
+        return self._rstate
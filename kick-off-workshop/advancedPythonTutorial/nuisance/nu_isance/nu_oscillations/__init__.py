@@ -1 +1,5 @@
-from .nu_oscillations import NuOsc
\ No newline at end of file
+from .nu_oscillations import NuOsc
+from .eigensystem import NuEigensystem
+from .layered_earth import NuLayeredEarth
+from .adaptive_grid import NuAdaptiveGrid
+from .parameter_scan import parameter_scan, point_parameters
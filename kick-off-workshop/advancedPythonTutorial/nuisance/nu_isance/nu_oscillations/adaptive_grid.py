@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+# adaptive_grid.py
+# Authors: Stephan Meighen-Berger
+# Energy grids refined until the interpolation error is below a target
+
+# imports
+import logging
+import numpy as np
+
+# module import
+from ..utils import interpolation_nodes
+
+_log = logging.getLogger(__name__)
+
+
+class NuAdaptiveGrid(object):
+    """ oscillation grid with a non-uniform energy grid. Intervals in
+    log(E) are halved until linear interpolation reproduces the
+    probabilities at their midpoints to within the tolerance, for all
+    flavor channels and injection angles. Fast oscillations (low energies,
+    long baselines) thus get dense nodes, while the slowly varying high
+    energy region keeps only a few
+    """
+    def __init__(
+            self, eigensystem_builder, cosZ: np.ndarray, e_range,
+            tolerance=1e-3, initial_points=65, max_points=20000
+        ):
+        """ initializes and refines the NuAdaptiveGrid object
+
+        Parameters
+        ----------
+        eigensystem_builder: function
+            Builds the eigensystems for an energy grid, e.g. a
+            NuEigensystem or NuLayeredEarth
+        cosZ: np.ndarray
+            cosine of the injection angles
+        e_range: list
+            The minimal and maximal energy
+        tolerance: float
+            Optional: The maximal absolute interpolation error
+        initial_points: int
+            Optional: Number of log spaced energies to start with. Too few
+            points can miss oscillations shorter than the initial spacing
+        max_points: int
+            Optional: The refinement stops once this number of energies
+            would be exceeded
+        """
+        self._builder = eigensystem_builder
+        self._cosZ = np.atleast_1d(np.asarray(cosZ, dtype=np.float64))
+        self._tolerance = tolerance
+        log_e = np.linspace(
+            np.log(e_range[0]), np.log(e_range[1]), initial_points
+        )
+        probs = self._evaluate(log_e)
+        # Intervals which still need to be checked
+        active = np.ones(len(log_e) - 1, dtype=bool)
+        self._converged = True
+        while np.any(active):
+            intervals = np.nonzero(active)[0]
+            if len(log_e) + len(intervals) > max_points:
+                _log.warning(
+                    "Stopping the refinement at %d energies" % len(log_e) +
+                    " before reaching the tolerance of %g" % tolerance
+                )
+                self._converged = False
+                break
+            midpoints = 0.5 * (log_e[intervals] + log_e[intervals + 1])
+            mid_probs = self._evaluate(midpoints)
+            errors = np.max(np.abs(
+                mid_probs -
+                0.5 * (probs[..., intervals] + probs[..., intervals + 1])
+            ), axis=(0, 1, 2))
+            # The midpoints are kept, both halves are checked again
+            # if the interval was not accurate enough
+            refine = np.zeros(len(active), dtype=bool)
+            refine[intervals] = errors > tolerance
+            log_e = np.insert(log_e, intervals + 1, midpoints)
+            probs = np.insert(probs, intervals + 1, mid_probs, axis=-1)
+            active = np.repeat(refine, np.where(active, 2, 1))
+            _log.debug(
+                "%d energies, %d intervals to refine",
+                len(log_e), np.sum(active)
+            )
+        self._e_grid = np.exp(log_e)
+        self._log_e = log_e
+        self._probs = probs
+        _log.info(
+            "Adaptive grid with %d energies for a tolerance of %g",
+            len(self._e_grid), tolerance
+        )
+
+    def _evaluate(self, log_e: np.ndarray) -> np.ndarray:
+        """ oscillation probabilities at the given energies
+
+        Parameters
+        ----------
+        log_e: np.ndarray
+            The logarithm of the energies
+
+        Returns
+        -------
+        oscillation_probs: np.ndarray
+            The oscillation probabilities with shape
+            (initial flavor, final flavor, cosZ, E)
+        """
+        return self._builder(np.exp(log_e)).grid(self._cosZ)
+
+    @property
+    def e_grid(self) -> np.ndarray:
+        """ the non-uniform energy grid
+        """
+        return self._e_grid
+
+    @property
+    def cosZ(self) -> np.ndarray:
+        """ the grid of the cosine of the injection angles
+        """
+        return self._cosZ
+
+    @property
+    def converged(self) -> bool:
+        """ if the tolerance was reached everywhere
+        """
+        return self._converged
+
+    @property
+    def oscillation_probs(self) -> np.ndarray:
+        """ the oscillation probabilities on the grid with shape
+        (initial flavor, final flavor, cosZ, E)
+        """
+        return self._probs
+
+    def prob(
+            self, alpha: int, beta: int, E: np.ndarray, cosZ: np.ndarray
+        ) -> np.ndarray:
+        """ oscillation probabilities at arbitrary points, interpolated
+        linearly in (log(E), cosZ). Points outside of the grid are set to
+        the value of the closest edge
+
+        Parameters
+        ----------
+        alpha: int
+            Flavor state oscillating from
+        beta: int
+            Flavor state to oscillate to
+        E: np.ndarray
+            Energies of the oscillating neutrinos
+        cosZ: np.ndarray
+            cosine of the injection angles
+
+        Returns
+        -------
+        oscillation_prob: np.ndarray
+            The oscillation probabilities with the broadcast shape
+            of E and cosZ
+        """
+        E, cosZ = np.broadcast_arrays(
+            np.asarray(E, dtype=np.float64), np.asarray(cosZ, dtype=np.float64)
+        )
+        lowE, upE, wE = interpolation_nodes(self._log_e, np.log(E))
+        lowZ, upZ, wZ = interpolation_nodes(self._cosZ, cosZ)
+        grid = self._probs[alpha, beta]
+        return (
+            (1 - wZ) * (1 - wE) * grid[lowZ, lowE] +
+            (1 - wZ) * wE * grid[lowZ, upE] +
+            wZ * (1 - wE) * grid[upZ, lowE] +
+            wZ * wE * grid[upZ, upE]
+        )
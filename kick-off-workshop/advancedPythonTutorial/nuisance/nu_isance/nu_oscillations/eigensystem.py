@@ -0,0 +1,471 @@
+# -*- coding: utf-8 -*-
+# eigensystem.py
+# Authors: Stephan Meighen-Berger
+# Reusable per-energy effective eigensystems
+
+# imports
+import logging
+import numpy as np
+
+# module import
+from ..errors import UnphysicalError, NotImplementedError
+from ..utils import effective_eigensystems, oscillation_grid_effective
+from ..utils import effective_eigensystems_parallel
+from ..utils import oscillation_grid_effective_parallel
+from ..utils import oscillation_grid_effective_both
+from ..utils import oscillation_grid_effective_both_parallel
+from ..utils import atmospheric_baselines, numba_threads
+from ..utils import smearing_widths
+from ..utils import effective_gradients, effective_gradients_parallel
+from ..utils import oscillation_grid_gradients
+from ..utils import oscillation_grid_gradients_parallel
+from ..constants import mixing_angles as default_mixing_angles
+from ..constants import mdiff as default_mdiff
+from ..instrumentation import count_kernel
+
+_log = logging.getLogger(__name__)
+
+# Relative energy step used for the energy dependence of the effective
+# masses when smearing in matter
+_slope_step = 1e-4
+
+
+class NuEigensystem(object):
+    """ table of the effective mixing and mass matrices for an energy grid.
+    The table is built once and can be reused for any set of baselines
+    """
+    def __init__(
+            self, e_grid: np.ndarray, mixing_angles=None, mdiff=None,
+            matter=None, anti=1, mass_states=3, workers=1, analytic=False,
+            smearing=None, box=False
+        ):
+        """ initializes the NuEigensystem object
+
+        Parameters
+        ----------
+        e_grid: np.ndarray
+            Energy of the oscillating neutrino
+        mixing_angles: np.ndarray
+            Optional: PMNS matrix. Defaults to the package constants
+        mdiff: np.ndarray
+            Optional: The mass squared differences. Defaults to the package
+            constants
+        matter: np.ndarray or None
+            Optional: The effective matter potential
+        anti: int
+            Optional: +1 for neutrinos and -1 for anti neutrinos
+        mass_states: int
+            Optional: Number of mass states,
+            this should agree with the mixing matrix
+        workers: int or None
+            Optional: Number of threads to split the energies over.
+            None uses all available threads. The results do not depend
+            on this setting
+        analytic: bool
+            Optional: Use the closed-form eigensystems instead of np.linalg.eigh
+        smearing: float, np.ndarray or None
+            Optional: Relative width in L/E (roughly sigma_E / E) the
+            probabilities are averaged over. Either one value or one per
+            energy. None calculates the probabilities at the energies
+        box: bool
+            Optional: Average uniformly over L/E (1 +- smearing) instead
+            of using a gaussian
+        """
+        if anti not in [1, -1]:
+            raise UnphysicalError(
+                "The parameters anti is set to %d." %anti +
+                " It has to be either 1 or -1!"
+            )
+        if mixing_angles is None:
+            mixing_angles = default_mixing_angles
+        if mdiff is None:
+            mdiff = default_mdiff
+        self._e_grid = np.asarray(e_grid, dtype=np.float64)
+        self._mass_states = mass_states
+        self._anti = anti
+        self._workers = workers
+        self._parameters = (mixing_angles, mdiff, matter)
+        self._dU, self._dM = None, None
+        _log.debug("Building %d effective eigensystems", len(self._e_grid))
+        self._U, self._M = _eigensystems(
+            self._e_grid, mixing_angles, mdiff, matter, anti, mass_states,
+            workers, analytic
+        )
+        Mlower, Mupper = None, None
+        if smearing is not None and matter is not None:
+            # The change of the effective masses with the energy
+            Mlower, Mupper = [
+                _eigensystems(
+                    self._e_grid * (1. + sign * _slope_step), mixing_angles,
+                    mdiff, matter, anti, mass_states, workers, analytic
+                )[1]
+                for sign in [-1., 1.]
+            ]
+        self._set_smearing(smearing, box, Mlower, Mupper)
+
+    def _set_smearing(
+            self, smearing, box: bool, Mlower=None, Mupper=None
+        ) -> None:
+        """ stores the relative widths of the interference phases
+
+        Parameters
+        ----------
+        smearing: float, np.ndarray or None
+            The relative widths in L/E
+        box: bool
+            Average uniformly instead of using a gaussian
+        Mlower, Mupper: np.ndarray or None
+            Optional: The effective mass matrices at slightly lower and
+            higher energies. None for vacuum
+        """
+        if smearing is None:
+            self._smearing = None
+        else:
+            self._smearing = smearing_widths(
+                np.array(np.broadcast_to(
+                    np.asarray(smearing, dtype=np.float64),
+                    self._e_grid.shape
+                )),
+                self._M, Mlower, Mupper, step=_slope_step,
+                mass_states=self._mass_states
+            )
+        self._box = box
+
+    @property
+    def e_grid(self) -> np.ndarray:
+        """ the energy grid
+        """
+        return self._e_grid
+
+    @property
+    def anti(self) -> int:
+        """ +1 for neutrinos and -1 for anti neutrinos
+        """
+        return self._anti
+
+    @property
+    def Ueffective(self) -> np.ndarray:
+        """ the effective mixing matrices with shape (E, flavor, mass)
+        """
+        return self._U
+
+    @property
+    def Meffective(self) -> np.ndarray:
+        """ the effective mass matrices with shape (E, mass, mass)
+        """
+        return self._M
+
+    def probabilities(
+            self, distances: np.ndarray, initial_flavors=None,
+            energies=slice(None), dtype=np.float64, compact=False
+        ) -> np.ndarray:
+        """ oscillation probabilities for the given baselines
+
+        Parameters
+        ----------
+        distances: np.ndarray
+            Travel distances in km
+        initial_flavors: list or None
+            Optional: The flavor states oscillating from. Defaults to all
+        energies: slice
+            Optional: The part of the energy grid to evaluate
+        dtype: np.dtype
+            Optional: The precision the results are stored with
+        compact: bool
+            Optional: Skip the last final flavor. It follows from
+            unitarity, see complete_flavors
+
+        Returns
+        -------
+        oscillation_probs: np.ndarray
+            The oscillation probabilities with shape
+            (initial flavor, final flavor, len(distances), E)
+        """
+        distances = np.atleast_1d(np.asarray(distances, dtype=np.float64))
+        if initial_flavors is not None:
+            initial_flavors = np.asarray(initial_flavors, dtype=np.int64)
+        e_grid = self._e_grid[energies]
+        U = np.ascontiguousarray(self._U[energies])
+        M = np.ascontiguousarray(self._M[energies])
+        smearing = None
+        if self._smearing is not None:
+            smearing = np.ascontiguousarray(self._smearing[energies])
+        count_kernel("oscillation_grid_effective")
+        if self._workers == 1:
+            return oscillation_grid_effective(
+                e_grid, distances, U, M, mass_states=self._mass_states,
+                initial_flavors=initial_flavors,
+                compact=compact, dtype=dtype,
+                smearing=smearing, box=self._box
+            )
+        with numba_threads(self._workers):
+            return oscillation_grid_effective_parallel(
+                e_grid, distances, U, M, mass_states=self._mass_states,
+                initial_flavors=initial_flavors,
+                compact=compact, dtype=dtype,
+                smearing=smearing, box=self._box
+            )
+
+    @staticmethod
+    def probabilities_both(
+            nu, nubar, distances: np.ndarray, initial_flavors=None,
+            energies=slice(None), dtype=np.float64, compact=False
+        ):
+        """ oscillation probabilities of a neutrino and an anti neutrino
+        eigensystem for the same baselines. The shared fill is vacuum only:
+        there the anti neutrino eigensystem is the complex conjugate of the
+        neutrino one and both grids are filled in one pass sharing most of
+        the work, see oscillation_grid_effective_both. In matter (or with
+        any other difference between the eigensystems) the effective masses
+        differ, nothing is shared and the grids are calculated one after
+        the other. The results are the same as from probabilities
+
+        Parameters
+        ----------
+        nu, nubar: NuEigensystem
+            The neutrino and anti neutrino eigensystems
+        distances: np.ndarray
+            Travel distances in km
+        initial_flavors: list or None
+            Optional: The flavor states oscillating from. Defaults to all
+        energies: slice
+            Optional: The part of the energy grid to evaluate
+        dtype: np.dtype
+            Optional: The precision the results are stored with
+        compact: bool
+            Optional: Skip the last final flavor
+
+        Returns
+        -------
+        oscillation_probs, oscillation_probs_bar: np.ndarray
+            The oscillation probabilities with shape
+            (initial flavor, final flavor, len(distances), E)
+        """
+        shared = (
+            np.array_equal(nu._e_grid, nubar._e_grid) and
+            np.array_equal(nu._M, nubar._M) and
+            np.array_equal(nu._U, np.conj(nubar._U)) and
+            nu._box == nubar._box and
+            (nu._smearing is None) == (nubar._smearing is None) and (
+                nu._smearing is None or
+                np.array_equal(nu._smearing, nubar._smearing)
+            )
+        )
+        if not shared:
+            return tuple(
+                system.probabilities(
+                    distances, initial_flavors=initial_flavors,
+                    energies=energies, dtype=dtype, compact=compact
+                )
+                for system in [nu, nubar]
+            )
+        distances = np.atleast_1d(np.asarray(distances, dtype=np.float64))
+        if initial_flavors is not None:
+            initial_flavors = np.asarray(initial_flavors, dtype=np.int64)
+        e_grid = nu._e_grid[energies]
+        U = np.ascontiguousarray(nu._U[energies])
+        M = np.ascontiguousarray(nu._M[energies])
+        smearing = None
+        if nu._smearing is not None:
+            smearing = np.ascontiguousarray(nu._smearing[energies])
+        count_kernel("oscillation_grid_effective_both")
+        if nu._workers == 1:
+            probs = oscillation_grid_effective_both(
+                e_grid, distances, U, M, mass_states=nu._mass_states,
+                initial_flavors=initial_flavors,
+                compact=compact, dtype=dtype,
+                smearing=smearing, box=nu._box
+            )
+        else:
+            with numba_threads(nu._workers):
+                probs = oscillation_grid_effective_both_parallel(
+                    e_grid, distances, U, M, mass_states=nu._mass_states,
+                    initial_flavors=initial_flavors,
+                    compact=compact, dtype=dtype,
+                    smearing=smearing, box=nu._box
+                )
+        return probs[0], probs[1]
+
+    def probabilities_with_gradients(
+            self, distances: np.ndarray, initial_flavors=None,
+            energies=slice(None), dtype=np.float64, compact=False
+        ):
+        """ oscillation probabilities and their derivatives with respect
+        to the oscillation parameters (theta12, theta13, theta23, delta_cp)
+        in degrees and (dm21, dm31) in eV^2. Both are calculated in the
+        same pass. The parameters are the same as for probabilities
+
+        Returns
+        -------
+        oscillation_probs: np.ndarray
+            The oscillation probabilities with shape
+            (initial flavor, final flavor, len(distances), E)
+        oscillation_grads: np.ndarray
+            The derivatives with shape
+            (parameter, initial flavor, final flavor, len(distances), E)
+        """
+        if self._smearing is not None:
+            raise NotImplementedError(
+                "Gradients are not available for smeared probabilities!"
+            )
+        distances = np.atleast_1d(np.asarray(distances, dtype=np.float64))
+        if initial_flavors is not None:
+            initial_flavors = np.asarray(initial_flavors, dtype=np.int64)
+        dU, dM = self._gradients()
+        e_grid = self._e_grid[energies]
+        U = np.ascontiguousarray(self._U[energies])
+        M = np.ascontiguousarray(self._M[energies])
+        dU = np.ascontiguousarray(dU[energies])
+        dM = np.ascontiguousarray(dM[energies])
+        count_kernel("oscillation_grid_gradients")
+        if self._workers == 1:
+            return oscillation_grid_gradients(
+                e_grid, distances, U, M, dU, dM,
+                mass_states=self._mass_states,
+                initial_flavors=initial_flavors, compact=compact, dtype=dtype
+            )
+        with numba_threads(self._workers):
+            return oscillation_grid_gradients_parallel(
+                e_grid, distances, U, M, dU, dM,
+                mass_states=self._mass_states,
+                initial_flavors=initial_flavors, compact=compact, dtype=dtype
+            )
+
+    def _gradients(self):
+        """ the derivatives of the eigensystems, built on first access
+
+        Returns
+        -------
+        dUeffective, dMeffective: np.ndarray
+            See effective_gradients
+        """
+        if self._dU is None:
+            mixing_angles, mdiff, matter = self._parameters
+            _log.debug(
+                "Building the derivatives of %d eigensystems",
+                len(self._e_grid)
+            )
+            count_kernel("effective_gradients")
+            kernel = effective_gradients
+            if self._workers != 1:
+                kernel = effective_gradients_parallel
+            with numba_threads(self._workers):
+                self._dU, self._dM = kernel(
+                    self._e_grid, mixing_angles, mdiff, self._U, self._M,
+                    mass_states=self._mass_states, matter=matter,
+                    anti=self._anti
+                )
+        return self._dU, self._dM
+
+    def grid(
+            self, cosZ: np.ndarray, initial_flavors=None,
+            energies=slice(None), dtype=np.float64, compact=False
+        ) -> np.ndarray:
+        """ oscillation probabilities for atmospheric neutrinos
+
+        Parameters
+        ----------
+        cosZ: np.ndarray
+            cosine of the injection angles
+        initial_flavors: list or None
+            Optional: The flavor states oscillating from. Defaults to all
+        energies: slice
+            Optional: The part of the energy grid to evaluate
+        dtype: np.dtype
+            Optional: The precision the results are stored with
+        compact: bool
+            Optional: Skip the last final flavor
+
+        Returns
+        -------
+        oscillation_probs: np.ndarray
+            The oscillation probabilities with shape
+            (initial flavor, final flavor, cosZ, E)
+        """
+        return self.probabilities(
+            atmospheric_baselines(
+                np.atleast_1d(np.asarray(cosZ, dtype=np.float64))
+            ),
+            initial_flavors=initial_flavors, energies=energies,
+            dtype=dtype, compact=compact
+        )
+
+    def grid_with_gradients(
+            self, cosZ: np.ndarray, initial_flavors=None,
+            energies=slice(None), dtype=np.float64, compact=False
+        ):
+        """ grid together with the derivatives of the probabilities, see
+        probabilities_with_gradients
+
+        Parameters
+        ----------
+        cosZ: np.ndarray
+            cosine of the injection angles
+        initial_flavors: list or None
+            Optional: The flavor states oscillating from. Defaults to all
+        energies: slice
+            Optional: The part of the energy grid to evaluate
+        dtype: np.dtype
+            Optional: The precision the results are stored with
+        compact: bool
+            Optional: Skip the last final flavor
+
+        Returns
+        -------
+        oscillation_probs: np.ndarray
+            The oscillation probabilities with shape
+            (initial flavor, final flavor, cosZ, E)
+        oscillation_grads: np.ndarray
+            The derivatives with shape
+            (parameter, initial flavor, final flavor, cosZ, E)
+        """
+        return self.probabilities_with_gradients(
+            atmospheric_baselines(
+                np.atleast_1d(np.asarray(cosZ, dtype=np.float64))
+            ),
+            initial_flavors=initial_flavors, energies=energies,
+            dtype=dtype, compact=compact
+        )
+
+
+def _eigensystems(
+        e_grid: np.ndarray, mixing_angles: np.ndarray, mdiff: np.ndarray,
+        matter, anti, mass_states: int, workers, analytic: bool
+    ):
+    """ runs the serial or multi-threaded eigensystem kernel
+
+    Parameters
+    ----------
+    e_grid: np.ndarray
+        Energy of the oscillating neutrino
+    mixing_angles: np.ndarray
+        PMNS matrix
+    mdiff: np.ndarray
+        The mass squared differences
+    matter: np.ndarray or None
+        The effective matter potential
+    anti: int
+        +1 for neutrinos and -1 for anti neutrinos
+    mass_states: int
+        Number of mass states
+    workers: int or None
+        Number of threads
+    analytic: bool
+        Use the closed-form eigensystems
+
+    Returns
+    -------
+    Ueffective, Meffective: np.ndarray
+        The effective mixing and mass matrices
+    """
+    count_kernel("effective_eigensystems")
+    if workers == 1:
+        return effective_eigensystems(
+            e_grid, mixing_angles, mdiff, mass_states=mass_states,
+            matter=matter, anti=anti, analytic=analytic
+        )
+    with numba_threads(workers):
+        return effective_eigensystems_parallel(
+            e_grid, mixing_angles, mdiff, mass_states=mass_states,
+            matter=matter, anti=anti, analytic=analytic
+        )
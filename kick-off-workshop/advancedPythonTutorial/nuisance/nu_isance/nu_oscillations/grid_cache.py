@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+# grid_cache.py
+# Authors: Stephan Meighen-Berger
+# Content-addressed on-disk storage for pre-calculated oscillation grids
+
+# imports
+import os
+import hashlib
+import logging
+import numpy as np
+
+_log = logging.getLogger(__name__)
+
+# Bump this when the grid calculation changes to invalidate old entries
+_CACHE_VERSION = 2
+
+
+class GridCache(object):
+    """ content-addressed on-disk cache of oscillation grids. Every grid is
+    stored as a single .npy file named by the hash of its inputs, so it can
+    be memory-mapped on load. Least recently used entries are evicted once
+    the total size exceeds the given limit
+    """
+    def __init__(self, location: str, max_size: int):
+        """ initializes the GridCache object
+
+        Parameters
+        ----------
+        location: str
+            Folder the grids are stored in
+        max_size: int
+            Maximum total size of the stored grids in bytes
+        """
+        self._location = location
+        self._max_size = max_size
+        os.makedirs(self._location, exist_ok=True)
+
+    @staticmethod
+    def key(
+            e_grid: np.ndarray, cosZ: np.ndarray, mixing_angles: np.ndarray,
+            mdiff: np.ndarray, matter, anti: int, settings=None
+        ) -> str:
+        """ constructs the cache key for the given grid inputs
+
+        Parameters
+        ----------
+        e_grid: np.ndarray
+            Energy grid
+        cosZ: np.ndarray
+            cosine of the injection angles
+        mixing_angles: np.ndarray
+            PMNS matrix
+        mdiff: np.ndarray
+            The mass squared differences
+        matter: np.ndarray or None
+            The effective matter potential
+        anti: int
+            +1 for neutrinos and -1 for anti neutrinos
+        settings: dict
+            Optional: Further settings changing the grid values
+
+        Returns
+        -------
+        key: str
+            The hex digest identifying the grid
+        """
+        hasher = hashlib.sha256()
+        hasher.update(b"v%d" % _CACHE_VERSION)
+        for name, arr in [
+                ("energy", e_grid), ("angle", cosZ),
+                ("mixing", mixing_angles), ("mdiff", mdiff),
+                ("matter", matter)]:
+            hasher.update(name.encode())
+            if arr is None:
+                hasher.update(b"None")
+                continue
+            arr = np.ascontiguousarray(arr, dtype=np.float64)
+            hasher.update(str(arr.shape).encode())
+            hasher.update(arr.tobytes())
+        hasher.update(b"anti%d" % anti)
+        if settings:
+            hasher.update(repr(sorted(settings.items())).encode())
+        return hasher.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self._location, key + ".npy")
+
+    def load(self, key: str):
+        """ fetches a stored grid
+
+        Parameters
+        ----------
+        key: str
+            The grid key
+
+        Returns
+        -------
+        grid: np.memmap or None
+            The read-only memory-mapped grid or None if it is not stored
+        """
+        path = self._path(key)
+        if not os.path.isfile(path):
+            return None
+        # Marks the entry as recently used
+        os.utime(path)
+        return np.load(path, mmap_mode="r")
+
+    def store(self, key: str, grid: np.ndarray) -> None:
+        """ stores a grid and evicts old entries if required
+
+        Parameters
+        ----------
+        key: str
+            The grid key
+        grid: np.ndarray
+            The grid to store
+
+        Returns
+        -------
+        None
+        """
+        path = self._path(key)
+        # Writing to a temporary file first, so readers never see
+        # partial grids
+        tmp_path = path + ".%d.tmp" % os.getpid()
+        with open(tmp_path, "wb") as f:
+            np.save(f, grid)
+        os.replace(tmp_path, path)
+        self._evict(keep=path)
+
+    def _evict(self, keep: str) -> None:
+        """ removes the least recently used grids until the cache
+        fits into its maximum size
+        """
+        entries = []
+        for name in os.listdir(self._location):
+            if not name.endswith(".npy"):
+                continue
+            path = os.path.join(self._location, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(entry[1] for entry in entries)
+        for _, size, path in sorted(entries):
+            if total <= self._max_size:
+                break
+            if path == keep:
+                continue
+            _log.debug("Evicting cached grid %s", path)
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
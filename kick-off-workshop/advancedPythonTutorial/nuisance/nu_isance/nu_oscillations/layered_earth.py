@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+# layered_earth.py
+# Authors: Stephan Meighen-Berger
+# Oscillations through a layered Earth
+
+# imports
+import logging
+import numpy as np
+
+# module import
+from ..errors import UnphysicalError
+from ..utils import layered_eigensystems, layered_eigensystems_parallel
+from ..utils import layered_oscillation_grid
+from ..utils import layered_oscillation_grid_parallel
+from ..utils import layer_segments, layer_potentials, numba_threads
+from ..constants import mixing_angles as default_mixing_angles
+from ..constants import mdiff as default_mdiff
+from ..constants import earth_layers
+from ..instrumentation import count_kernel
+
+_log = logging.getLogger(__name__)
+
+
+class NuLayeredEarth(object):
+    """ per-energy eigensystems of each layer of an Earth model. These are
+    built once and shared by all injection angles crossing the layers
+    """
+    def __init__(
+            self, e_grid: np.ndarray, mixing_angles=None, mdiff=None,
+            layers=None, anti=1, mass_states=3, workers=1, analytic=False
+        ):
+        """ initializes the NuLayeredEarth object
+
+        Parameters
+        ----------
+        e_grid: np.ndarray
+            Energy of the oscillating neutrino
+        mixing_angles: np.ndarray
+            Optional: PMNS matrix. Defaults to the package constants
+        mdiff: np.ndarray
+            Optional: The mass squared differences. Defaults to the package
+            constants
+        layers: np.ndarray
+            Optional: The Earth model as rows of (outer radius in km,
+            density in g/cm^3, electron fraction), ordered from the
+            inside out. Defaults to the simplified PREM model
+        anti: int
+            Optional: +1 for neutrinos and -1 for anti neutrinos
+        mass_states: int
+            Optional: Number of mass states,
+            this should agree with the mixing matrix
+        workers: int or None
+            Optional: Number of threads to split the energies over.
+            None uses all available threads. The results do not depend
+            on this setting
+        analytic: bool
+            Optional: Use the closed-form eigensystems
+        """
+        if anti not in [1, -1]:
+            raise UnphysicalError(
+                "The parameters anti is set to %d." %anti +
+                " It has to be either 1 or -1!"
+            )
+        if mixing_angles is None:
+            mixing_angles = default_mixing_angles
+        if mdiff is None:
+            mdiff = default_mdiff
+        if layers is None:
+            layers = earth_layers
+        self._e_grid = np.asarray(e_grid, dtype=np.float64)
+        self._layers = np.asarray(layers, dtype=np.float64)
+        self._mass_states = mass_states
+        self._anti = anti
+        self._workers = workers
+        potentials = layer_potentials(self._layers, mass_states=mass_states)
+        _log.debug(
+            "Building %d effective eigensystems for %d layers",
+            len(self._e_grid), len(self._layers)
+        )
+        count_kernel("layered_eigensystems")
+        if self._workers == 1:
+            self._U, self._H = layered_eigensystems(
+                self._e_grid, mixing_angles, mdiff, potentials,
+                mass_states=mass_states, anti=anti, analytic=analytic
+            )
+        else:
+            with numba_threads(self._workers):
+                self._U, self._H = layered_eigensystems_parallel(
+                    self._e_grid, mixing_angles, mdiff, potentials,
+                    mass_states=mass_states, anti=anti, analytic=analytic
+                )
+
+    @property
+    def e_grid(self) -> np.ndarray:
+        """ the energy grid
+        """
+        return self._e_grid
+
+    @property
+    def anti(self) -> int:
+        """ +1 for neutrinos and -1 for anti neutrinos
+        """
+        return self._anti
+
+    @property
+    def layers(self) -> np.ndarray:
+        """ the Earth model
+        """
+        return self._layers
+
+    def grid(
+            self, cosZ: np.ndarray, initial_flavors=None,
+            energies=slice(None), dtype=np.float64, compact=False
+        ) -> np.ndarray:
+        """ oscillation probabilities for atmospheric neutrinos
+
+        Parameters
+        ----------
+        cosZ: np.ndarray
+            cosine of the injection angles
+        initial_flavors: list or None
+            Optional: The flavor states oscillating from. Defaults to all
+        energies: slice
+            Optional: The part of the energy grid to evaluate
+        dtype: np.dtype
+            Optional: The precision the results are stored with
+        compact: bool
+            Optional: Skip the last final flavor. It follows from
+            unitarity, see complete_flavors
+
+        Returns
+        -------
+        oscillation_probs: np.ndarray
+            The oscillation probabilities with shape
+            (initial flavor, final flavor, cosZ, E)
+        """
+        cosZ = np.atleast_1d(np.asarray(cosZ, dtype=np.float64))
+        seg_layers, seg_lengths = layer_segments(cosZ, self._layers[:, 0])
+        if initial_flavors is not None:
+            initial_flavors = np.asarray(initial_flavors, dtype=np.int64)
+        e_grid = self._e_grid[energies]
+        U = np.ascontiguousarray(self._U[:, energies])
+        H = np.ascontiguousarray(self._H[:, energies])
+        count_kernel("layered_oscillation_grid")
+        if self._workers == 1:
+            return layered_oscillation_grid(
+                e_grid, seg_layers, seg_lengths, U, H,
+                mass_states=self._mass_states,
+                initial_flavors=initial_flavors,
+                compact=compact, dtype=dtype
+            )
+        with numba_threads(self._workers):
+            return layered_oscillation_grid_parallel(
+                e_grid, seg_layers, seg_lengths, U, H,
+                mass_states=self._mass_states,
+                initial_flavors=initial_flavors,
+                compact=compact, dtype=dtype
+            )
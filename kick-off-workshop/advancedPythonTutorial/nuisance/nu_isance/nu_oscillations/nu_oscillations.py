@@ -4,144 +4,898 @@
 # Constructs the oscillation grids
 
 # imports
+import os
 import logging
 import numpy as np
-from tqdm import tqdm
 
 # module import
 from ..config import config
-from ..errors import UnphysicalError, NotImplementedError
-from ..utils import oscillation_calc_func
-from ..constants import mixing_angles, Vearth
+from ..instrumentation import Instrumentation
+from ..errors import UnphysicalError, UnknownModelError
+from ..errors import NotImplementedError
+from ..utils import atmospheric_baselines, complete_flavors
+from ..utils import last_flavor
+from ..utils import interpolation_nodes
+from ..constants import mixing_angles, mdiff, Vearth, earth_layers
+from .grid_cache import GridCache
+from .eigensystem import NuEigensystem
+from .layered_earth import NuLayeredEarth
+from .adaptive_grid import NuAdaptiveGrid
+from .parameter_scan import parameter_scan
 
 _log = logging.getLogger(__name__)
 
+_flavor_names = ["nu_e", "nu_mu", "nu_tau"]
+
 class NuOsc(object):
-    """ class containing and building neutrino oscillation grids
+    """ class containing and building neutrino oscillation grids.
+    The grids are only calculated once they are accessed. In compact mode
+    only two final flavors are stored and the grids returned by the
+    oscillation_prob and oscillation_grad properties are completed into new
+    arrays on every access, so a grid used repeatedly should be fetched once
     """
-    def __init__(self):
-        """ initializes the NuOsc object 
+    def __init__(self, conf=None, instrumentation=None):
+        """ initializes the NuOsc object
+
+        Parameters
+        ----------
+        conf: ConfigSnapshot or None
+            Optional: The settings to use, see ConfigClass.snapshot.
+            Defaults to a snapshot of the global config
+        instrumentation: Instrumentation or None
+            Optional: Records the time and memory spent in the stages of
+            the grid builds. Defaults to a new one set up from the config
         """
-        conf_pars = config["oscillation"]
-        # TODO: Add a switch here to save calculation time
-        if conf_pars['precalc']:
-            raise NotImplementedError(
-                "This options has not been implemented as of yet"
+        if conf is None:
+            conf = config.snapshot()
+        self._config = conf
+        if instrumentation is None:
+            instrumentation = Instrumentation(
+                reset_peak=conf["general"]["reset peak memory"]
             )
+        self._instrumentation = instrumentation
+        conf_pars = conf["oscillation"]
+        if conf_pars['matter']:
+            _log.info("Propagating through matter")
+            matter = Vearth
         else:
-            matter = 0
-            if conf_pars['matter']:
-                _log.info("Propagating through matter")
-                matter = Vearth
-            else:
-                _log.info("Propagating through vacuum")
-                matter is None
-            self._oscillation_grid_constructor(
-                conf_pars['energy grid'], conf_pars['angle grid'],
-                mixing_angles, matter, anti=1
+            _log.info("Propagating through vacuum")
+            matter = None
+        if conf_pars['earth model'] not in ['constant', 'layered']:
+            raise UnknownModelError(
+                "Unknown earth model %s!" % conf_pars['earth model'] +
+                " Use either 'constant' or 'layered'"
+            )
+        if conf_pars['eigensolver'] not in ['eigh', 'analytic']:
+            raise UnknownModelError(
+                "Unknown eigensolver %s!" % conf_pars['eigensolver'] +
+                " Use either 'eigh' or 'analytic'"
+            )
+        if conf_pars['smearing'] not in [None, 'gaussian', 'box']:
+            raise UnknownModelError(
+                "Unknown smearing %s!" % conf_pars['smearing'] +
+                " Use either None, 'gaussian' or 'box'"
+            )
+        if conf_pars['precision'] not in ['float64', 'float32']:
+            raise UnknownModelError(
+                "Unknown precision %s!" % conf_pars['precision'] +
+                " Use either 'float64' or 'float32'"
+            )
+        self._e_grid = np.array(conf_pars['energy grid'], dtype=np.float64)
+        self._cosZ = np.array(conf_pars['angle grid'], dtype=np.float64)
+        self._matter = matter
+        # The layered model replaces the constant potential
+        self._layered = (
+            conf_pars['matter'] and conf_pars['earth model'] == 'layered'
+        )
+        if conf_pars['earth layers'] is None:
+            self._layers = earth_layers
+        else:
+            self._layers = np.array(
+                conf_pars['earth layers'], dtype=np.float64
+            )
+        if self._layered:
+            _log.info("Using a layered Earth with %d layers", len(self._layers))
+            if conf_pars['smearing'] is not None:
+                raise NotImplementedError(
+                    "Smearing is not available for the layered Earth model"
+                )
+            if conf_pars['gradients']:
+                raise NotImplementedError(
+                    "Gradients are not available for the layered Earth model"
+                )
+        if conf_pars['smearing'] is None:
+            self._smearing = None
+        else:
+            _log.info(
+                "Averaging over a %s with a relative width of %g",
+                conf_pars['smearing'], conf_pars['smearing width']
+            )
+            self._smearing = conf_pars['smearing width']
+        self._box = conf_pars['smearing'] == 'box'
+        if conf_pars['gradients'] and self._smearing is not None:
+            raise NotImplementedError(
+                "Gradients are not available for smeared probabilities"
             )
+        self._with_gradients = conf_pars['gradients']
+        # Neutrinos and anti neutrinos are built together if requested
+        if conf_pars['anti neutrinos']:
+            self._antis = [1, -1]
+        else:
+            self._antis = [1]
+        self._workers = conf_pars['workers']
+        self._analytic = conf_pars['eigensolver'] == 'analytic'
+        self._precalc = conf_pars['precalc']
+        self._precalc_location = conf_pars['precalc location']
+        self._precalc_size = conf_pars['precalc size']
+        self._tile_size = conf_pars['tile size']
+        self._chunk_size = conf_pars['chunk size']
+        self._dtype = np.dtype(conf_pars['precision'])
+        self._compact = conf_pars['compact']
+        self._distances = None
+        self._eigensystems = {}
+        self._results = {1: [None, None, None], -1: [None, None, None]}
+        self._gradients = {1: [None, None, None], -1: [None, None, None]}
+        self._tiles = {}
+
+    @property
+    def config(self):
+        """ the settings of this object
+        """
+        return self._config
+
+    @property
+    def instrumentation(self) -> Instrumentation:
+        """ the time and memory spent in the stages of the grid builds
+        """
+        return self._instrumentation
+
+    @property
+    def e_grid(self) -> np.ndarray:
+        """ the energy grid
+        """
+        return self._e_grid
+
+    @property
+    def cosZ(self) -> np.ndarray:
+        """ the grid of the cosine of the injection angles
+        """
+        return self._cosZ
+
+    @property
+    def eigensystem(self):
+        """ the per-energy effective eigensystems of the neutrino grid.
+        These can be reused to calculate probabilities for other baselines.
+        For the layered Earth model this is a NuLayeredEarth
+        """
+        return self._eigensystem(1)
+
+    @property
+    def eigensystem_bar(self):
+        """ the per-energy effective eigensystems of the anti neutrino grid
+        """
+        return self._eigensystem(-1)
 
     @property
     def oscillation_prob_e(self) -> np.ndarray:
-        """ the oscillation probabilities of nu_e
+        """ the oscillation probabilities of nu_e. In compact mode each
+        access makes a new array
         """
-        return self._result_e
-    
+        return self._full_grid(0)
+
     @property
     def oscillation_prob_mu(self) -> np.ndarray:
-        """ the oscillation probabilities of nu_mu
+        """ the oscillation probabilities of nu_mu. In compact mode each
+        access makes a new array
         """
-        return self._result_mu
-    
+        return self._full_grid(1)
+
     @property
     def oscillation_prob_tau(self) -> np.ndarray:
-        """ the oscillation probabilities of nu_tau
+        """ the oscillation probabilities of nu_tau. In compact mode each
+        access makes a new array
         """
-        return self._result_tau
+        return self._full_grid(2)
 
-    def _oscillation_grid_constructor(
-            self,
-            e_grid: np.ndarray, cosZ: np.ndarray, mixing_angles: np.ndarray,
-            matter: np.ndarray, anti: int
-        )->np.ndarray:
-        """ constructs the oscillation grids (e, mu, tau)
+    @property
+    def oscillation_prob_e_bar(self) -> np.ndarray:
+        """ the oscillation probabilities of anti nu_e. In compact mode each
+        access makes a new array
+        """
+        return self._full_grid(0, anti=-1)
+
+    @property
+    def oscillation_prob_mu_bar(self) -> np.ndarray:
+        """ the oscillation probabilities of anti nu_mu. In compact mode each
+        access makes a new array
+        """
+        return self._full_grid(1, anti=-1)
+
+    @property
+    def oscillation_prob_tau_bar(self) -> np.ndarray:
+        """ the oscillation probabilities of anti nu_tau. In compact mode each
+        access makes a new array
+        """
+        return self._full_grid(2, anti=-1)
+
+    @property
+    def oscillation_grad_e(self) -> np.ndarray:
+        """ the derivatives of the oscillation probabilities of nu_e with
+        shape (parameter, final flavor, cosZ, E)
+        """
+        return self._full_gradient(0)
+
+    @property
+    def oscillation_grad_mu(self) -> np.ndarray:
+        """ the derivatives of the oscillation probabilities of nu_mu
+        """
+        return self._full_gradient(1)
+
+    @property
+    def oscillation_grad_tau(self) -> np.ndarray:
+        """ the derivatives of the oscillation probabilities of nu_tau
+        """
+        return self._full_gradient(2)
+
+    @property
+    def oscillation_grad_e_bar(self) -> np.ndarray:
+        """ the derivatives of the oscillation probabilities of anti nu_e
+        """
+        return self._full_gradient(0, anti=-1)
+
+    @property
+    def oscillation_grad_mu_bar(self) -> np.ndarray:
+        """ the derivatives of the oscillation probabilities of anti nu_mu
+        """
+        return self._full_gradient(1, anti=-1)
+
+    @property
+    def oscillation_grad_tau_bar(self) -> np.ndarray:
+        """ the derivatives of the oscillation probabilities of anti nu_tau
+        """
+        return self._full_gradient(2, anti=-1)
+
+    def oscillation_probs(self, anti=1) -> np.ndarray:
+        """ the grids of all initial flavors
+
+        Parameters
+        ----------
+        anti: int
+            Optional: +1 for neutrinos and -1 for anti neutrinos
+
+        Returns
+        -------
+        oscillation_probs: np.ndarray
+            The oscillation probabilities with shape
+            (initial flavor, final flavor, cosZ, E)
+        """
+        stored = [
+            self._flavor_grid(alpha, anti=anti)
+            for alpha in range(len(_flavor_names))
+        ]
+        with self._instrumentation.stage("copies"):
+            # Filled once, without completing each flavor separately
+            grids = np.empty(
+                (len(stored), len(_flavor_names)) + stored[0].shape[1:],
+                dtype=stored[0].dtype
+            )
+            for alpha, grid in enumerate(stored):
+                grids[alpha, :len(grid)] = grid
+            if self._compact:
+                grids[:, -1] = last_flavor(grids[:, :-1])
+            return grids
+
+    def oscillation_gradients(self, anti=1) -> np.ndarray:
+        """ the derivatives of the grids of all initial flavors with
+        respect to the oscillation parameters, ordered as in
+        constants.oscillation_parameters. The angles and the CP phase are
+        in degrees, the mass differences in eV^2
+
+        Parameters
+        ----------
+        anti: int
+            Optional: +1 for neutrinos and -1 for anti neutrinos
+
+        Returns
+        -------
+        oscillation_grads: np.ndarray
+            The derivatives with shape
+            (parameter, initial flavor, final flavor, cosZ, E)
+        """
+        grads = [
+            self._full_gradient(alpha, anti=anti)
+            for alpha in range(len(_flavor_names))
+        ]
+        with self._instrumentation.stage("copies"):
+            return np.stack(grads, axis=1)
+
+    def write_grid(self, filename: str, anti=1, chunk_size=None) -> np.memmap:
+        """ builds the full grid in chunks and writes each chunk straight
+        into a .npy file. Only a single chunk is held in memory, so this
+        can be used for grids that do not fit into memory. The grid is
+        stored with the configured precision and in compact mode without
+        nu_tau (see complete_flavors)
+
+        Parameters
+        ----------
+        filename: str
+            The file to write to
+        anti: int
+            Optional: +1 for neutrinos and -1 for anti neutrinos
+        chunk_size: list or None
+            Optional: Size (cosZ, E) of the chunks. Defaults to the config
+
+        Returns
+        -------
+        oscillation_probs: np.memmap
+            Read-only memory-mapped view of the grid with shape
+            (initial flavor, final flavor, cosZ, E), see open_grid
+        """
+        if chunk_size is None:
+            chunk_size = self._chunk_size
+        chunk_z, chunk_e = chunk_size
+        eigensystem = self._eigensystem(anti)
+        n_b = len(_flavor_names) - 1 if self._compact else len(_flavor_names)
+        n_z = len(self._cosZ)
+        n_e = len(self._e_grid)
+        _log.info(
+            "Writing the %d x %d grid to %s in chunks of %d x %d",
+            n_z, n_e, filename, chunk_z, chunk_e
+        )
+        # Writing to a temporary file first, so readers never see
+        # partial grids
+        tmp_path = filename + ".%d.tmp" % os.getpid()
+        itemsize = self._dtype.itemsize
+        with open(tmp_path, "wb") as f:
+            np.lib.format.write_array_header_1_0(f, {
+                "descr": np.lib.format.dtype_to_descr(self._dtype),
+                "fortran_order": False,
+                "shape": (len(_flavor_names), n_b, n_z, n_e),
+            })
+            offset = f.tell()
+            for start_z in range(0, n_z, chunk_z):
+                for start_e in range(0, n_e, chunk_e):
+                    with self._instrumentation.stage("grid fill"):
+                        chunk = eigensystem.grid(
+                            self._cosZ[start_z:start_z + chunk_z],
+                            energies=slice(start_e, start_e + chunk_e),
+                            dtype=self._dtype, compact=self._compact
+                        )
+                    # Each row of the chunk is contiguous in the file
+                    with self._instrumentation.stage("disk"):
+                        for idA, idB, idZ in np.ndindex(chunk.shape[:3]):
+                            row = (idA * n_b + idB) * n_z + start_z + idZ
+                            f.seek(offset + itemsize * (row * n_e + start_e))
+                            f.write(chunk[idA, idB, idZ].tobytes())
+        os.replace(tmp_path, filename)
+        _log.info("Done!")
+        return self.open_grid(filename)
+
+    @staticmethod
+    def open_grid(filename: str) -> np.memmap:
+        """ opens a grid written by write_grid. Nothing is read until
+        the entries are accessed
+
+        Parameters
+        ----------
+        filename: str
+            The grid file
+
+        Returns
+        -------
+        oscillation_probs: np.memmap
+            Read-only memory-mapped view of the grid with shape
+            (initial flavor, final flavor, cosZ, E)
+        """
+        return np.load(filename, mmap_mode="r")
+
+    def adaptive_grid(
+            self, tolerance=1e-3, anti=1, e_range=None, initial_points=65,
+            max_points=20000
+        ) -> NuAdaptiveGrid:
+        """ builds a grid with a non-uniform energy grid, refined until
+        linear interpolation in log(E) is accurate to the tolerance.
+        The angle grid and the propagation settings are the ones of
+        this object
+
+        Parameters
+        ----------
+        tolerance: float
+            Optional: The maximal absolute interpolation error
+        anti: int
+            Optional: +1 for neutrinos and -1 for anti neutrinos
+        e_range: list or None
+            Optional: The minimal and maximal energy. Defaults to the
+            range of the energy grid
+        initial_points: int
+            Optional: Number of log spaced energies to start with
+        max_points: int
+            Optional: Maximum number of energies
+
+        Returns
+        -------
+        adaptive_grid: NuAdaptiveGrid
+            The refined grid and its interpolator
+        """
+        if e_range is None:
+            e_range = [self._e_grid[0], self._e_grid[-1]]
+        return NuAdaptiveGrid(
+            lambda e_grid: self._build_eigensystem(e_grid, anti),
+            self._cosZ, e_range, tolerance=tolerance,
+            initial_points=initial_points, max_points=max_points
+        )
+
+    def scan(
+            self, points: np.ndarray, filename: str, anti=1, processes=1,
+            chunk_points=None
+        ) -> np.memmap:
+        """ builds the grids for many points in parameter space and streams
+        them to disk. The energy and angle grids, the baselines and the
+        matter model are the ones of this object and are shared between
+        all points
+
+        Parameters
+        ----------
+        points: np.ndarray
+            The scan points with shape (n, 6). Each point is
+            (theta12, theta13, theta23, delta_cp) in degrees and
+            (dm21, dm31) in eV^2
+        filename: str
+            The .npy file to write to
+        anti: int
+            Optional: +1 for neutrinos and -1 for anti neutrinos
+        processes: int
+            Optional: Number of processes. 1 runs in this process
+        chunk_points: int or None
+            Optional: Number of points sent to a process at once
+
+        Returns
+        -------
+        oscillation_probs: np.memmap
+            Read-only memory-mapped view of the grids with shape
+            (point, initial flavor, final flavor, cosZ, E). Compact grids
+            only hold the first two final flavors
+        """
+        if anti not in [1, -1]:
+            raise UnphysicalError(
+                "The parameters anti is set to %d." %anti +
+                " It has to be either 1 or -1!"
+            )
+        if self._distances is None and not self._layered:
+            self._distances = atmospheric_baselines(self._cosZ)
+        settings = {
+            "e_grid": self._e_grid,
+            "cosZ": self._cosZ,
+            "distances": self._distances,
+            "matter": self._matter,
+            "layered": self._layered,
+            "layers": self._layers,
+            "anti": anti,
+            "workers": self._workers,
+            "analytic": self._analytic,
+            "smearing": self._smearing,
+            "box": self._box,
+            "dtype": self._dtype,
+            "compact": self._compact,
+        }
+        return parameter_scan(
+            points, filename, settings, processes=processes,
+            chunk_points=chunk_points
+        )
+
+    def _build_eigensystem(self, e_grid: np.ndarray, anti: int):
+        """ builds the eigensystems for an energy grid
 
         Parameters
         ----------
         e_grid: np.ndarray
             Energy of the oscillating neutrino
-        zenith: float
-            injection angle in radians
-        mixing_angles: np.ndarray
-            PMNS matrix
-        matter: np.ndarray or None
-            Optional: The effective matter potential
         anti: int
-            Optional: +1 for neutrinos and -1 for anti neutrinos
+            +1 for neutrinos and -1 for anti neutrinos
+
+        Returns
+        -------
+        eigensystem: NuEigensystem or NuLayeredEarth
+            The per-energy effective eigensystems
+        """
+        if self._layered:
+            return NuLayeredEarth(
+                e_grid, mixing_angles, mdiff, layers=self._layers,
+                anti=anti, workers=self._workers, analytic=self._analytic
+            )
+        return NuEigensystem(
+            e_grid, mixing_angles, mdiff, matter=self._matter,
+            anti=anti, workers=self._workers, analytic=self._analytic,
+            smearing=self._smearing, box=self._box
+        )
+
+    def _eigensystem(self, anti: int):
+        """ fetches the eigensystems, building them on first access
+
+        Parameters
+        ----------
+        anti: int
+            +1 for neutrinos and -1 for anti neutrinos
 
         Returns
         -------
-        oscillation_probs: (np.ndarray, np.ndarray, np.ndarray)
-            The oscillation probabilities to the different SM flavor states
+        eigensystem: NuEigensystem or NuLayeredEarth
+            The per-energy effective eigensystems. NuLayeredEarth for
+            the layered Earth model
         """
         if anti not in [1, -1]:
             raise UnphysicalError(
                 "The parameters anti is set to %d." %anti +
                 " It has to be either 1 or -1!"
             )
+        if anti not in self._eigensystems:
+            with self._instrumentation.stage("eigensystems"):
+                self._eigensystems[anti] = self._build_eigensystem(
+                    self._e_grid, anti
+                )
+        return self._eigensystems[anti]
+
+    def prob(
+            self, alpha: int, beta: int, E: np.ndarray, cosZ: np.ndarray,
+            anti=1
+        ) -> np.ndarray:
+        """ oscillation probabilities at arbitrary points, interpolated
+        linearly in (log(E), cosZ) from the grid. Only the tiles of the grid
+        required for the interpolation are calculated. These are stored and
+        reused for later queries. Points outside of the grid are
+        set to the value of the closest edge
+
+        Parameters
+        ----------
+        alpha: int
+            Flavor state oscillating from
+        beta: int
+            Flavor state to oscillate to
+        E: np.ndarray
+            Energies of the oscillating neutrinos
+        cosZ: np.ndarray
+            cosine of the injection angles
+        anti: int
+            Optional: +1 for neutrinos and -1 for anti neutrinos
+
+        Returns
+        -------
+        oscillation_prob: np.ndarray
+            The oscillation probabilities with the broadcast shape
+            of E and cosZ
+        """
+        E, cosZ = np.broadcast_arrays(
+            np.asarray(E, dtype=np.float64), np.asarray(cosZ, dtype=np.float64)
+        )
+        lowE, upE, wE = interpolation_nodes(
+            np.log(self._e_grid), np.log(E)
+        )
+        lowZ, upZ, wZ = interpolation_nodes(self._cosZ, cosZ)
+        return (
+            (1 - wZ) * (1 - wE) *
+            self._grid_values(alpha, beta, lowZ, lowE, anti) +
+            (1 - wZ) * wE * self._grid_values(alpha, beta, lowZ, upE, anti) +
+            wZ * (1 - wE) * self._grid_values(alpha, beta, upZ, lowE, anti) +
+            wZ * wE * self._grid_values(alpha, beta, upZ, upE, anti)
+        )
+
+    def _grid_values(
+            self, alpha: int, beta: int, idZ: np.ndarray, idE: np.ndarray,
+            anti: int
+        ) -> np.ndarray:
+        """ fetches grid values, calculating the required tiles if needed
+
+        Parameters
+        ----------
+        alpha: int
+            Flavor state oscillating from
+        beta: int
+            Flavor state to oscillate to
+        idZ, idE: np.ndarray
+            Indices of the grid nodes
+        anti: int
+            +1 for neutrinos and -1 for anti neutrinos
+
+        Returns
+        -------
+        values: np.ndarray
+            The oscillation probabilities on the grid nodes
+        """
+        if self._results[anti][alpha] is not None or self._precalc:
+            return self._final_flavor(
+                self._flavor_grid(alpha, anti=anti)[:, idZ, idE], beta
+            )
+        tile_z, tile_e = self._tile_size
+        tiles_z = idZ // tile_z
+        tiles_e = idE // tile_e
+        values = np.empty(idZ.shape)
+        for tz, te in set(zip(tiles_z.ravel(), tiles_e.ravel())):
+            tile = self._tile(alpha, tz, te, anti)
+            mask = (tiles_z == tz) & (tiles_e == te)
+            values[mask] = self._final_flavor(
+                tile[:, idZ[mask] - tz * tile_z, idE[mask] - te * tile_e],
+                beta
+            )
+        return values
+
+    @staticmethod
+    def _final_flavor(probs: np.ndarray, beta: int) -> np.ndarray:
+        """ a single final flavor of a (possibly compact) grid
+
+        Parameters
+        ----------
+        probs: np.ndarray
+            The oscillation probabilities with the final flavor
+            as the first axis
+        beta: int
+            Flavor state to oscillate to
+
+        Returns
+        -------
+        values: np.ndarray
+            The oscillation probabilities of beta. Flavors missing from
+            compact grids are derived using unitarity
+        """
+        if beta < len(probs):
+            return probs[beta]
+        return complete_flavors(probs[np.newaxis])[0, beta]
+
+    def _tile(self, alpha: int, tz: int, te: int, anti: int) -> np.ndarray:
+        """ a single tile of the grid
+
+        Parameters
+        ----------
+        alpha: int
+            Flavor state oscillating from
+        tz, te: int
+            Position of the tile in (cosZ, E)
+        anti: int
+            +1 for neutrinos and -1 for anti neutrinos
+
+        Returns
+        -------
+        tile: np.ndarray
+            The oscillation probabilities with shape (final flavor, cosZ, E).
+            Compact tiles skip the last final flavor
+        """
+        key = (anti, alpha, tz, te)
+        if key not in self._tiles:
+            tile_z, tile_e = self._tile_size
+            _log.debug("Building tile %s", str(key))
+            eigensystem = self._eigensystem(anti)
+            with self._instrumentation.stage("grid fill"):
+                self._tiles[key] = eigensystem.grid(
+                    self._cosZ[tz * tile_z:(tz + 1) * tile_z],
+                    initial_flavors=[alpha],
+                    energies=slice(te * tile_e, (te + 1) * tile_e),
+                    dtype=self._dtype, compact=self._compact
+                )[0]
+        return self._tiles[key]
+
+    def _full_grid(self, alpha: int, anti=1) -> np.ndarray:
+        """ the grid of a single initial flavor including all final flavors
+
+        Parameters
+        ----------
+        alpha: int
+            Flavor state oscillating from
+        anti: int
+            Optional: +1 for neutrinos and -1 for anti neutrinos
+
+        Returns
+        -------
+        oscillation_probs: np.ndarray
+            The oscillation probabilities with shape (final flavor, cosZ, E).
+            In compact mode this is a new array with the completed grid,
+            otherwise the stored grid
+        """
+        oscillation_probs = self._flavor_grid(alpha, anti=anti)
+        if self._compact:
+            with self._instrumentation.stage("copies"):
+                return complete_flavors(oscillation_probs[np.newaxis])[0]
+        return oscillation_probs
+
+    def _full_gradient(self, alpha: int, anti=1) -> np.ndarray:
+        """ the derivatives of the grid of a single initial flavor
+        including all final flavors. In compact mode the derivatives of
+        the last final flavor follow from unitarity
+
+        Parameters
+        ----------
+        alpha: int
+            Flavor state oscillating from
+        anti: int
+            Optional: +1 for neutrinos and -1 for anti neutrinos
+
+        Returns
+        -------
+        oscillation_grads: np.ndarray
+            The derivatives with shape (parameter, final flavor, cosZ, E)
+        """
+        if self._layered:
+            raise NotImplementedError(
+                "Gradients are not available for the layered Earth model"
+            )
+        if self._gradients[anti][alpha] is None:
+            _log.info("Building the gradients")
+            missing = [
+                flavor for flavor in range(len(_flavor_names))
+                if self._gradients[anti][flavor] is None
+            ]
+            oscillation_probs = self._oscillation_grid_constructor(
+                initial_flavors=missing, antis=[anti], gradients=True
+            )
+            for idA, flavor in enumerate(missing):
+                if self._results[anti][flavor] is None:
+                    self._results[anti][flavor] = oscillation_probs[anti][idA]
+        oscillation_grads = self._gradients[anti][alpha]
+        if self._compact:
+            with self._instrumentation.stage("copies"):
+                return np.concatenate([
+                    oscillation_grads,
+                    -np.sum(oscillation_grads, axis=1, keepdims=True)
+                ], axis=1)
+        return oscillation_grads
+
+    def _flavor_grid(self, alpha: int, anti=1) -> np.ndarray:
+        """ the full grid of a single initial flavor, built on first access.
+        The grids of all initial flavors not built yet are filled together
+        in a single pass. If anti neutrinos are enabled in the config, the
+        neutrino and anti neutrino grids are built at the same time, in a
+        shared pass in vacuum only (see NuEigensystem.probabilities_both)
+
+        Parameters
+        ----------
+        alpha: int
+            Flavor state oscillating from
+        anti: int
+            Optional: +1 for neutrinos and -1 for anti neutrinos
+
+        Returns
+        -------
+        oscillation_probs: np.ndarray
+            The oscillation probabilities with shape (final flavor, cosZ, E)
+            as stored, i.e. without the last final flavor in compact mode
+        """
+        if self._results[anti][alpha] is not None:
+            return self._results[anti][alpha]
+        if anti in self._antis:
+            antis = self._antis
+        else:
+            antis = [anti]
+        if self._precalc:
+            cache = GridCache(self._precalc_location, self._precalc_size)
+            keys = {
+                anti_set: GridCache.key(
+                    self._e_grid, self._cosZ, mixing_angles, mdiff,
+                    self._layers if self._layered else self._matter,
+                    anti_set,
+                    settings={
+                        "analytic": self._analytic,
+                        "layered": self._layered,
+                        "precision": self._dtype.name,
+                        "compact": self._compact,
+                        "smearing": self._smearing,
+                        "box": self._box,
+                    }
+                )
+                for anti_set in antis
+            }
+            with self._instrumentation.stage("cache"):
+                oscillation_probs = {
+                    anti_set: cache.load(keys[anti_set])
+                    for anti_set in antis
+                }
+            missing = [
+                anti_set for anti_set in antis
+                if oscillation_probs[anti_set] is None
+            ]
+            if missing:
+                _log.info("No pre-calculated grid found")
+                oscillation_probs.update(
+                    self._oscillation_grid_constructor(antis=missing)
+                )
+                with self._instrumentation.stage("cache"):
+                    for anti_set in missing:
+                        cache.store(
+                            keys[anti_set], oscillation_probs[anti_set]
+                        )
+            for anti_set in antis:
+                if anti_set not in missing:
+                    _log.info(
+                        "Loading the pre-calculated grid %s", keys[anti_set]
+                    )
+                self._results[anti_set] = list(oscillation_probs[anti_set])
+        else:
+            missing = [
+                flavor for flavor in range(len(_flavor_names))
+                if self._results[anti][flavor] is None
+            ]
+            oscillation_probs = self._oscillation_grid_constructor(
+                initial_flavors=missing, antis=antis
+            )
+            for anti_set in antis:
+                for idA, flavor in enumerate(missing):
+                    if self._results[anti_set][flavor] is None:
+                        self._results[anti_set][flavor] = (
+                            oscillation_probs[anti_set][idA]
+                        )
+        # The tiles are no longer needed
+        self._tiles = {
+            key: tile for key, tile in self._tiles.items()
+            if self._results[key[0]][key[1]] is None
+        }
+        return self._results[anti][alpha]
+
+    def _oscillation_grid_constructor(
+            self, initial_flavors=None, antis=(1,), gradients=None
+        )->dict:
+        """ constructs the oscillation grids (e, mu, tau)
+
+        Parameters
+        ----------
+        initial_flavors: list or None
+            Optional: The flavor states oscillating from. Defaults to all
+        antis: list
+            Optional: +1 for neutrinos and -1 for anti neutrinos
+        gradients: bool or None
+            Optional: Also calculate the derivatives of the grids in the
+            same pass and store them. Defaults to the config
+
+        Returns
+        -------
+        oscillation_probs: dict
+            The oscillation probabilities for each entry of antis
+            with shape (initial flavor, final flavor, cosZ, E)
+        """
+        if initial_flavors is None:
+            initial_flavors = [0, 1, 2]
+        if gradients is None:
+            gradients = self._with_gradients
         _log.info("Building the oscillation grids")
-        _log.info("Using %d as the anti setting" %anti)
-        _log.info("For nu_e...")
-        probs_1_tmp = []
-        probs_2_tmp = []
-        probs_3_tmp = []
-        for zenith in tqdm(np.arccos(cosZ)):
-            probs_1, probs_2, probs_3 = oscillation_calc_func(
-                0, e_grid, zenith, mixing_angles, mass_states=3,
-                matter=matter, anti=anti
-            )
-            probs_1_tmp.append(probs_1)
-            probs_2_tmp.append(probs_2)
-            probs_3_tmp.append(probs_3)
-        probs_1_tmp = np.array(probs_1_tmp)
-        probs_2_tmp = np.array(probs_2_tmp)
-        probs_3_tmp = np.array(probs_3_tmp)
-        self._result_e = (probs_1_tmp, probs_2_tmp, probs_3_tmp)
-        self._result_e = np.copy(self._result_e)
-        _log.info("Done!")
-        _log.info("For nu_mu...")
-        probs_1_tmp = []
-        probs_2_tmp = []
-        probs_3_tmp = []
-        for zenith in tqdm(np.arccos(cosZ)):
-            probs_1, probs_2, probs_3 = oscillation_calc_func(
-                1, e_grid, zenith, mixing_angles, mass_states=3,
-                matter=matter, anti=anti
-            )
-            probs_1_tmp.append(probs_1)
-            probs_2_tmp.append(probs_2)
-            probs_3_tmp.append(probs_3)
-        probs_1_tmp = np.array(probs_1_tmp)
-        probs_2_tmp = np.array(probs_2_tmp)
-        probs_3_tmp = np.array(probs_3_tmp)
-        self._result_mu = (probs_1_tmp, probs_2_tmp, probs_3_tmp)
-        self._result_mu = np.copy(self._result_mu)
-        _log.info("Done!")
-        _log.info("For nu_tau...")
-        probs_1_tmp = []
-        probs_2_tmp = []
-        probs_3_tmp = []
-        for zenith in tqdm(np.arccos(cosZ)):
-            probs_1, probs_2, probs_3 = oscillation_calc_func(
-                2, e_grid, zenith, mixing_angles, mass_states=3,
-                matter=matter, anti=anti
-            )
-            probs_1_tmp.append(probs_1)
-            probs_2_tmp.append(probs_2)
-            probs_3_tmp.append(probs_3)
-        probs_1_tmp = np.array(probs_1_tmp)
-        probs_2_tmp = np.array(probs_2_tmp)
-        probs_3_tmp = np.array(probs_3_tmp)
-        self._result_tau = (probs_1_tmp, probs_2_tmp, probs_3_tmp)
-        self._result_tau = np.copy(self._result_tau)
+        _log.info("Using %s as the anti setting" % str(list(antis)))
+        _log.info("For %s..." % ", ".join(
+            _flavor_names[alpha] for alpha in initial_flavors
+        ))
+        eigensystems = {anti: self._eigensystem(anti) for anti in antis}
+        # The baselines are shared between all grids
+        if self._distances is None and not self._layered:
+            self._distances = atmospheric_baselines(self._cosZ)
+        with self._instrumentation.stage("grid fill"):
+            if self._layered:
+                oscillation_probs = {
+                    anti: eigensystems[anti].grid(
+                        self._cosZ, initial_flavors=initial_flavors,
+                        dtype=self._dtype, compact=self._compact
+                    )
+                    for anti in antis
+                }
+            elif gradients:
+                oscillation_probs = {}
+                for anti in antis:
+                    oscillation_probs[anti], oscillation_grads = (
+                        eigensystems[anti].probabilities_with_gradients(
+                            self._distances, initial_flavors=initial_flavors,
+                            dtype=self._dtype, compact=self._compact
+                        )
+                    )
+                    for idA, alpha in enumerate(initial_flavors):
+                        self._gradients[anti][alpha] = oscillation_grads[:, idA]
+            elif sorted(antis) == [-1, 1]:
+                # A shared pass in vacuum, one after the other in matter
+                probs, probs_bar = NuEigensystem.probabilities_both(
+                    eigensystems[1], eigensystems[-1], self._distances,
+                    initial_flavors=initial_flavors,
+                    dtype=self._dtype, compact=self._compact
+                )
+                oscillation_probs = {1: probs, -1: probs_bar}
+            else:
+                oscillation_probs = {
+                    anti: eigensystems[anti].probabilities(
+                        self._distances, initial_flavors=initial_flavors,
+                        dtype=self._dtype, compact=self._compact
+                    )
+                    for anti in antis
+                }
         _log.info("Done!")
+        return oscillation_probs
@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+# parameter_scan.py
+# Authors: Stephan Meighen-Berger
+# Oscillation grids for many points in parameter space
+
+# imports
+import os
+import logging
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# module import
+from ..constants import eV2GeV
+from ..constants import mdiff as default_mdiff
+from ..constants import oscillation_parameters
+from .eigensystem import NuEigensystem
+from .layered_earth import NuLayeredEarth
+
+_log = logging.getLogger(__name__)
+
+# Settings shared by all points, set once per worker process
+_settings = {}
+
+
+def point_parameters(point: np.ndarray):
+    """ converts a scan point to the parameters of the package
+
+    Parameters
+    ----------
+    point: np.ndarray
+        (theta12, theta13, theta23, delta_cp) in degrees and
+        (dm21, dm31) in eV^2, with dm31 = m3^2 - m1^2
+
+    Returns
+    -------
+    mixing_angles: np.ndarray
+        The mixing angles as in constants.mixing_angles
+    mdiff: np.ndarray
+        The mass parameters as in constants.mdiff
+    """
+    theta12, theta13, theta23, delta_cp, dm21, dm31 = point
+    mixing_angles = np.array([
+        [1, 2, theta12, 0.],
+        [1, 3, theta13, delta_cp],
+        [2, 3, theta23, 0.],
+    ])
+    mdiff = np.array([default_mdiff[0], dm21 * eV2GeV**2, dm31 * eV2GeV**2])
+    return mixing_angles, mdiff
+
+
+def _set_settings(settings: dict) -> None:
+    """ stores the shared settings in a worker process
+    """
+    _settings.clear()
+    _settings.update(settings)
+
+
+def _scan_chunk(start: int, points: np.ndarray):
+    """ builds the grids for a chunk of scan points
+
+    Parameters
+    ----------
+    start: int
+        Index of the first point
+    points: np.ndarray
+        The scan points
+
+    Returns
+    -------
+    start: int
+        Index of the first point
+    oscillation_probs: np.ndarray
+        The grids with shape (point, initial flavor, final flavor, cosZ, E)
+    """
+    grids = []
+    for point in points:
+        mixing_angles, mdiff = point_parameters(point)
+        if _settings["layered"]:
+            system = NuLayeredEarth(
+                _settings["e_grid"], mixing_angles, mdiff,
+                layers=_settings["layers"], anti=_settings["anti"],
+                workers=_settings["workers"], analytic=_settings["analytic"]
+            )
+            grids.append(system.grid(
+                _settings["cosZ"], dtype=_settings["dtype"],
+                compact=_settings["compact"]
+            ))
+        else:
+            system = NuEigensystem(
+                _settings["e_grid"], mixing_angles, mdiff,
+                matter=_settings["matter"], anti=_settings["anti"],
+                workers=_settings["workers"], analytic=_settings["analytic"],
+                smearing=_settings["smearing"], box=_settings["box"]
+            )
+            grids.append(system.probabilities(
+                _settings["distances"], dtype=_settings["dtype"],
+                compact=_settings["compact"]
+            ))
+    return start, np.array(grids)
+
+
+def parameter_scan(
+        points: np.ndarray, filename: str, settings: dict, processes=1,
+        chunk_points=None
+    ) -> np.memmap:
+    """ builds the oscillation grids for many parameter points and streams
+    them into a .npy file. The energy grid, baselines and matter model
+    are shared by all points. The points are split into chunks, which are
+    spread over a process pool and written as soon as they are done
+
+    Parameters
+    ----------
+    points: np.ndarray
+        The scan points with shape (n, 6), see point_parameters
+    filename: str
+        The file to write to
+    settings: dict
+        The shared settings, see NuOsc.scan
+    processes: int
+        Optional: Number of processes. 1 runs in this process
+    chunk_points: int or None
+        Optional: Number of points per task. Defaults to splitting the
+        points into four tasks per process
+
+    Returns
+    -------
+    oscillation_probs: np.memmap
+        Read-only memory-mapped view of the grids with shape
+        (point, initial flavor, final flavor, cosZ, E)
+    """
+    points = np.atleast_2d(np.asarray(points, dtype=np.float64))
+    if points.shape[1] != len(oscillation_parameters):
+        raise ValueError(
+            "The scan points need the parameters %s" %
+            ", ".join(oscillation_parameters)
+        )
+    if chunk_points is None:
+        chunk_points = max(int(np.ceil(len(points) / (4 * processes))), 1)
+    n_b = 2 if settings["compact"] else 3
+    shape = (
+        len(points), 3, n_b, len(settings["cosZ"]), len(settings["e_grid"])
+    )
+    point_size = int(np.prod(shape[1:])) * np.dtype(settings["dtype"]).itemsize
+    _log.info(
+        "Scanning %d points in chunks of %d with %d processes",
+        len(points), chunk_points, processes
+    )
+    # Writing to a temporary file first, so readers never see
+    # partial scans
+    tmp_path = filename + ".%d.tmp" % os.getpid()
+    with open(tmp_path, "wb") as f:
+        np.lib.format.write_array_header_1_0(f, {
+            "descr": np.lib.format.dtype_to_descr(np.dtype(settings["dtype"])),
+            "fortran_order": False,
+            "shape": shape,
+        })
+        offset = f.tell()
+
+        def write(start, grids):
+            f.seek(offset + start * point_size)
+            f.write(np.ascontiguousarray(grids).tobytes())
+
+        chunks = [
+            (start, points[start:start + chunk_points])
+            for start in range(0, len(points), chunk_points)
+        ]
+        if processes == 1:
+            _set_settings(settings)
+            for start, chunk in chunks:
+                write(*_scan_chunk(start, chunk))
+        else:
+            with ProcessPoolExecutor(
+                    max_workers=processes, initializer=_set_settings,
+                    initargs=(settings,)
+                ) as pool:
+                futures = [
+                    pool.submit(_scan_chunk, start, chunk)
+                    for start, chunk in chunks
+                ]
+                for future in as_completed(futures):
+                    write(*future.result())
+    os.replace(tmp_path, filename)
+    return np.load(filename, mmap_mode="r")
@@ -1,2 +1,20 @@
 from .oscillations import oscillation_calc_func
-from .oscillations import oscillation_calc_func_effective, effective_matrices
\ No newline at end of file
+from .oscillations import oscillation_calc_func_effective, effective_matrices
+from .oscillations import atmospheric_baseline, atmospheric_baselines
+from .oscillations import effective_eigensystems, oscillation_grid
+from .oscillations import oscillation_grid_effective, smearing_widths
+from .oscillations import effective_eigensystems_parallel
+from .oscillations import oscillation_grid_effective_parallel
+from .oscillations import oscillation_grid_effective_both
+from .oscillations import oscillation_grid_effective_both_parallel
+from .parallel import numba_threads, resolve_workers
+from .oscillations import event_oscillation_probs
+from .earth_model import layer_segments, layer_potentials
+from .earth_model import layered_eigensystems, layered_eigensystems_parallel
+from .earth_model import layered_oscillation_grid
+from .earth_model import layered_oscillation_grid_parallel
+from .storage import complete_flavors, last_flavor
+from .interpolation import interpolation_nodes
+from .gradients import effective_gradients, effective_gradients_parallel
+from .gradients import oscillation_grid_gradients
+from .gradients import oscillation_grid_gradients_parallel
@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+# earth_model.py
+# Authors: Stephan Meighen-Berger
+# Propagation through a layered Earth
+
+# imports
+import numpy as np
+from numba import njit, prange
+
+# module imports
+from nu_isance.constants import m2GeV, rEarth, matter_pot_density
+from .oscillations import buildmixingmatrix, buildmassmatrix
+from .oscillations import vacuum_hamiltonian, hermitian_eigh3
+from .oscillations import atmospheric_baseline
+from .parallel import parallel_variant
+
+
+@njit(cache=True)
+def layer_segments(cosZ: np.ndarray, layer_radii: np.ndarray):
+    """ splits the path of each injection angle into segments of constant
+    density. The path starts in the atmosphere (vacuum) and crosses the
+    layers from the outside in and back out
+
+    Parameters
+    ----------
+    cosZ: np.ndarray
+        cosine of the injection angles
+    layer_radii: np.ndarray
+        Outer radii of the layers in km, in ascending order. The last one
+        should be the radius of the Earth
+
+    Returns
+    -------
+    seg_layers: np.ndarray
+        Layer of each segment with shape (len(cosZ), 2 * len(layer_radii)).
+        -1 marks the atmosphere and -2 unused segments
+    seg_lengths: np.ndarray
+        The lengths of the segments in km
+    """
+    n_z = len(cosZ)
+    n_layers = len(layer_radii)
+    seg_layers = np.full((n_z, 2 * n_layers), -2, dtype=np.int64)
+    seg_lengths = np.zeros((n_z, 2 * n_layers))
+    for idZ in range(n_z):
+        total = atmospheric_baseline(np.arccos(cosZ[idZ]))
+        if cosZ[idZ] >= 0.:
+            seg_layers[idZ, 0] = -1
+            seg_lengths[idZ, 0] = total
+            continue
+        # Impact parameter and half chords of the layers
+        impact = rEarth * np.sqrt(1. - cosZ[idZ]**2)
+        half_chords = np.zeros(n_layers)
+        for k in range(n_layers):
+            if layer_radii[k] > impact:
+                half_chords[k] = np.sqrt(layer_radii[k]**2 - impact**2)
+        seg_layers[idZ, 0] = -1
+        seg_lengths[idZ, 0] = max(total - 2. * half_chords[-1], 0.)
+        # Innermost layer crossed
+        inner = 0
+        while inner < n_layers - 1 and half_chords[inner] == 0.:
+            inner += 1
+        idS = 1
+        for k in range(n_layers - 1, inner, -1):
+            seg_layers[idZ, idS] = k
+            seg_lengths[idZ, idS] = half_chords[k] - half_chords[k - 1]
+            idS += 1
+        seg_layers[idZ, idS] = inner
+        seg_lengths[idZ, idS] = 2. * half_chords[inner]
+        idS += 1
+        for k in range(inner + 1, n_layers):
+            seg_layers[idZ, idS] = k
+            seg_lengths[idZ, idS] = half_chords[k] - half_chords[k - 1]
+            idS += 1
+    return seg_layers, seg_lengths
+
+@njit(cache=True)
+def layered_eigensystems(
+        e_grid: np.ndarray, mixing_angles: np.ndarray, mdiff: np.ndarray,
+        potentials: np.ndarray, mass_states=3, anti=1, analytic=False
+    ):
+    """ eigensystems of the hamiltonian in each layer for each energy. These
+    are shared by all injection angles crossing the layer
+
+    Parameters
+    ----------
+    e_grid: np.ndarray
+        Energy of the oscillating neutrino
+    mixing_angles: np.ndarray
+        PMNS matrix
+    mdiff: np.ndarray
+        The mass squared differences
+    potentials: np.ndarray
+        The effective matter potential of each layer
+    mass_states: int
+        Optional: Number of mass states,
+        this should agree with the mixing matrix
+    anti: int
+        Optional: +1 for neutrinos and -1 for anti neutrinos
+    analytic: bool
+        Optional: Use the closed-form solution (hermitian_eigh3) instead
+        of a general hermitian eigensolver. Only used for three mass states
+
+    Returns
+    -------
+    Ulayers: np.ndarray
+        The eigenvectors with shape
+        (len(potentials) + 1, len(e_grid), mass_states, mass_states).
+        The first entry is the vacuum
+    Hlayers: np.ndarray
+        The (signed) eigenvalues with shape
+        (len(potentials) + 1, len(e_grid), mass_states)
+    """
+    n_e = len(e_grid)
+    n_layers = len(potentials)
+    Ulayers = np.empty(
+        (n_layers + 1, n_e, mass_states, mass_states), dtype=np.complex128
+    )
+    Hlayers = np.empty((n_layers + 1, n_e, mass_states))
+    mixing_matrix = buildmixingmatrix(mixing_angles, anti=anti)
+    mass_matrix = buildmassmatrix(mdiff)
+    vacuum_h = vacuum_hamiltonian(mixing_angles, mdiff, anti=anti)
+    for idE in prange(n_e):
+        Ulayers[0, idE] = mixing_matrix
+        for j in range(mass_states):
+            Hlayers[0, idE, j] = mass_matrix[j, j]
+        for k in range(n_layers):
+            effective_h = (
+                vacuum_h +
+                anti * (potentials[k].astype(np.complex128) * e_grid[idE])
+            )
+            if analytic and mass_states == 3:
+                H, U = hermitian_eigh3(effective_h)
+            else:
+                H, U = np.linalg.eigh(effective_h)
+            Ulayers[k + 1, idE] = U
+            Hlayers[k + 1, idE] = H
+    return Ulayers, Hlayers
+
+@njit(cache=True)
+def layered_oscillation_grid(
+        e_grid: np.ndarray, seg_layers: np.ndarray, seg_lengths: np.ndarray,
+        Ulayers: np.ndarray, Hlayers: np.ndarray, mass_states=3,
+        initial_flavors=None, compact=False, dtype=np.float64
+    ) -> np.ndarray:
+    """ oscillation probabilities through a layered medium. The amplitude
+    is the product of the evolution operators of the crossed segments.
+    Each operator is built from the cached eigensystem of its layer, so
+    only the phases depend on the injection angle
+
+    Parameters
+    ----------
+    e_grid: np.ndarray
+        Energy of the oscillating neutrino
+    seg_layers, seg_lengths: np.ndarray
+        The path segments, see layer_segments
+    Ulayers, Hlayers: np.ndarray
+        The layer eigensystems, see layered_eigensystems
+    mass_states: int
+        Optional: Number of mass states,
+        this should agree with the mixing matrix
+    initial_flavors: np.ndarray or None
+        Optional: The flavor states oscillating from. Defaults to all
+    compact: bool
+        Optional: Skip the last final flavor
+    dtype: np.dtype
+        Optional: The precision the results are stored with
+
+    Returns
+    -------
+    oscillation_probs: np.ndarray
+        The oscillation probabilities with shape
+        (len(initial_flavors), mass_states, len(seg_layers), len(e_grid))
+    """
+    if initial_flavors is None:
+        alphas = np.arange(mass_states)
+    else:
+        alphas = np.asarray(initial_flavors)
+    n_a = len(alphas)
+    n_e = len(e_grid)
+    n_z, n_seg = seg_layers.shape
+    if compact:
+        n_b = mass_states - 1
+    else:
+        n_b = mass_states
+    probs = np.empty((n_a, n_b, n_z, n_e), dtype=dtype)
+    for idE in prange(n_e):
+        E = e_grid[idE]
+        amplitude = np.empty((mass_states, mass_states), dtype=np.complex128)
+        segment = np.empty((mass_states, mass_states), dtype=np.complex128)
+        phases = np.empty(mass_states, dtype=np.complex128)
+        for idZ in range(n_z):
+            amplitude[:, :] = np.eye(mass_states)
+            for idS in range(n_seg):
+                layer = seg_layers[idZ, idS]
+                if layer < -1:
+                    continue
+                U = Ulayers[layer + 1, idE]
+                l_tmp = seg_lengths[idZ, idS] * 1e3 * m2GeV
+                for j in range(mass_states):
+                    phases[j] = np.exp(
+                        -1j * Hlayers[layer + 1, idE, j] * l_tmp / (2. * E)
+                    )
+                # U exp(-i H L / 2E) U^dagger
+                for a in range(mass_states):
+                    for b in range(mass_states):
+                        tmp = 0j
+                        for j in range(mass_states):
+                            tmp += U[a, j] * phases[j] * np.conj(U[b, j])
+                        segment[a, b] = tmp
+                amplitude = segment @ amplitude
+            for idA in range(n_a):
+                for beta in range(n_b):
+                    probs[idA, beta, idZ, idE] = (
+                        np.abs(amplitude[beta, alphas[idA]])**2
+                    )
+    return probs
+
+layered_eigensystems_parallel = parallel_variant(
+    layered_eigensystems
+)
+layered_oscillation_grid_parallel = parallel_variant(
+    layered_oscillation_grid
+)
+
+def layer_potentials(layers: np.ndarray, mass_states=3) -> np.ndarray:
+    """ effective matter potentials of an Earth model
+
+    Parameters
+    ----------
+    layers: np.ndarray
+        The layers as rows of (outer radius in km, density in g/cm^3,
+        electron fraction)
+    mass_states: int
+        Optional: Number of mass states
+
+    Returns
+    -------
+    potentials: np.ndarray
+        The effective potentials with shape
+        (len(layers), mass_states, mass_states)
+    """
+    potentials = np.zeros((len(layers), mass_states, mass_states))
+    potentials[:, 0, 0] = matter_pot_density * layers[:, 1] * layers[:, 2]
+    return potentials
@@ -0,0 +1,358 @@
+# -*- coding: utf-8 -*-
+# gradients.py
+# Authors: Stephan Meighen-Berger
+# Derivatives of the oscillation probabilities with respect to the
+# oscillation parameters
+
+# imports
+import numpy as np
+from numba import njit, prange
+
+# module imports
+from nu_isance.constants import m2GeV, eV2GeV
+from .oscillations import buildmixingmatrix, buildmassmatrix, rotmatrix
+from .oscillations import vacuum_hamiltonian, l_osc
+from .parallel import parallel_variant
+
+# The derivatives are taken with respect to the angles of the rows of
+# mixing_angles, the CP phase of the row cp_row (all in degrees) and the
+# mass differences mdiff[1:] in eV^2. For the package constants this is
+# (theta12, theta13, theta23, delta_cp, dm21, dm31)
+
+
+@njit(cache=True)
+def rotmatrix_gradients(
+        dim: int, i: int, j: int, ang: float, cp: float
+    ):
+    """ derivatives of rotmatrix with respect to the angle and the phase
+
+    Parameters
+    ----------
+    dim: int
+        Dimensions of the matrix
+    i,j: int
+        Positions of the matrix
+    ang: float
+        Angle of roration in radians
+    cp: float
+        CP violating phase
+
+    Returns
+    -------
+    dang, dcp: np.ndarray
+        The derivatives with respect to ang and cp
+    """
+    dang = np.zeros((int(dim), int(dim)), dtype=np.complex128)
+    dcp = np.zeros((int(dim), int(dim)), dtype=np.complex128)
+    dang[i, i] = dang[j, j] = -np.sin(ang)
+    dang[i, j] = np.cos(ang) * np.exp(-1j * cp)
+    dang[j, i] = -np.cos(ang) * np.exp(1j * cp)
+    dcp[i, j] = -1j * np.sin(ang) * np.exp(-1j * cp)
+    dcp[j, i] = -1j * np.sin(ang) * np.exp(1j * cp)
+    return dang, dcp
+
+@njit(cache=True)
+def hamiltonian_gradients(
+        mixing_angles: np.ndarray, mdiff: np.ndarray, anti=1, cp_row=1
+    ) -> np.ndarray:
+    """ derivatives of vacuum_hamiltonian with respect to the oscillation
+    parameters. These do not depend on the energy or the matter potential
+
+    Parameters
+    ----------
+    mixing_angles: np.ndarray
+        PMNS matrix
+    mdiff: np.ndarray
+        The mass squared differences
+    anti: int
+        Optional: +1 for neutrinos and -1 for anti neutrinos
+    cp_row: int
+        Optional: The row of mixing_angles holding the CP phase
+
+    Returns
+    -------
+    dvacuum_h: np.ndarray
+        The derivatives with shape
+        (len(mixing_angles) + len(mdiff), dim, dim). The angles and the
+        phase are in degrees, the mass differences in eV^2
+    """
+    n_rows = len(mixing_angles)
+    dim = int(max(np.array([par[1] for par in mixing_angles])))
+    n_par = n_rows + len(mdiff)
+    mixing_matrix = buildmixingmatrix(mixing_angles, anti=anti)
+    mass_matrix = buildmassmatrix(mdiff).astype(np.complex128)
+    rotations = np.empty((n_rows, dim, dim), dtype=np.complex128)
+    for r in range(n_rows):
+        par = mixing_angles[r]
+        rotations[r] = rotmatrix(
+            dim, int(par[0] - 1), int(par[1] - 1), np.deg2rad(par[2]),
+            anti * np.deg2rad(par[3])
+        )
+    # The mixing matrix is R_{n-1} ... R_0. Products of the rotations
+    # applied before (after) row r
+    before = np.empty((n_rows + 1, dim, dim), dtype=np.complex128)
+    after = np.empty((n_rows + 1, dim, dim), dtype=np.complex128)
+    before[0] = np.eye(dim, dtype=np.complex128)
+    after[n_rows] = np.eye(dim, dtype=np.complex128)
+    for r in range(n_rows):
+        before[r + 1] = rotations[r] @ before[r]
+        after[n_rows - r - 1] = after[n_rows - r] @ rotations[n_rows - r - 1]
+    dmixing = np.zeros((n_par, dim, dim), dtype=np.complex128)
+    for r in range(n_rows):
+        par = mixing_angles[r]
+        dang, dcp = rotmatrix_gradients(
+            dim, int(par[0] - 1), int(par[1] - 1), np.deg2rad(par[2]),
+            anti * np.deg2rad(par[3])
+        )
+        dmixing[r] = (
+            after[r + 1] @ dang @ before[r] * np.pi / 180.
+        )
+        if r == cp_row:
+            dmixing[n_rows] = (
+                after[r + 1] @ dcp @ before[r] * anti * np.pi / 180.
+            )
+    dvacuum_h = np.empty((n_par, dim, dim), dtype=np.complex128)
+    for p in range(n_rows + 1):
+        dvacuum_h[p] = (
+            dmixing[p] @ mass_matrix @ mixing_matrix.conj().T +
+            mixing_matrix @ mass_matrix @ dmixing[p].conj().T
+        )
+    for m in range(1, len(mdiff)):
+        dmass = np.zeros((dim, dim), dtype=np.complex128)
+        dmass[m, m] = eV2GeV**2
+        dvacuum_h[n_rows + m] = (
+            mixing_matrix @ dmass @ mixing_matrix.conj().T
+        )
+    return dvacuum_h
+
+@njit(cache=True)
+def effective_gradients(
+        e_grid: np.ndarray, mixing_angles: np.ndarray, mdiff: np.ndarray,
+        Ueffective: np.ndarray, Meffective: np.ndarray, mass_states=3,
+        matter=None, anti=1, cp_row=1
+    ):
+    """ derivatives of the effective eigensystems from
+    effective_eigensystems. The eigenvalues and eigenvectors follow
+    from first order perturbation theory of the effective hamiltonian,
+    whose derivatives are those of the vacuum hamiltonian
+
+    Parameters
+    ----------
+    e_grid: np.ndarray
+        Energy of the oscillating neutrino
+    mixing_angles: np.ndarray
+        PMNS matrix
+    mdiff: np.ndarray
+        The mass squared differences
+    Ueffective: np.ndarray
+        Effective PMNS matrices, one per energy
+    Meffective: np.ndarray
+        Effective mass matrices, one per energy
+    mass_states: int
+        Optional: Number of mass states,
+        this should agree with the mixing matrix
+    matter: np.ndarray or None
+        Optional: The effective matter potential
+    anti: int
+        Optional: +1 for neutrinos and -1 for anti neutrinos
+    cp_row: int
+        Optional: The row of mixing_angles holding the CP phase
+
+    Returns
+    -------
+    dUeffective: np.ndarray
+        The derivatives of the effective mixing matrices with shape
+        (len(e_grid), parameter, mass_states, mass_states)
+    dMeffective: np.ndarray
+        The derivatives of the diagonal of the effective mass matrices
+        with shape (len(e_grid), parameter, mass_states)
+    """
+    n_e = len(e_grid)
+    vacuum_h = vacuum_hamiltonian(mixing_angles, mdiff, anti=anti)
+    dvacuum_h = hamiltonian_gradients(
+        mixing_angles, mdiff, anti=anti, cp_row=cp_row
+    )
+    n_par = len(dvacuum_h)
+    dUeffective = np.zeros(
+        (n_e, n_par, mass_states, mass_states), dtype=np.complex128
+    )
+    dMeffective = np.zeros((n_e, n_par, mass_states))
+    for idE in prange(n_e):
+        U = Ueffective[idE]
+        if matter is None:
+            effective_h = vacuum_h
+        else:
+            effective_h = (
+                vacuum_h + anti * (matter.astype(np.complex128) * e_grid[idE])
+            )
+        # The (signed) eigenvalues
+        eigenvalues = np.real(np.diag(U.conj().T @ effective_h @ U))
+        for p in range(n_par):
+            projected = U.conj().T @ dvacuum_h[p] @ U
+            mixing = np.zeros(
+                (mass_states, mass_states), dtype=np.complex128
+            )
+            for j in range(mass_states):
+                dMeffective[idE, p, j] = np.real(projected[j, j])
+                for i in range(mass_states):
+                    if i != j:
+                        mixing[i, j] = projected[i, j] / (
+                            eigenvalues[j] - eigenvalues[i]
+                        )
+            dUeffective[idE, p] = U @ mixing
+    return dUeffective, dMeffective
+
+@njit(cache=True)
+def oscillation_grid_gradients(
+        e_grid: np.ndarray, distances: np.ndarray,
+        Ueffective: np.ndarray, Meffective: np.ndarray,
+        dUeffective: np.ndarray, dMeffective: np.ndarray, mass_states=3,
+        initial_flavors=None, compact=False, dtype=np.float64
+    ):
+    """ oscillation_grid_effective together with the derivatives of the
+    probabilities. Both are filled in the same pass and share the
+    flavor coefficients and phase factors. The probabilities are the
+    same as the ones of oscillation_grid_effective
+
+    Parameters
+    ----------
+    e_grid: np.ndarray
+        Energy of the oscillating neutrino
+    distances: np.ndarray
+        Travel distances in km
+    Ueffective: np.ndarray
+        Effective PMNS matrices, one per energy
+    Meffective: np.ndarray
+        Effective mass matrices, one per energy
+    dUeffective, dMeffective: np.ndarray
+        Their derivatives, see effective_gradients
+    mass_states: int
+        Optional: Number of mass states,
+        this should agree with the mixing matrix
+    initial_flavors: np.ndarray or None
+        Optional: The flavor states oscillating from. Defaults to all
+    compact: bool
+        Optional: Skip the last final flavor
+    dtype: np.dtype
+        Optional: The precision the results are stored with
+
+    Returns
+    -------
+    oscillation_probs: np.ndarray
+        The oscillation probabilities with shape
+        (len(initial_flavors), mass_states, len(distances), len(e_grid))
+    oscillation_grads: np.ndarray
+        The derivatives with shape
+        (parameter, len(initial_flavors), mass_states, len(distances),
+        len(e_grid))
+    """
+    if initial_flavors is None:
+        alphas = np.arange(mass_states)
+    else:
+        alphas = np.asarray(initial_flavors)
+    n_a = len(alphas)
+    n_e = len(e_grid)
+    n_l = len(distances)
+    n_par = dUeffective.shape[1]
+    l_tmp = distances * 1e3 * m2GeV
+    if compact:
+        n_b = mass_states - 1
+    else:
+        n_b = mass_states
+    probs = np.empty((n_a, n_b, n_l, n_e), dtype=dtype)
+    grads = np.empty((n_par, n_a, n_b, n_l, n_e), dtype=dtype)
+    for idE in prange(n_e):
+        E = e_grid[idE]
+        U = Ueffective[idE]
+        H = Meffective[idE]
+        dU = dUeffective[idE]
+        losc = np.empty((mass_states, mass_states))
+        # Derivative of the phases per unit l_tmp
+        dphase = np.zeros((n_par, mass_states, mass_states))
+        coeff = np.zeros(
+            (n_a, mass_states, mass_states, mass_states),
+            dtype=np.complex128
+        )
+        dcoeff = np.zeros(
+            (n_par, n_a, mass_states, mass_states, mass_states),
+            dtype=np.complex128
+        )
+        # Derivatives of the baseline independent first terms
+        dfirst = np.zeros((n_par, n_a, mass_states))
+        phases = np.zeros((mass_states, mass_states), dtype=np.complex128)
+        for j in range(mass_states):
+            for i in range(j):
+                losc[j, i] = l_osc(j, i, E, H)
+                for p in range(n_par):
+                    # Same mass differences as in mass_diff_mat
+                    dphase[p, j, i] = (
+                        dMeffective[idE, p, j] - dMeffective[idE, p, i]
+                    ) / (2. * E)
+        for idA in range(n_a):
+            alpha = alphas[idA]
+            for beta in range(mass_states):
+                for j in range(mass_states):
+                    for i in range(j):
+                        coeff[idA, beta, j, i] = (
+                            U[alpha, i] * np.conj(U[alpha, j]) *
+                            np.conj(U[beta, i]) * U[beta, j]
+                        )
+                        for p in range(n_par):
+                            dcoeff[p, idA, beta, j, i] = (
+                                dU[p, alpha, i] * np.conj(U[alpha, j]) *
+                                np.conj(U[beta, i]) * U[beta, j] +
+                                U[alpha, i] * np.conj(dU[p, alpha, j]) *
+                                np.conj(U[beta, i]) * U[beta, j] +
+                                U[alpha, i] * np.conj(U[alpha, j]) *
+                                np.conj(dU[p, beta, i]) * U[beta, j] +
+                                U[alpha, i] * np.conj(U[alpha, j]) *
+                                np.conj(U[beta, i]) * dU[p, beta, j]
+                            )
+                if beta < n_b:
+                    for p in range(n_par):
+                        for j in range(mass_states):
+                            dfirst[p, idA, beta] += 2. * (
+                                np.real(np.conj(U[alpha, j]) * dU[p, alpha, j]) *
+                                np.abs(U[beta, j])**2 +
+                                np.abs(U[alpha, j])**2 *
+                                np.real(np.conj(U[beta, j]) * dU[p, beta, j])
+                            )
+        for idL in range(n_l):
+            for j in range(mass_states):
+                for i in range(j):
+                    phases[j, i] = np.exp(
+                        -2*np.pi*1j * l_tmp[idL] / losc[j, i]
+                    )
+            for idA in range(n_a):
+                alpha = alphas[idA]
+                for beta in range(n_b):
+                    first = 0.
+                    for j in range(mass_states):
+                        first += (
+                            (np.abs(U[alpha, j])**2) *
+                            (np.abs(U[beta, j])**2)
+                        )
+                        second = 0j
+                        for i in range(j):
+                            second += coeff[idA, beta, j, i] * phases[j, i]
+                        first += 2 * np.real(second)
+                    probs[idA, beta, idL, idE] = first
+                    for p in range(n_par):
+                        dsecond = 0j
+                        for j in range(mass_states):
+                            for i in range(j):
+                                dsecond += (
+                                    dcoeff[p, idA, beta, j, i] -
+                                    1j * l_tmp[idL] * dphase[p, j, i] *
+                                    coeff[idA, beta, j, i]
+                                ) * phases[j, i]
+                        grads[p, idA, beta, idL, idE] = (
+                            dfirst[p, idA, beta] + 2 * np.real(dsecond)
+                        )
+    return probs, grads
+
+# Multi-threaded versions of the above
+effective_gradients_parallel = parallel_variant(effective_gradients)
+oscillation_grid_gradients_parallel = parallel_variant(
+    oscillation_grid_gradients
+)
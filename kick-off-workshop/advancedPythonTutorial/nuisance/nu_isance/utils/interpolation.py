@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+# interpolation.py
+# Authors: Stephan Meighen-Berger
+# Helpers for interpolating the grids
+
+# imports
+import numpy as np
+
+
+def interpolation_nodes(grid: np.ndarray, x: np.ndarray):
+    """ grid nodes and weights for linear interpolation
+
+    Parameters
+    ----------
+    grid: np.ndarray
+        The (ascending) grid
+    x: np.ndarray
+        The points to interpolate to
+
+    Returns
+    -------
+    lower, upper: np.ndarray
+        The indices of the lower and upper nodes
+    weights: np.ndarray
+        The weights of the upper nodes
+    """
+    lower = np.clip(
+        np.searchsorted(grid, x, side='right') - 1, 0, len(grid) - 1
+    )
+    upper = np.minimum(lower + 1, len(grid) - 1)
+    spacing = grid[upper] - grid[lower]
+    weights = np.divide(
+        x - grid[lower], spacing,
+        out=np.zeros(x.shape), where=spacing > 0
+    )
+    return lower, upper, np.clip(weights, 0., 1.)
@@ -6,13 +6,14 @@
 # imports
 import numpy as np
 import numpy as np
-from numba import njit
+from numba import njit, prange
 
 # module imports
 from nu_isance.constants import m2GeV, mdiff, rEarth, ratmos
+from .parallel import parallel_variant
 
 # Basic functions
-@njit
+@njit(cache=True)
 def mass_diff_mat(i: int, j: int, matrix: np.array) -> float:
     """ Fetches the mass differences from the mass matrix
 
@@ -30,17 +31,15 @@ def mass_diff_mat(i: int, j: int, matrix: np.array) -> float:
     """
     if i == j:
         return 0
-    states_ordered = np.sort(np.array([i, j]))  # Need the lowest number to be 1
-    if states_ordered[0] == 0:
-        return matrix[states_ordered[1], states_ordered[1]]
-    else:
-        return (
-            matrix[states_ordered[1], states_ordered[1]] -
-            matrix[states_ordered[0], states_ordered[0]]
-        )
+    states_ordered = np.sort(np.array([i, j]))
+    # The lowest state is only massless in vacuum
+    return (
+        matrix[states_ordered[1], states_ordered[1]] -
+        matrix[states_ordered[0], states_ordered[0]]
+    )
 
 # oscillation length
-@njit
+@njit(cache=True)
 def l_osc(i: int, j: int, E: float, mass_matrix: np.array) -> float:
     """ The oscillation length for the given flavor combination and energy
 
@@ -62,7 +61,7 @@ def l_osc(i: int, j: int, E: float, mass_matrix: np.array) -> float:
         4. * np.pi * E / mass_diff_mat(int(i), int(j), mass_matrix)
     )
 
-@njit
+@njit(cache=True)
 def buildmassmatrix(params: np.array) -> np.ndarray:
     """ constructs the squared mass matrix from the input parameters
 
@@ -85,7 +84,7 @@ def buildmassmatrix(params: np.array) -> np.ndarray:
     )
 
 # basis transform
-@njit
+@njit(cache=True)
 def rotmatrix(dim: int, i: int, j: int, ang: float, cp: float) -> np.ndarray:
     """ constructs a (Gell-Mann) rotational matrix ij with angle ang
     and cp violating phase cp for symmetry i < j is required
@@ -118,7 +117,7 @@ def rotmatrix(dim: int, i: int, j: int, ang: float, cp: float) -> np.ndarray:
     R[i, i] = R[j, j] = np.cos(ang)
     return R
 
-@njit
+@njit(cache=True)
 def buildmixingmatrix(params: np.ndarray, anti=1) -> np.ndarray:
     """ constructs the mixing matrix from the input parameters
     for symmetry i < j is required
@@ -150,7 +149,81 @@ def buildmixingmatrix(params: np.ndarray, anti=1) -> np.ndarray:
                       np.deg2rad(par[2]), anti * np.deg2rad(par[3])), U)
     return U
 
-@njit
+@njit(cache=True)
+def hermitian_eigh3(matrix: np.ndarray):
+    """ closed-form eigensystem of a hermitian 3x3 matrix. The eigenvalues
+    follow from the trigonometric solution of the characteristic
+    polynomial and the eigenvectors from cross products of the rows of
+    (matrix - eigenvalue). This avoids the general eigensolver
+
+    Parameters
+    ----------
+    matrix: np.ndarray
+        The hermitian 3x3 matrix
+
+    Returns
+    -------
+    eigenvalues: np.ndarray
+        The eigenvalues in ascending order
+    eigenvectors: np.ndarray
+        The normalized eigenvectors as columns
+    """
+    # Scaling to order unity to keep the precision
+    scale = np.max(np.abs(matrix))
+    eigenvalues = np.zeros(3)
+    eigenvectors = np.eye(3, dtype=np.complex128)
+    if scale == 0.:
+        return eigenvalues, eigenvectors
+    A = matrix / scale
+    a00 = A[0, 0].real
+    a11 = A[1, 1].real
+    a22 = A[2, 2].real
+    p1 = (
+        np.abs(A[0, 1])**2 + np.abs(A[0, 2])**2 + np.abs(A[1, 2])**2
+    )
+    q = (a00 + a11 + a22) / 3.
+    p2 = (a00 - q)**2 + (a11 - q)**2 + (a22 - q)**2 + 2. * p1
+    if p2 <= 0.:
+        # Already diagonal and degenerate
+        eigenvalues[:] = q * scale
+        return eigenvalues, eigenvectors
+    p = np.sqrt(p2 / 6.)
+    B = (A - q * np.eye(3)) / p
+    det_b = (
+        B[0, 0] * (B[1, 1] * B[2, 2] - B[1, 2] * B[2, 1]) -
+        B[0, 1] * (B[1, 0] * B[2, 2] - B[1, 2] * B[2, 0]) +
+        B[0, 2] * (B[1, 0] * B[2, 1] - B[1, 1] * B[2, 0])
+    ).real
+    r = min(max(det_b / 2., -1.), 1.)
+    phi = np.arccos(r) / 3.
+    largest = q + 2. * p * np.cos(phi)
+    smallest = q + 2. * p * np.cos(phi + 2. * np.pi / 3.)
+    eigenvalues[0] = smallest
+    eigenvalues[1] = 3. * q - largest - smallest
+    eigenvalues[2] = largest
+    for k in range(3):
+        shifted = A - eigenvalues[k] * np.eye(3)
+        # The cross product of two rows is orthogonal to both. Using the
+        # largest one for stability
+        best = np.zeros(3, dtype=np.complex128)
+        best_norm = -1.
+        for (i, j) in ((0, 1), (0, 2), (1, 2)):
+            r1 = shifted[i]
+            r2 = shifted[j]
+            cross = np.array([
+                r1[1] * r2[2] - r1[2] * r2[1],
+                r1[2] * r2[0] - r1[0] * r2[2],
+                r1[0] * r2[1] - r1[1] * r2[0],
+            ])
+            norm = np.sqrt(np.sum(np.abs(cross)**2))
+            if norm > best_norm:
+                best = cross
+                best_norm = norm
+        if best_norm > 0.:
+            eigenvectors[:, k] = best / best_norm
+    return eigenvalues * scale, eigenvectors
+
+@njit(cache=True)
 def effective_matrices(
     mixing_angles: np.ndarray, mdiff: np.ndarray, matter: np.ndarray, anti=1):
     """ constructs the effective mixing and mass matrices
@@ -181,15 +254,12 @@ def effective_matrices(
     effective_h = (
         mixing_matrix @ (mass_matrix @ mixing_matrix.conj().T) + anti * matter
     )
-    U, H, _ = np.linalg.svd(effective_h) # Output in descending order for H
-    n = len(H)
-    H = np.diag(H[::-1])  # Sorts in decending order 
-    U[:, :n] = U[:, n-1::-1]
+    U, H = diagonalize_effective(effective_h)
     return U, H, effective_h
 
 # Transition probability using plane waves
 # Following arXiv:1206.0812v1
-@njit
+@njit(cache=True)
 def wp_prob(
         alpha: int, beta: int, E: float, L: float,
         mixing_angles: np.ndarray, mass_states=3, matter=None, anti=1,
@@ -239,10 +309,7 @@ def wp_prob(
             mixing_matrix @ (mass_matrix @ mixing_matrix.conj().T) +
             anti * (matter.astype(np.complex128) * E)
         )
-        U, H, _ = np.linalg.svd(effective_h) # Output in descending order for H
-        n = len(H)
-        H = np.diag(H[::-1])  # Sorts in decending order 
-        U[:, :n] = U[:, n-1::-1]
+        U, H = diagonalize_effective(effective_h, mass_states=mass_states)
     for j in range(mass_states):
         # First term
         first += (np.abs(U[alpha, j])**2) * (np.abs(U[beta, j])**2)
@@ -262,7 +329,7 @@ def wp_prob(
 
 # Transition probability using plane waves
 # Following arXiv:1206.0812v1
-@njit
+@njit(cache=True)
 def wp_prob_effective(
         alpha: int, beta: int, E: float, L: float,
         Ueffective: np.ndarray, Meffective: np.ndarray,
@@ -318,7 +385,7 @@ def wp_prob_effective(
         first += 2*second  
     return first
 
-@njit
+@njit(cache=True)
 def oscillation_calc_func(
         org_flavor: int, e_grid: np.ndarray, zenith: float,
         mixing_angles: np.ndarray, mass_states=3, matter=None, anti=1
@@ -374,7 +441,7 @@ def oscillation_calc_func(
     ])
     return probs_1, probs_2, probs_3
 
-@njit
+@njit(cache=True)
 def oscillation_calc_func_effective(
         org_flavor: int, e_grid: np.ndarray, zenith: float,
         Ueffective: np.ndarray, Meffective: np.ndarray, mass_states=3
@@ -427,4 +494,639 @@ def oscillation_calc_func_effective(
             mass_states=mass_states
         ) for E in e_grid
     ])
-    return probs_1, probs_2, probs_3
\ No newline at end of file
+    return probs_1, probs_2, probs_3
+
+@njit(cache=True)
+def atmospheric_baseline(zenith: float) -> float:
+    """ travel distance through the atmosphere and Earth for a given
+    injection angle
+
+    Parameters
+    ----------
+    zenith: float
+        injection angle in radians
+
+    Returns
+    -------
+    distance: float
+        The travel distance in km
+    """
+    return np.sqrt(
+        ratmos * ratmos + rEarth*rEarth -
+        2 * ratmos * rEarth * np.cos(
+            zenith - np.arcsin(np.sin(np.pi-zenith) / ratmos * rEarth)
+        )
+    )
+
+@njit(cache=True)
+def diagonalize_effective(
+        effective_h: np.ndarray, mass_states=3, analytic=False
+    ):
+    """ diagonalizes an effective hamiltonian
+
+    Parameters
+    ----------
+    effective_h: np.ndarray
+        The effective hamiltonian
+    mass_states: int
+        Optional: Number of mass states,
+        this should agree with the mixing matrix
+    analytic: bool
+        Optional: Use the closed-form solution (hermitian_eigh3) instead of
+        the general hermitian eigensolver. Only used for three mass states
+
+    Returns
+    -------
+    Ueffective, Meffective: np.ndarray
+        The effective rotation and (diagonal) mass matrices. The
+        eigenvalues are signed and in ascending order, negative ones
+        occur e.g. for anti neutrinos in matter
+    """
+    if analytic and mass_states == 3:
+        H, U = hermitian_eigh3(effective_h)
+    else:
+        H, U = np.linalg.eigh(effective_h)
+    return U, np.diag(H)
+
+@njit(cache=True)
+def vacuum_hamiltonian(
+        mixing_angles: np.ndarray, mdiff: np.ndarray, anti=1
+    ) -> np.ndarray:
+    """ the energy independent vacuum part of the effective hamiltonian
+
+    Parameters
+    ----------
+    mixing_angles: np.ndarray
+        PMNS matrix
+    mdiff: np.ndarray
+        The mass squared differences
+    anti: int
+        Optional: +1 for neutrinos and -1 for anti neutrinos
+
+    Returns
+    -------
+    vacuum_h: np.ndarray
+        The vacuum hamiltonian in the flavor basis
+    """
+    mixing_matrix = buildmixingmatrix(mixing_angles, anti=anti)
+    mass_matrix = buildmassmatrix(mdiff)
+    return (
+        mixing_matrix.astype(np.complex128) @ (
+            mass_matrix.astype(np.complex128) @
+            mixing_matrix.astype(np.complex128).conj().T
+        )
+    )
+
+@njit(cache=True)
+def effective_eigensystems(
+        e_grid: np.ndarray, mixing_angles: np.ndarray, mdiff: np.ndarray,
+        mass_states=3, matter=None, anti=1, analytic=False
+    ):
+    """ constructs the effective mixing and mass matrices for each energy.
+    These only depend on the energy, the matter potential and anti, so they
+    can be shared between all baselines and flavor combinations
+
+    Parameters
+    ----------
+    e_grid: np.ndarray
+        Energy of the oscillating neutrino
+    mixing_angles: np.ndarray
+        PMNS matrix
+    mdiff: np.ndarray
+        The mass squared differences
+    mass_states: int
+        Optional: Number of mass states,
+        this should agree with the mixing matrix
+    matter: np.ndarray or None
+        Optional: The effective matter potential
+    anti: int
+        Optional: +1 for neutrinos and -1 for anti neutrinos
+    analytic: bool
+        Optional: Use the closed-form solution, see diagonalize_effective.
+        Without matter no diagonalization is done
+
+    Returns
+    -------
+    Ueffective, Meffective: np.ndarray
+        The effective rotation matrices with shape
+        (len(e_grid), mass_states, mass_states) and the corresponding
+        effective mass matrices
+    """
+    n_e = len(e_grid)
+    Ueffective = np.empty(
+        (n_e, mass_states, mass_states), dtype=np.complex128
+    )
+    Meffective = np.empty((n_e, mass_states, mass_states))
+    mixing_matrix = buildmixingmatrix(mixing_angles, anti=anti)
+    mass_matrix = buildmassmatrix(mdiff)
+    # The vacuum part is the same for all energies
+    vacuum_h = vacuum_hamiltonian(mixing_angles, mdiff, anti=anti)
+    for idE in prange(n_e):
+        if matter is None:
+            Ueffective[idE] = mixing_matrix
+            Meffective[idE] = mass_matrix
+        else:
+            effective_h = (
+                vacuum_h + anti * (matter.astype(np.complex128) * e_grid[idE])
+            )
+            U, H = diagonalize_effective(
+                effective_h, mass_states=mass_states, analytic=analytic
+            )
+            Ueffective[idE] = U
+            Meffective[idE] = H
+    return Ueffective, Meffective
+
+@njit(cache=True)
+def phase_damping(width: float, box: bool) -> float:
+    """ average of exp(-i phase) over a distribution of phases relative
+    to its central value
+
+    Parameters
+    ----------
+    width: float
+        Width of the phase distribution
+    box: bool
+        Uniform distribution over +- width instead of a gaussian
+        with the standard deviation width
+
+    Returns
+    -------
+    damping: float
+        The factor the central phase term is damped by
+    """
+    if box:
+        if width == 0.:
+            return 1.
+        return np.sin(width) / width
+    return np.exp(-0.5 * width**2)
+
+@njit(cache=True)
+def smearing_widths(
+        smearing: np.ndarray, Meffective: np.ndarray, Mlower=None,
+        Mupper=None, step=1e-4, mass_states=3
+    ) -> np.ndarray:
+    """ relative widths of the interference phases for a relative width
+    in L/E. In vacuum the phases are proportional to L/E. In matter the
+    effective mass differences change with the energy, which changes the
+    slope d ln(phase) / d ln(L/E). It is estimated from the mass
+    matrices at E (1 -+ step)
+
+    Parameters
+    ----------
+    smearing: np.ndarray
+        Relative width in L/E (roughly sigma_E / E) for each energy
+    Meffective: np.ndarray
+        Effective mass matrices, one per energy
+    Mlower, Mupper: np.ndarray or None
+        Optional: Effective mass matrices at E (1 -+ step). None for vacuum
+    step: float
+        Optional: The relative energy step of Mlower and Mupper
+    mass_states: int
+        Optional: Number of mass states
+
+    Returns
+    -------
+    widths: np.ndarray
+        The relative width of each phase with shape
+        (len(smearing), mass_states, mass_states)
+    """
+    n_e = len(smearing)
+    widths = np.zeros((n_e, mass_states, mass_states))
+    for idE in range(n_e):
+        for j in range(mass_states):
+            for i in range(j):
+                slope = 1.
+                if Mlower is not None and Mupper is not None:
+                    mass_diff = mass_diff_mat(j, i, Meffective[idE])
+                    if mass_diff != 0.:
+                        slope = 1. - (
+                            mass_diff_mat(j, i, Mupper[idE]) -
+                            mass_diff_mat(j, i, Mlower[idE])
+                        ) / (2. * step * mass_diff)
+                widths[idE, j, i] = smearing[idE] * np.abs(slope)
+    return widths
+
+@njit(cache=True)
+def oscillation_grid_effective(
+        e_grid: np.ndarray, distances: np.ndarray,
+        Ueffective: np.ndarray, Meffective: np.ndarray, mass_states=3,
+        initial_flavors=None, compact=False, dtype=np.float64,
+        smearing=None, box=False
+    ) -> np.ndarray:
+    """ batched version of wp_prob_effective. Fills the entire
+    (initial flavor, final flavor, baseline, E) probability tensor in one
+    pass using the per-energy effective matrices from
+    effective_eigensystems. The flavor coefficients are constructed once per
+    energy and the phase factors once per (energy, baseline). The
+    arithmetic follows wp_prob term by term, so the results agree
+    with the scalar version
+
+    Parameters
+    ----------
+    e_grid: np.ndarray
+        Energy of the oscillating neutrino
+    distances: np.ndarray
+        Travel distances in km
+    Ueffective: np.ndarray
+        Effective PMNS matrices, one per energy
+    Meffective: np.ndarray
+        Effective mass matrices, one per energy
+    mass_states: int
+        Optional: Number of mass states,
+        this should agree with the mixing matrix
+    initial_flavors: np.ndarray or None
+        Optional: The flavor states oscillating from. Defaults to all
+    compact: bool
+        Optional: Skip the last final flavor. It follows from unitarity,
+        see complete_flavors
+    dtype: np.dtype
+        Optional: The precision the results are stored with. They are
+        written directly, without an intermediate float64 copy
+    smearing: np.ndarray or None
+        Optional: Relative widths of the interference phases with shape
+        (len(e_grid), mass_states, mass_states), see smearing_widths.
+        The interference terms are averaged analytically, treating the
+        phases as linear in L/E across the width
+    box: bool
+        Optional: Average uniformly over the phases (1 +- smearing)
+        instead of a gaussian with the relative width smearing
+
+    Returns
+    -------
+    oscillation_probs: np.ndarray
+        The oscillation probabilities with shape
+        (len(initial_flavors), mass_states, len(distances), len(e_grid))
+    """
+    if initial_flavors is None:
+        alphas = np.arange(mass_states)
+    else:
+        alphas = np.asarray(initial_flavors)
+    n_a = len(alphas)
+    n_e = len(e_grid)
+    n_l = len(distances)
+    l_tmp = distances * 1e3 * m2GeV
+    if compact:
+        n_b = mass_states - 1
+    else:
+        n_b = mass_states
+    probs = np.empty((n_a, n_b, n_l, n_e), dtype=dtype)
+    for idE in prange(n_e):
+        E = e_grid[idE]
+        U = Ueffective[idE]
+        H = Meffective[idE]
+        losc = np.empty((mass_states, mass_states))
+        coeff = np.zeros(
+            (n_a, mass_states, mass_states, mass_states),
+            dtype=np.complex128
+        )
+        phases = np.zeros((mass_states, mass_states), dtype=np.complex128)
+        # Energy dependent, baseline independent parts
+        for j in range(mass_states):
+            for i in range(j):
+                losc[j, i] = l_osc(j, i, E, H)
+        for idA in range(n_a):
+            alpha = alphas[idA]
+            for beta in range(mass_states):
+                for j in range(mass_states):
+                    for i in range(j):
+                        coeff[idA, beta, j, i] = (
+                            U[alpha, i] * np.conj(U[alpha, j]) *
+                            np.conj(U[beta, i]) * U[beta, j]
+                        )
+        for idL in range(n_l):
+            for j in range(mass_states):
+                for i in range(j):
+                    phases[j, i] = np.exp(
+                        -2*np.pi*1j * l_tmp[idL] / losc[j, i]
+                    )
+                    if smearing is not None:
+                        phases[j, i] *= phase_damping(
+                            2*np.pi * l_tmp[idL] / losc[j, i] *
+                            smearing[idE, j, i], box
+                        )
+            for idA in range(n_a):
+                alpha = alphas[idA]
+                for beta in range(n_b):
+                    first = 0.
+                    for j in range(mass_states):
+                        first += (
+                            (np.abs(U[alpha, j])**2) *
+                            (np.abs(U[beta, j])**2)
+                        )
+                        second = 0j
+                        for i in range(j):
+                            second += coeff[idA, beta, j, i] * phases[j, i]
+                        first += 2 * np.real(second)
+                    probs[idA, beta, idL, idE] = first
+    return probs
+
+@njit(cache=True)
+def oscillation_grid_effective_both(
+        e_grid: np.ndarray, distances: np.ndarray,
+        Ueffective: np.ndarray, Meffective: np.ndarray, mass_states=3,
+        initial_flavors=None, compact=False, dtype=np.float64,
+        smearing=None, box=False
+    ) -> np.ndarray:
+    """ oscillation_grid_effective for neutrinos and anti neutrinos in
+    vacuum. There the anti neutrinos have the same masses and the complex
+    conjugate mixing matrix, so their flavor coefficients are the
+    conjugates of the neutrino ones. Both grids share the phase factors,
+    the baseline independent terms and the products of the real and
+    imaginary parts, which only differ in the sign they are summed with.
+    The summation follows oscillation_grid_effective, so the results are
+    the same as two separate calls
+
+    Parameters
+    ----------
+    e_grid: np.ndarray
+        Energy of the oscillating neutrino
+    distances: np.ndarray
+        Travel distances in km
+    Ueffective: np.ndarray
+        Effective PMNS matrices of the neutrinos, one per energy
+    Meffective: np.ndarray
+        Effective mass matrices, one per energy
+    mass_states: int
+        Optional: Number of mass states,
+        this should agree with the mixing matrix
+    initial_flavors: np.ndarray or None
+        Optional: The flavor states oscillating from. Defaults to all
+    compact: bool
+        Optional: Skip the last final flavor
+    dtype: np.dtype
+        Optional: The precision the results are stored with
+    smearing: np.ndarray or None
+        Optional: Relative widths of the interference phases, see
+        oscillation_grid_effective
+    box: bool
+        Optional: Average uniformly instead of using a gaussian
+
+    Returns
+    -------
+    oscillation_probs: np.ndarray
+        The oscillation probabilities with shape
+        (2, len(initial_flavors), mass_states, len(distances), len(e_grid)).
+        The first axis is (neutrino, anti neutrino)
+    """
+    if initial_flavors is None:
+        alphas = np.arange(mass_states)
+    else:
+        alphas = np.asarray(initial_flavors)
+    n_a = len(alphas)
+    n_e = len(e_grid)
+    n_l = len(distances)
+    l_tmp = distances * 1e3 * m2GeV
+    if compact:
+        n_b = mass_states - 1
+    else:
+        n_b = mass_states
+    probs = np.empty((2, n_a, n_b, n_l, n_e), dtype=dtype)
+    for idE in prange(n_e):
+        E = e_grid[idE]
+        U = Ueffective[idE]
+        H = Meffective[idE]
+        losc = np.empty((mass_states, mass_states))
+        coeff = np.zeros(
+            (n_a, mass_states, mass_states, mass_states),
+            dtype=np.complex128
+        )
+        constant = np.zeros((n_a, mass_states, mass_states))
+        phases = np.zeros((mass_states, mass_states), dtype=np.complex128)
+        # Energy dependent, baseline independent parts
+        for j in range(mass_states):
+            for i in range(j):
+                losc[j, i] = l_osc(j, i, E, H)
+        for idA in range(n_a):
+            alpha = alphas[idA]
+            for beta in range(mass_states):
+                for j in range(mass_states):
+                    constant[idA, beta, j] = (
+                        (np.abs(U[alpha, j])**2) *
+                        (np.abs(U[beta, j])**2)
+                    )
+                    for i in range(j):
+                        coeff[idA, beta, j, i] = (
+                            U[alpha, i] * np.conj(U[alpha, j]) *
+                            np.conj(U[beta, i]) * U[beta, j]
+                        )
+        for idL in range(n_l):
+            for j in range(mass_states):
+                for i in range(j):
+                    phases[j, i] = np.exp(
+                        -2*np.pi*1j * l_tmp[idL] / losc[j, i]
+                    )
+                    if smearing is not None:
+                        phases[j, i] *= phase_damping(
+                            2*np.pi * l_tmp[idL] / losc[j, i] *
+                            smearing[idE, j, i], box
+                        )
+            for idA in range(n_a):
+                for beta in range(n_b):
+                    first = 0.
+                    first_bar = 0.
+                    for j in range(mass_states):
+                        first += constant[idA, beta, j]
+                        first_bar += constant[idA, beta, j]
+                        second = 0.
+                        second_bar = 0.
+                        for i in range(j):
+                            # Real part of coeff * phase and of
+                            # conj(coeff) * phase
+                            real = (
+                                coeff[idA, beta, j, i].real *
+                                phases[j, i].real
+                            )
+                            imag = (
+                                coeff[idA, beta, j, i].imag *
+                                phases[j, i].imag
+                            )
+                            second += real - imag
+                            second_bar += real + imag
+                        first += 2 * second
+                        first_bar += 2 * second_bar
+                    probs[0, idA, beta, idL, idE] = first
+                    probs[1, idA, beta, idL, idE] = first_bar
+    return probs
+
+# Multi-threaded versions of the above. The energies are split between the
+# threads and every entry is calculated exactly as in the serial versions
+effective_eigensystems_parallel = parallel_variant(
+    effective_eigensystems
+)
+oscillation_grid_effective_parallel = parallel_variant(
+    oscillation_grid_effective
+)
+oscillation_grid_effective_both_parallel = parallel_variant(
+    oscillation_grid_effective_both
+)
+
+@njit(cache=True)
+def atmospheric_baselines(cosZ: np.ndarray) -> np.ndarray:
+    """ vectorized atmospheric_baseline
+
+    Parameters
+    ----------
+    cosZ: np.ndarray
+        cosine of the injection angles
+
+    Returns
+    -------
+    distances: np.ndarray
+        The travel distances in km
+    """
+    distances = np.empty(len(cosZ))
+    for idZ in range(len(cosZ)):
+        distances[idZ] = atmospheric_baseline(np.arccos(cosZ[idZ]))
+    return distances
+
+@njit(cache=True)
+def oscillation_grid(
+        e_grid: np.ndarray, cosZ: np.ndarray,
+        mixing_angles: np.ndarray, mass_states=3, matter=None, anti=1,
+        analytic=False
+    ) -> np.ndarray:
+    """ batched version of oscillation_calc_func. Fills the entire
+    (initial flavor, final flavor, cosZ, E) probability tensor in one pass.
+    The effective matrices are constructed once per energy
+    (see effective_eigensystems) and shared by all injection angles
+
+    Parameters
+    ----------
+    e_grid: np.ndarray
+        Energy of the oscillating neutrino
+    cosZ: np.ndarray
+        cosine of the injection angles
+    mixing_angles: np.ndarray
+        PMNS matrix
+    mass_states: int
+        Optional: Number of mass states,
+        this should agree with the mixing matrix
+    matter: np.ndarray or None
+        Optional: The effective matter potential
+    anti: int
+        Optional: +1 for neutrinos and -1 for anti neutrinos
+    analytic: bool
+        Optional: Use the closed-form eigensystems,
+        see effective_eigensystems
+
+    Returns
+    -------
+    oscillation_probs: np.ndarray
+        The oscillation probabilities with shape
+        (mass_states, mass_states, len(cosZ), len(e_grid))
+    """
+    Ueffective, Meffective = effective_eigensystems(
+        e_grid, mixing_angles, mdiff, mass_states=mass_states,
+        matter=matter, anti=anti, analytic=analytic
+    )
+    return oscillation_grid_effective(
+        e_grid, atmospheric_baselines(cosZ), Ueffective, Meffective,
+        mass_states=mass_states
+    )
+
+@njit(cache=True)
+def event_probabilities_effective(
+        energies: np.ndarray, eigen_ids: np.ndarray, distances: np.ndarray,
+        alphas: np.ndarray, betas: np.ndarray,
+        Ueffective: np.ndarray, Meffective: np.ndarray, mass_states=3
+    ) -> np.ndarray:
+    """ wp_prob_effective for a list of events, each with its own energy,
+    baseline and flavors
+
+    Parameters
+    ----------
+    energies: np.ndarray
+        Energies of the events
+    eigen_ids: np.ndarray
+        Index of the effective matrices to use for each event
+    distances: np.ndarray
+        Travel distances of the events in km
+    alphas, betas: np.ndarray
+        Flavor states oscillating from and to
+    Ueffective: np.ndarray
+        Effective PMNS matrices
+    Meffective: np.ndarray
+        Effective mass matrices
+    mass_states: int
+        Optional: Number of mass states,
+        this should agree with the mixing matrix
+
+    Returns
+    -------
+    oscillation_probs: np.ndarray
+        The oscillation probability of each event
+    """
+    probs = np.empty(len(energies))
+    for idx in range(len(energies)):
+        idM = eigen_ids[idx]
+        probs[idx] = wp_prob_effective(
+            alphas[idx], betas[idx], energies[idx], distances[idx],
+            Ueffective[idM], Meffective[idM], mass_states=mass_states
+        )
+    return probs
+
+def event_oscillation_probs(
+        alpha: np.ndarray, beta: np.ndarray,
+        energies: np.ndarray, zeniths: np.ndarray,
+        mixing_angles: np.ndarray, mass_states=3, matter=None, anti=1,
+        chunk_size=100000, analytic=False
+    ) -> np.ndarray:
+    """ exact oscillation probabilities for unstructured event lists.
+    The events are processed in chunks to bound the memory usage. Within a
+    chunk the effective matrices are constructed once per unique energy
+
+    Parameters
+    ----------
+    alpha: np.ndarray or int
+        Flavor states oscillating from
+    beta: np.ndarray or int
+        Flavor states to oscillate to
+    energies: np.ndarray
+        Energies of the oscillating neutrinos
+    zeniths: np.ndarray
+        injection angles in radians
+    mixing_angles: np.ndarray
+        PMNS matrix
+    mass_states: int
+        Optional: Number of mass states,
+        this should agree with the mixing matrix
+    matter: np.ndarray or None
+        Optional: The effective matter potential
+    anti: int
+        Optional: +1 for neutrinos and -1 for anti neutrinos
+    chunk_size: int
+        Optional: Number of events processed at once
+    analytic: bool
+        Optional: Use the closed-form eigensystems,
+        see effective_eigensystems
+
+    Returns
+    -------
+    oscillation_probs: np.ndarray
+        The oscillation probabilities with the broadcast shape of the inputs
+    """
+    alpha, beta, energies, zeniths = np.broadcast_arrays(
+        np.asarray(alpha, dtype=np.int64), np.asarray(beta, dtype=np.int64),
+        np.asarray(energies, dtype=np.float64),
+        np.asarray(zeniths, dtype=np.float64)
+    )
+    shape = energies.shape
+    alpha = alpha.ravel()
+    beta = beta.ravel()
+    energies = energies.ravel()
+    zeniths = zeniths.ravel()
+    probs = np.empty(len(energies))
+    for start in range(0, len(energies), chunk_size):
+        chunk = slice(start, start + chunk_size)
+        unique_e, eigen_ids = np.unique(energies[chunk], return_inverse=True)
+        Ueffective, Meffective = effective_eigensystems(
+            unique_e, mixing_angles, mdiff, mass_states=mass_states,
+            matter=matter, anti=anti, analytic=analytic
+        )
+        probs[chunk] = event_probabilities_effective(
+            energies[chunk], eigen_ids.ravel(),
+            atmospheric_baselines(np.cos(zeniths[chunk])),
+            alpha[chunk], beta[chunk], Ueffective, Meffective,
+            mass_states=mass_states
+        )
+    return probs.reshape(shape)
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+# parallel.py
+# Authors: Stephan Meighen-Berger
+# Helpers for the multi-threaded kernels
+
+# imports
+import logging
+import types
+from contextlib import contextmanager
+import numba
+
+_log = logging.getLogger(__name__)
+
+
+def parallel_variant(kernel):
+    """ compiles a multi-threaded version of a kernel. The prange loops of
+    the kernel are split over the threads. The function is copied under
+    a new name, since numba's on-disk cache only distinguishes functions
+    by name and would otherwise load the serial version
+
+    Parameters
+    ----------
+    kernel: numba.core.registry.CPUDispatcher
+        The serial (njit) kernel
+
+    Returns
+    -------
+    parallel_kernel: numba.core.registry.CPUDispatcher
+        The kernel compiled with parallel=True
+    """
+    func = kernel.py_func
+    copy = types.FunctionType(
+        func.__code__, func.__globals__, func.__name__ + "_parallel",
+        func.__defaults__, func.__closure__
+    )
+    copy.__qualname__ = func.__qualname__ + "_parallel"
+    copy.__doc__ = func.__doc__
+    return numba.njit(parallel=True, cache=True)(copy)
+
+
+def resolve_workers(workers) -> int:
+    """ converts the workers setting to a number of threads
+
+    Parameters
+    ----------
+    workers: int or None
+        Requested number of threads. None uses all available threads
+        and values below 1 are treated as 1
+
+    Returns
+    -------
+    nthreads: int
+        The number of threads to use
+    """
+    available = numba.config.NUMBA_NUM_THREADS
+    if workers is None:
+        return available
+    workers = max(int(workers), 1)
+    if workers > available:
+        _log.warning(
+            "%d workers requested, but only %d threads are available",
+            workers, available
+        )
+        return available
+    return workers
+
+
+@contextmanager
+def numba_threads(workers):
+    """ temporarily sets the number of threads used by the parallel kernels
+
+    Parameters
+    ----------
+    workers: int or None
+        Requested number of threads. None uses all available threads
+    """
+    previous = numba.get_num_threads()
+    numba.set_num_threads(resolve_workers(workers))
+    try:
+        yield
+    finally:
+        numba.set_num_threads(previous)
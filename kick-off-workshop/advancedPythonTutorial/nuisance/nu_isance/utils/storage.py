@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+# storage.py
+# Authors: Stephan Meighen-Berger
+# Compact storage of the oscillation grids
+
+# imports
+import numpy as np
+
+
+def last_flavor(probs: np.ndarray) -> np.ndarray:
+    """ the last final flavor of a compact grid using unitarity
+
+    Parameters
+    ----------
+    probs: np.ndarray
+        The compact grid with shape (initial flavor, final flavor - 1, ...)
+
+    Returns
+    -------
+    oscillation_probs: np.ndarray
+        The last final flavor with shape (initial flavor, ...)
+    """
+    return np.clip(1. - np.sum(probs, axis=1), 0., 1.).astype(probs.dtype)
+
+
+def complete_flavors(probs: np.ndarray) -> np.ndarray:
+    """ restores the last final flavor of a compact grid using unitarity,
+    i.e. the probabilities summed over the final flavors are one
+
+    Parameters
+    ----------
+    probs: np.ndarray
+        The compact grid with shape (initial flavor, final flavor - 1, ...)
+
+    Returns
+    -------
+    oscillation_probs: np.ndarray
+        The full grid with shape (initial flavor, final flavor, ...)
+    """
+    return np.concatenate(
+        [probs, last_flavor(probs)[:, np.newaxis]], axis=1
+    )
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+# Name: warmup.py
+# Authors: Stephan Meighen-Berger
+# Compiles the oscillation kernels ahead of the first grid build
+
+# Native modules
+import logging
+from tempfile import TemporaryDirectory
+from time import time
+import numpy as np
+
+# Package modules
+from .config import config
+from .nu_oscillations import NuOsc
+
+_log = logging.getLogger(__name__)
+
+
+def warmup() -> float:
+    """ compiles the kernels used with the current oscillation config.
+    Small NuOsc objects are built on a minimal grid, one for each path
+    (grids built directly, grids built for the cache of pre-calculated
+    grids and the tiles used by prob), so every kernel is compiled for
+    the same argument types as in the full build. The compiled kernels
+    are stored in numba's on-disk cache (__pycache__ of the package),
+    so later processes load them instead of compiling them again.
+    Call this once per environment, e.g. before launching batch jobs
+
+    Returns
+    -------
+    elapsed: float
+        The time spent in seconds
+    """
+    start = time()
+    # The argument types do not depend on the grid sizes
+    grids = {
+        "energy grid": np.logspace(-2, 2, 3),
+        "angle grid": np.linspace(-1, 1., 3),
+    }
+    if config["oscillation"]["anti neutrinos"]:
+        antis = [1, -1]
+    else:
+        antis = [1]
+    # The cached grids are only written to a temporary folder
+    with TemporaryDirectory() as location:
+        for precalc in [False, True]:
+            osc = NuOsc(config.snapshot({"oscillation": dict(
+                grids, **{"precalc": precalc, "precalc location": location}
+            )}))
+            for anti in antis:
+                osc.oscillation_probs(anti=anti)
+    # Tiles used by the interpolation, before any full grid is built
+    osc = NuOsc(config.snapshot({"oscillation": dict(
+        grids, precalc=False
+    )}))
+    for anti in antis:
+        osc.prob(0, 0, 1., 0., anti=anti)
+    elapsed = time() - start
+    _log.info("Warm-up took %.1f seconds", elapsed)
+    return elapsed
@@ -34,7 +34,8 @@ setup(
         "nu_isance",
         "nu_isance.utils",
         "nu_isance.errors",
-        "nu_isance.nu_oscillations"
+        "nu_isance.nu_oscillations",
+        "nu_isance.nu_fluxes"
     ],
     package_data={'nu_isance': ["data/*.pkl"]},
     include_package_data=True
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+# Name: test_gradients.py
+# Authors: Stephan Meighen-Berger
+# Tests of the derivatives of the oscillation grids
+
+import numpy as np
+import pytest
+
+from nu_isance.constants import mixing_angles, mdiff, Vearth, eV2GeV
+from nu_isance.nu_oscillations import NuEigensystem, point_parameters
+from nu_isance.utils import atmospheric_baselines
+
+e_grid = np.logspace(-1, 2, 30)
+distances = atmospheric_baselines(np.linspace(-1, 1, 9))
+# (theta12, theta13, theta23, delta_cp) in degrees, (dm21, dm31) in eV^2
+point = np.array([
+    mixing_angles[0, 2], mixing_angles[1, 2], mixing_angles[2, 2], 30.,
+    mdiff[1] / eV2GeV**2, mdiff[2] / eV2GeV**2
+])
+steps = np.array([1e-4, 1e-4, 1e-4, 1e-4, 1e-10, 1e-9])
+
+
+def probabilities(parameters: np.ndarray, **kwargs) -> np.ndarray:
+    """ the grid for a point in the parameter space
+
+    Parameters
+    ----------
+    parameters: np.ndarray
+        The point, ordered as constants.oscillation_parameters
+    kwargs: dict
+        Further arguments of NuEigensystem
+
+    Returns
+    -------
+    oscillation_probs: np.ndarray
+        The oscillation probabilities with shape
+        (initial flavor, final flavor, distance, E)
+    """
+    return NuEigensystem(
+        e_grid, *point_parameters(parameters), **kwargs
+    ).probabilities(distances)
+
+
+@pytest.mark.parametrize("matter", [None, Vearth], ids=["vacuum", "matter"])
+@pytest.mark.parametrize("anti", [1, -1])
+@pytest.mark.parametrize("analytic", [False, True])
+def test_finite_differences(matter, anti, analytic):
+    settings = {"matter": matter, "anti": anti, "analytic": analytic}
+    probs, grads = NuEigensystem(
+        e_grid, *point_parameters(point), **settings
+    ).probabilities_with_gradients(distances)
+    np.testing.assert_array_equal(probs, probabilities(point, **settings))
+    for idP, step in enumerate(steps):
+        shift = np.zeros(len(point))
+        shift[idP] = step
+        # Central differences
+        differences = (
+            probabilities(point + shift, **settings) -
+            probabilities(point - shift, **settings)
+        ) / (2. * step)
+        np.testing.assert_allclose(
+            grads[idP], differences, rtol=0.,
+            atol=1e-5 * np.max(np.abs(differences))
+        )
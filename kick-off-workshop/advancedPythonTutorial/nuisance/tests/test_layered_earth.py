@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+# Name: test_layered_earth.py
+# Authors: Stephan Meighen-Berger
+# Tests of the propagation through the layered Earth
+
+import numpy as np
+import pytest
+from scipy.linalg import expm
+
+from nu_isance.constants import mixing_angles, mdiff, earth_layers
+from nu_isance.constants import m2GeV, rEarth
+from nu_isance.nu_oscillations import NuLayeredEarth
+from nu_isance.utils import atmospheric_baselines, layer_potentials
+from nu_isance.utils import oscillation_grid
+from nu_isance.utils.oscillations import vacuum_hamiltonian
+
+e_grid = np.array([0.5, 3., 20.])
+cosZ = np.array([-1., -0.85, -0.5, -0.1, 0.5])
+
+
+def stepped(anti: int, step=1.) -> np.ndarray:
+    """ the grid from small steps along the path, each using the
+    density at its center
+
+    Parameters
+    ----------
+    anti: int
+        +1 for neutrinos and -1 for anti neutrinos
+    step: float
+        Optional: The maximum step length in km
+
+    Returns
+    -------
+    oscillation_probs: np.ndarray
+        The oscillation probabilities with shape
+        (initial flavor, final flavor, cosZ, E)
+    """
+    vacuum_h = vacuum_hamiltonian(mixing_angles, mdiff, anti=anti)
+    # The atmosphere is the last entry
+    potentials = np.concatenate([
+        layer_potentials(earth_layers), np.zeros((1, 3, 3))
+    ])
+    probs = np.empty((3, 3, len(cosZ), len(e_grid)))
+    for idZ, distance in enumerate(atmospheric_baselines(cosZ)):
+        n_steps = int(np.ceil(distance / step))
+        length = distance / n_steps
+        # Distance of the step centers from the detector, from the
+        # production point onwards
+        centers = distance - (np.arange(n_steps) + 0.5) * length
+        radii = np.sqrt(
+            rEarth**2 + centers**2 + 2. * rEarth * centers * cosZ[idZ]
+        )
+        layers = np.searchsorted(earth_layers[:, 0], radii)
+        for idE, E in enumerate(e_grid):
+            steps = [
+                expm(
+                    -1j * (vacuum_h + anti * potential * E) *
+                    length * 1e3 * m2GeV / (2. * E)
+                )
+                for potential in potentials
+            ]
+            evolution = np.eye(3, dtype=np.complex128)
+            for layer in layers:
+                evolution = steps[layer] @ evolution
+            # The amplitude of alpha -> beta is evolution[beta, alpha]
+            probs[:, :, idZ, idE] = np.abs(evolution.T)**2
+    return probs
+
+
+@pytest.mark.parametrize("anti", [1, -1])
+def test_stepped_reference(anti):
+    reference = stepped(anti)
+    for analytic in [False, True]:
+        probs = NuLayeredEarth(
+            e_grid, anti=anti, analytic=analytic
+        ).grid(cosZ)
+        np.testing.assert_allclose(probs, reference, rtol=0., atol=1e-3)
+
+
+def test_vacuum_layers():
+    # Without density the layers reduce to the vacuum
+    layers = np.array(earth_layers)
+    layers[:, 1] = 0.
+    for anti in [1, -1]:
+        np.testing.assert_allclose(
+            NuLayeredEarth(e_grid, layers=layers, anti=anti).grid(cosZ),
+            oscillation_grid(e_grid, cosZ, mixing_angles, anti=anti),
+            rtol=0., atol=1e-12
+        )
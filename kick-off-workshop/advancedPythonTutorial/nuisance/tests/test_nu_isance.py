@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+# Name: test_nu_isance.py
+# Authors: Stephan Meighen-Berger
+# Tests of the Nuisance interface
+
+import logging
+
+import numpy as np
+
+from nu_isance import Nuisance
+
+
+def settings(folder, **general) -> dict:
+    """ the settings of a small Nuisance writing into folder
+
+    Parameters
+    ----------
+    folder: pathlib.Path
+        The folder the log and the config dump are written to
+    general: dict
+        Further general settings
+
+    Returns
+    -------
+    userconfig: dict
+        The settings
+    """
+    general.setdefault("log file handler", str(folder / "nuisance.log"))
+    general.setdefault("config location", str(folder / "nuisance.txt"))
+    return {
+        "general": general,
+        "oscillation": {
+            "energy grid": np.logspace(-1, 1, 10),
+            "angle grid": np.linspace(-1, 1, 5),
+        },
+    }
+
+
+def test_shared_handlers(tmp_path):
+    root = logging.getLogger("")
+    before = list(root.handlers)
+    first = Nuisance(settings(tmp_path))
+    second = Nuisance(settings(tmp_path))
+    added = [handler for handler in root.handlers if handler not in before]
+    # One file and one console handler, however many instances log
+    assert len(added) == 2
+    # An instance without logging does not silence the others
+    Nuisance(settings(tmp_path, **{"enable logging": False}))
+    assert not root.disabled
+    first.close()
+    assert all(handler in root.handlers for handler in added)
+    logging.getLogger("nu_isance").info("Still logging")
+    second.close()
+    assert root.handlers == before
+    assert "Still logging" in (tmp_path / "nuisance.log").read_text()
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+# Name: test_nu_oscillations.py
+# Authors: Stephan Meighen-Berger
+# Tests of the NuOsc grids
+
+import numpy as np
+import pytest
+
+from nu_isance import config
+from nu_isance.nu_oscillations import NuOsc
+
+grid = {
+    "energy grid": np.logspace(-1, 1.5, 40),
+    "angle grid": np.linspace(-1, 0.2, 13),
+    "tile size": [4, 16],
+}
+
+
+def nu_osc(**settings) -> NuOsc:
+    """ a NuOsc on the small test grid
+
+    Parameters
+    ----------
+    settings: dict
+        Oscillation settings replacing the ones of the test grid
+
+    Returns
+    -------
+    osc: NuOsc
+        The oscillation object
+    """
+    return NuOsc(config.snapshot({"oscillation": dict(grid, **settings)}))
+
+
+def test_single_pass():
+    osc = nu_osc()
+    probs = osc.oscillation_probs()
+    np.testing.assert_array_equal(osc.oscillation_prob_e, probs[0])
+    np.testing.assert_array_equal(osc.oscillation_prob_tau, probs[2])
+    assert osc.instrumentation.report["kernels"] == {
+        "effective_eigensystems": 1, "oscillation_grid_effective": 1
+    }
+
+
+def test_tiled_prob():
+    full = nu_osc().oscillation_probs()
+    osc = nu_osc()
+    e_grid = grid["energy grid"]
+    cosZ = grid["angle grid"]
+    # The grid nodes are reproduced exactly
+    nodes = osc.prob(1, 0, e_grid[None, 5:30], cosZ[2:11, None])
+    np.testing.assert_array_equal(nodes, full[1, 0, 2:11, 5:30])
+    # Points between the nodes are interpolated the same way from the
+    # tiles and from the full grid
+    rng = np.random.default_rng(1337)
+    E = np.exp(rng.uniform(np.log(0.05), np.log(50.), 500))
+    Z = rng.uniform(-1.1, 0.3, 500)
+    tiled = osc.prob(2, 1, E, Z)
+    np.testing.assert_array_equal(osc.oscillation_prob_tau, full[2])
+    np.testing.assert_allclose(
+        osc.prob(2, 1, E, Z), tiled, rtol=0., atol=1e-13
+    )
+
+
+def test_cache_round_trip(tmp_path):
+    settings = {"precalc": True, "precalc location": str(tmp_path)}
+    built = nu_osc(**settings)
+    probs = built.oscillation_probs()
+    np.testing.assert_array_equal(probs, nu_osc().oscillation_probs())
+    assert len(list(tmp_path.glob("*.npy"))) == 1
+    # The second instance only loads the stored grid
+    loaded = nu_osc(**settings)
+    np.testing.assert_array_equal(loaded.oscillation_probs(), probs)
+    assert loaded.instrumentation.report["kernels"] == {}
+    # Settings changing the values are stored separately
+    nu_osc(matter=False, **settings).oscillation_probs()
+    assert len(list(tmp_path.glob("*.npy"))) == 2
+
+
+@pytest.mark.parametrize("settings", [
+    {},
+    {"matter": False, "anti neutrinos": True},
+    {"smearing": "gaussian"},
+    {"earth model": "layered"},
+], ids=["matter", "vacuum", "smeared", "layered"])
+def test_workers(settings):
+    # The threaded kernels give the same grids as the serial ones
+    serial = nu_osc(workers=1, **settings)
+    threaded = nu_osc(workers=None, **settings)
+    for anti in [1, -1]:
+        np.testing.assert_array_equal(
+            threaded.oscillation_probs(anti), serial.oscillation_probs(anti)
+        )
+
+
+def test_workers_gradients():
+    serial = nu_osc(workers=1, gradients=True)
+    threaded = nu_osc(workers=None, gradients=True)
+    np.testing.assert_array_equal(
+        threaded.oscillation_gradients(), serial.oscillation_gradients()
+    )
+
+
+@pytest.mark.parametrize("precision, tolerance", [
+    ("float64", 1e-12), ("float32", 1e-6)
+])
+@pytest.mark.parametrize("compact", [False, True])
+def test_storage(precision, tolerance, compact):
+    full = nu_osc(**{"anti neutrinos": True})
+    osc = nu_osc(
+        precision=precision, compact=compact, **{"anti neutrinos": True}
+    )
+    for anti in [1, -1]:
+        probs = osc.oscillation_probs(anti)
+        assert probs.dtype == np.dtype(precision)
+        assert probs.shape == (3, 3, 13, 40)
+        np.testing.assert_allclose(
+            probs, full.oscillation_probs(anti), rtol=0., atol=tolerance
+        )
+    np.testing.assert_array_equal(
+        osc.oscillation_prob_mu_bar, osc.oscillation_probs(-1)[1]
+    )
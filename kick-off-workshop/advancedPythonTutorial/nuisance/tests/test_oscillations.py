@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+# Name: test_oscillations.py
+# Authors: Stephan Meighen-Berger
+# Tests of the oscillation kernels
+
+import numpy as np
+import pytest
+from scipy.linalg import expm
+
+from nu_isance.constants import mixing_angles, mdiff, Vearth, m2GeV
+from nu_isance.nu_oscillations import NuEigensystem
+from nu_isance.utils import atmospheric_baselines, oscillation_grid
+from nu_isance.utils.oscillations import vacuum_hamiltonian
+
+e_grid = np.logspace(-1, 1.5, 12)
+cosZ = np.linspace(-1, -0.1, 6)
+
+
+def propagated(matter, anti: int) -> np.ndarray:
+    """ the grid from the matrix exponential of the hamiltonian
+
+    Parameters
+    ----------
+    matter: np.ndarray or None
+        The effective matter potential
+    anti: int
+        +1 for neutrinos and -1 for anti neutrinos
+
+    Returns
+    -------
+    oscillation_probs: np.ndarray
+        The oscillation probabilities with shape
+        (initial flavor, final flavor, cosZ, E)
+    """
+    vacuum_h = vacuum_hamiltonian(mixing_angles, mdiff, anti=anti)
+    distances = atmospheric_baselines(cosZ) * 1e3 * m2GeV
+    probs = np.empty((3, 3, len(cosZ), len(e_grid)))
+    for idE, E in enumerate(e_grid):
+        effective_h = vacuum_h
+        if matter is not None:
+            effective_h = vacuum_h + anti * matter * E
+        for idL, distance in enumerate(distances):
+            # The amplitude of alpha -> beta is evolution[beta, alpha]
+            evolution = expm(-1j * effective_h * distance / (2. * E))
+            probs[:, :, idL, idE] = np.abs(evolution.T)**2
+    return probs
+
+
+@pytest.mark.parametrize("matter", [None, Vearth], ids=["vacuum", "matter"])
+@pytest.mark.parametrize("anti", [1, -1])
+def test_eigensolvers(matter, anti):
+    reference = propagated(matter, anti)
+    for analytic in [False, True]:
+        probs = oscillation_grid(
+            e_grid, cosZ, mixing_angles, matter=matter, anti=anti,
+            analytic=analytic
+        )
+        np.testing.assert_allclose(probs, reference, rtol=0., atol=1e-10)
+
+
+@pytest.mark.parametrize("box", [False, True], ids=["gaussian", "box"])
+@pytest.mark.parametrize("anti", [1, -1])
+def test_smearing(box, anti):
+    # In vacuum the phases are linear in L/E, so the analytic average is
+    # exact and only limited by the sampling of the brute force average
+    width = 0.1
+    samples = 2001
+    if box:
+        offsets = (np.arange(samples) + 0.5) / samples * 2. - 1.
+        weights = np.full(samples, 1. / samples)
+    else:
+        offsets = np.linspace(-8., 8., samples)
+        weights = np.exp(-offsets**2 / 2.)
+        weights /= np.sum(weights)
+    energies = e_grid / (1. + width * offsets[:, np.newaxis])
+    probs = NuEigensystem(energies.ravel(), anti=anti).grid(cosZ).reshape(
+        3, 3, len(cosZ), samples, len(e_grid)
+    )
+    averaged = np.einsum("abzke,k->abze", probs, weights)
+    smeared = NuEigensystem(
+        e_grid, anti=anti, smearing=width, box=box
+    ).grid(cosZ)
+    np.testing.assert_allclose(smeared, averaged, rtol=0., atol=1e-6)
@@ -7,6 +7,7 @@ from .injection import __init__
 from .utils import __init__
 from .constants import __init__
 from .propagation import __init__
+from .events import __init__
 from .detectorexample import DetectorExample
 
 __all__ = (DetectorExample, config)
@@ -63,7 +63,9 @@ _baseconfig = {
         # TODO: This needs to become dependent on the refractive index
         "z grid": np.linspace(0, 1e4, int(1e4 / 23)),  # Weird number due to speed of light in water and timing used later
         "wavelengths": np.linspace(350., 500., 100),  # in nm
-        "ns grid": np.linspace(0, 100, 101)  # Pulse shape grid
+        "ns grid": np.linspace(0, 100, 101),  # Pulse shape grid
+        "pulse batch": 10000,  # Number of pulses histogrammed at once
+        "pulse templates": True,  # Look up the pulses in precomputed templates, needs a uniform ns grid
     }
 }
 
@@ -4,10 +4,12 @@
 # Interface class to the package
 
 # imports
+import os
 import numpy as np
 from typing import Union
+from concurrent.futures import ProcessPoolExecutor
 from tqdm.auto import tqdm
-from scipy.ndimage import gaussian_filter
+from scipy.ndimage import gaussian_filter1d
 
 # Module imports
 from .config import config
@@ -16,6 +18,23 @@ from .constants import year, c_water
 from .model import neutrino_fluxes
 from .injection import cross_section_CC, cross_section_NC
 from .propagation import light_production
+from .events import EventBatch
+
+# The DetectorExample used by the trials of a worker process
+_worker_detector = None
+
+
+def _set_worker_detector(detector) -> None:
+    """ stores the DetectorExample in a worker process
+    """
+    global _worker_detector
+    _worker_detector = detector
+
+
+def _worker_trial(trial_seed, signal, background) -> tuple:
+    """ runs a trial in a worker process, see DetectorExample._trial
+    """
+    return _worker_detector._trial(trial_seed, signal, background)
 
 
 class DetectorExample(object):
@@ -59,6 +78,7 @@ class DetectorExample(object):
         self._wavelengths = config['advanced']['wavelengths']
         self._photon_cut = config["propagation"]['photon cut']
         self._ns_grid = config['advanced']['ns grid']
+        self._pulse_batch = config['advanced']['pulse batch']
         print("Preliminary rates")
         self._rates = {
             "NuMu NC": self._detector_factor * self._numu * cross_section_NC(self._energy_grid) * self._energy_widths,
@@ -69,6 +89,26 @@ class DetectorExample(object):
             light_production(self._z_grid, self._wavelengths, self._energy_grid, photon_cut=self._photon_cut)
         )
         self._e_cut = config['analysis']['energy cuts']
+        # The smearing of the pulses as a matrix acting on the binned hits
+        self._smearing = gaussian_filter1d(
+            np.eye(len(self._ns_grid) - 1), sigma=2, radius=10, axis=0
+        )
+        self._templates = None
+        if config['advanced']['pulse templates']:
+            if np.allclose(np.diff(self._ns_grid), self._ns_grid[1] - self._ns_grid[0]):
+                print("Building the pulse templates")
+                self._templates = {
+                    'CC': [
+                        self._template_bank(distro)
+                        for distro in self._em_photons[self._e_cut[0]:self._e_cut[1]]
+                    ],
+                    'NC': [
+                        self._template_bank(distro)
+                        for distro in self._had_photons[self._e_cut[0]:self._e_cut[1]]
+                    ],
+                }
+            else:
+                print("The ns grid is not uniform, histogramming the pulses instead")
 
 
     # Sampling function for the interaction
@@ -104,135 +144,300 @@ class DetectorExample(object):
             self,
             nsamples: np.ndarray,
             rng: np.random.RandomState,
-            type='CC') -> np.ndarray:
+            type='CC') -> EventBatch:
         """ generates particle events within the detector
         """
+        nsamples = np.asarray(nsamples).astype(int)
+        offsets = np.concatenate([[0], np.cumsum(nsamples)])
         # Spatial generation
-        spatial_samples = []
-        for nsamp in nsamples:
-            spatial_samples.append(
-                self._spatial_sampling(int(nsamp), self._det.radius, rng)
-            )
-        
+        radius_samples = np.empty(offsets[-1])
+        phi_samples = np.empty((offsets[-1], 2))
+        theta_samples = np.empty((offsets[-1], 2))
+        for idE, nsamp in enumerate(nsamples):
+            bin_slice = slice(offsets[idE], offsets[idE + 1])
+            (
+                radius_samples[bin_slice], phi_samples[bin_slice], theta_samples[bin_slice]
+            ) = self._spatial_sampling(nsamp, self._det.radius, rng)
+
         if type == 'CC':
             lengths = self._em_lengths[self._e_cut[0]:self._e_cut[1]]
             distro = self._em_photons[self._e_cut[0]:self._e_cut[1]]
         else:
             lengths = self._had_lengths[self._e_cut[0]:self._e_cut[1]]
             distro = self._had_photons[self._e_cut[0]:self._e_cut[1]]
-        spatial_cuts = []
-        timing_arr = []
-        for idE, spatial_sample in enumerate(spatial_samples):
-            rsampl, phisamp, thetasampl = spatial_sample
-            X_int = rsampl * np.sin(phisamp[:, 0]) * np.cos(thetasampl[:, 0])
-            Y_int = rsampl * np.sin(phisamp[:, 0]) * np.sin(thetasampl[:, 0])
-            Z_int = rsampl * np.cos(phisamp[:, 0])
-            arrow_scale = lengths[idE]
-            X_dir = arrow_scale * np.sin(phisamp[:, 1]) * np.cos(thetasampl[:, 1])
-            Y_dir = arrow_scale * np.sin(phisamp[:, 1]) * np.sin(thetasampl[:, 1])
-            Z_dir = arrow_scale * np.cos(phisamp[:, 1])
-            # Spatial Cuts
-            event_r = np.sqrt(
-                (X_int + X_dir)**2 +
-                (Y_int + Y_dir)**2 +
-                (Z_int + Z_dir)**2
+        positions = np.column_stack([
+            radius_samples * np.sin(phi_samples[:, 0]) * np.cos(theta_samples[:, 0]),
+            radius_samples * np.sin(phi_samples[:, 0]) * np.sin(theta_samples[:, 0]),
+            radius_samples * np.cos(phi_samples[:, 0]),
+        ])
+        arrow_scale = np.repeat(lengths, nsamples)
+        directions = np.column_stack([
+            arrow_scale * np.sin(phi_samples[:, 1]) * np.cos(theta_samples[:, 1]),
+            arrow_scale * np.sin(phi_samples[:, 1]) * np.sin(theta_samples[:, 1]),
+            arrow_scale * np.cos(phi_samples[:, 1]),
+        ])
+        # Spatial Cuts
+        ends = positions + directions
+        event_r = np.sqrt(ends[:, 0]**2 + ends[:, 1]**2 + ends[:, 2]**2)
+        cuts = event_r < self._det.radius
+        # Timing
+        distances = np.abs(event_r - self._det.radius)
+        pulses = np.empty((offsets[-1], len(self._ns_grid) - 1))
+        for idE in range(len(nsamples)):
+            bin_slice = slice(offsets[idE], offsets[idE + 1])
+            if self._templates is None:
+                pulses[bin_slice] = self._pulses(distances[bin_slice], distro[idE])
+            else:
+                templates = self._templates['CC' if type == 'CC' else 'NC'][idE]
+                pulses[bin_slice] = self._template_pulses(distances[bin_slice], templates)
+        return EventBatch(positions, directions, cuts, pulses, offsets)
+
+    def _pulses(self, offsets: np.ndarray, distro: np.ndarray) -> np.ndarray:
+        """ histograms and smears the pulses of a batch of events. The
+        events only differ by the offset of their arrival times, so all
+        of them are histogrammed at once. The binning follows np.histogram,
+        i.e. the light yield is summed up along z_grid and differenced at
+        the bin edges, so the pulses are the same as when histogramming
+        each event on its own
+
+        Parameters
+        ----------
+        offsets: np.ndarray
+            Distance of each event from the detector edge in cm
+        distro: np.ndarray
+            The light yield along the z grid
+
+        Returns
+        -------
+        pulses: np.ndarray
+            The smeared pulses with shape (len(offsets), len(ns_grid) - 1)
+        """
+        n_bins = len(self._ns_grid) - 1
+        pulses = np.empty((len(offsets), n_bins))
+        cumulative = np.concatenate([[0.], np.cumsum(distro)])
+        for start in range(0, len(offsets), self._pulse_batch):
+            batch = offsets[start:start + self._pulse_batch]
+            times = ((batch[:, np.newaxis] + self._z_grid) / c_water) * 1e9
+            # Number of photon bunches arriving before each bin edge. The
+            # times of each event are sorted, since the z grid is
+            edge_ids = np.searchsorted(self._ns_grid, times, side='right')
+            rows = np.arange(len(batch))[:, np.newaxis] * (n_bins + 2)
+            counts = np.bincount(
+                (rows + edge_ids).ravel(), minlength=len(batch) * (n_bins + 2)
+            ).reshape(len(batch), n_bins + 2)
+            before = np.cumsum(counts, axis=1)[:, :n_bins + 1]
+            # The last bin includes its right edge
+            before[:, -1] += np.sum(times == self._ns_grid[-1], axis=1)
+            hits_binned = np.diff(cumulative[before], axis=1)
+            pulses[start:start + len(batch)] = gaussian_filter1d(
+                hits_binned, sigma=2, radius=10, axis=1
             )
-            event_cut = event_r < self._det.radius
-            spatial_cuts.append(event_cut)
-            # Timing
-            energy_sample = []
-            for idS, _ in enumerate(X_int):
-                hits_binned, _ = np.histogram(
-                    ((np.abs(event_r[idS] - self._det.radius) + self._z_grid) / c_water) * 1e9,
-                    bins=self._ns_grid, weights=distro[idE]
-                )
-                energy_sample.append(gaussian_filter(hits_binned, sigma=2, radius=10))
-            timing_arr.append(energy_sample)
-        spatial_cuts = np.array(spatial_cuts, dtype=object)
-        return spatial_samples, np.array(timing_arr, dtype=object), spatial_cuts
+        return pulses
+
+    def _template_bank(self, distro: np.ndarray) -> tuple:
+        """ precomputes the binned hits of a light yield for all arrival
+        time offsets. With offsets of (k + delta) ns bins, the hits are
+        the ones for delta shifted by k bins. The hits for delta only
+        change where a photon bunch crosses a bin edge, so one template
+        per interval between these breakpoints is exact
+
+        Parameters
+        ----------
+        distro: np.ndarray
+            The light yield along the z grid
+
+        Returns
+        -------
+        breaks: np.ndarray
+            The lower ends of the delta intervals
+        bank: np.ndarray
+            The binned hits for each interval, padded with an empty bin on
+            each side. The first filled bin is bin int(floor(s[0])) with
+            s the arrival time of the z grid in ns bins
+        """
+        width = self._ns_grid[1] - self._ns_grid[0]
+        steps = ((self._z_grid / c_water) * 1e9) / width
+        whole = np.floor(steps)
+        # A photon bunch moves to the next bin for delta >= crossing
+        crossing = 1. - (steps - whole)
+        breaks = np.unique(np.concatenate([[0.], crossing[crossing < 1.]]))
+        bins = whole + (breaks[:, np.newaxis] >= crossing)
+        n_bins = int(bins[-1, -1] - whole[0]) + 1
+        # Cumulative light yield differenced at the bin edges, as in _pulses
+        positions = (bins - whole[0]).astype(int) + 1
+        rows = np.arange(len(breaks))[:, np.newaxis] * (n_bins + 1)
+        counts = np.bincount(
+            (rows + positions).ravel(), minlength=len(breaks) * (n_bins + 1)
+        ).reshape(len(breaks), n_bins + 1)
+        cumulative = np.concatenate([[0.], np.cumsum(distro)])
+        bank = np.zeros((len(breaks), n_bins + 2))
+        bank[:, 1:-1] = np.diff(cumulative[np.cumsum(counts, axis=1)], axis=1)
+        return breaks, bank
+
+    def _template_pulses(self, offsets: np.ndarray, templates: tuple) -> np.ndarray:
+        """ looks up the pulses of a batch of events in a template bank.
+        Agrees with _pulses up to rounding
+
+        Parameters
+        ----------
+        offsets: np.ndarray
+            Distance of each event from the detector edge in cm
+        templates: tuple
+            The breaks and bank from _template_bank
+
+        Returns
+        -------
+        pulses: np.ndarray
+            The smeared pulses with shape (len(offsets), len(ns_grid) - 1)
+        """
+        breaks, bank = templates
+        n_bins = len(self._ns_grid) - 1
+        width = self._ns_grid[1] - self._ns_grid[0]
+        first = np.floor(((self._z_grid[0] / c_water) * 1e9) / width)
+        pulses = np.empty((len(offsets), n_bins))
+        for start in range(0, len(offsets), self._pulse_batch):
+            batch = offsets[start:start + self._pulse_batch]
+            steps = (((batch / c_water) * 1e9) - self._ns_grid[0]) / width
+            shifts = np.floor(steps)
+            templates_ids = np.searchsorted(breaks, steps - shifts, side='right') - 1
+            # Bins outside of the template point to the empty padding
+            bank_bins = np.clip(
+                np.arange(n_bins) - (shifts[:, np.newaxis] + first) + 1,
+                0, bank.shape[1] - 1
+            ).astype(int)
+            hits_binned = bank[templates_ids[:, np.newaxis], bank_bins]
+            pulses[start:start + len(batch)] = hits_binned @ self._smearing.T
+        return pulses
 
     # -------------------------------------------------------------------------------------------
     # Some basic analysis scripts for convenience
     # Analysis
     def _tail_vs_start(self, pulses: np.ndarray) -> np.ndarray:
-        """ takes an array of pulses and checks their likelihood of being a CC event
+        """ takes an array of pulses and checks their likelihood of being a CC event.
+        The start runs up to and including the maximum of the pulse, the rest is the
+        tail. Both are summed for all pulses at once using masks
         """
         idmaxes = np.argmax(pulses, axis=1)
-        ratio_arr = np.array([
-            np.sum(pulses[idTest][idmaxes[idTest]+1:]) /
-            np.sum(pulses[idTest][:idmaxes[idTest]+1])
-            for idTest in range(len(pulses))
-        ])
-        return ratio_arr
+        start = np.arange(pulses.shape[1]) <= idmaxes[:, np.newaxis]
+        return (
+            np.sum(pulses, axis=1, where=~start) /
+            np.sum(pulses, axis=1, where=start)
+        )
 
-    def _data_TvsS_test(self, all_pulses: np.ndarray, cuts:np.ndarray) -> np.ndarray:
+    def _data_TvsS_test(self, events: EventBatch) -> np.ndarray:
         """ helper function to apply analysis to the entire set
         """
-        ratio_energy_bins = []
-        for idE, energy_bin in enumerate(all_pulses):
-            tmp_pulses = np.array(energy_bin)[cuts[idE]]
-            ratio_energy_bins.append(self._tail_vs_start(tmp_pulses))
-        return np.concatenate(np.array(ratio_energy_bins, dtype=object))
-
-    def _data_TvsS_cut(self, all_pulses: np.ndarray, cuts:np.ndarray, TvsS_cut: float) -> np.ndarray:
-        """ helper function to apply analysis cuts to the entire set
+        return self._tail_vs_start(events.pulses[events.cuts])
+
+    def _data_TvsS_cut(self, events: EventBatch, TvsS_cut: float) -> np.ndarray:
+        """ helper function to apply analysis cuts to the entire set. Returns
+        the events passing both the spatial and the analysis cuts
         """
-        tmp_bool = []
-        for idE, energy_bin in enumerate(all_pulses):
-            tmp_pulses = np.array(energy_bin)[cuts[idE]]
-            tmp_bool.append(np.less(self._tail_vs_start(tmp_pulses), TvsS_cut))
-        return np.array(tmp_bool, dtype=object)
-
-    def _analysis_simulation(self, nTrials: int, signal: np.ndarray, background: np.ndarray, seed=1337) -> np.ndarray:
-        """ entire analysis multiple times
+        passed = np.array(events.cuts)
+        passed[events.cuts] = np.less(self._data_TvsS_test(events), TvsS_cut)
+        return passed
+
+    def _analysis_simulation(
+            self, nTrials: int, signal: np.ndarray, background: np.ndarray,
+            seed=1337, workers=1) -> np.ndarray:
+        """ entire analysis multiple times. Each trial draws from its own random
+        stream spawned from the seed, so the results only depend on the seed and
+        not on the number of workers
+
+        Parameters
+        ----------
+        nTrials: int
+            Number of trials
+        signal: np.ndarray
+            The expected signal events per energy bin
+        background: np.ndarray
+            The expected background events per energy bin
+        seed: int
+            Optional: Seed of the trial streams
+        workers: int or None
+            Optional: Number of processes the trials are spread over. None
+            uses all CPUs
+
+        Raises
+        ------
+        ValueError
+            If there are fewer than one worker
+
+        Returns
+        -------
+        totals: np.ndarray
+            The NC counts after and before the analysis cut, followed by the
+            CC counts after and before, for each trial
         """
-        totals_CC_pre = []
-        totals_NC_pre = []
-        totals_CC = []
-        totals_NC = []
-        rng_trial = np.random.RandomState(seed)
-        # Offloading some random number work before loop
-        signal_sets = rng_trial.poisson(signal[self._e_cut[0]:self._e_cut[1]], size=(nTrials, len(signal[self._e_cut[0]:self._e_cut[1]])))
-        background_sets = rng_trial.poisson(background[self._e_cut[0]:self._e_cut[1]], size=(nTrials, len(signal[self._e_cut[0]:self._e_cut[1]])))
-        for set in tqdm(range(nTrials)):
-            _, timing_samples_CC, cuts_CC = self.event_generator(
-                signal_sets[set],  # Sampling the events as well!
-                rng_trial,
-                type='CC'
-            )
-            _, timing_samples_NC, cuts_NC = self.event_generator(
-                background_sets[set],
-                rng_trial,
-                type='NC'
-            )
-            CC_counts = np.array([
-                np.sum(cut_e) for cut_e in cuts_CC
-            ])
-            NC_counts = np.array([
-                np.sum(cut_e) for cut_e in cuts_NC
-            ])
-            cc_cut_set = self._data_TvsS_cut(timing_samples_CC, cuts_CC, 1.5023693639498166)
-            nc_cut_set = self._data_TvsS_cut(timing_samples_NC, cuts_NC, 1.5023693639498166)
-
-            # Sum didn't work
-            cc_cut_counts = np.array([
-                np.sum(elem) for elem in cc_cut_set
-            ])
-            nc_cut_counts = np.array([
-                np.sum(elem) for elem in nc_cut_set
-            ])
-            totals_CC_pre.append(np.sum(CC_counts))
-            totals_NC_pre.append(np.sum(NC_counts))
-            totals_CC.append(np.sum(cc_cut_counts))
-            totals_NC.append(np.sum(nc_cut_counts))
-        return np.array([
-            totals_NC, totals_NC_pre,
-            totals_CC, totals_CC_pre,
-        ])
+        if workers is None:
+            workers = os.cpu_count() or 1
+        if workers < 1:
+            raise ValueError("The number of workers has to be at least 1, got %s" % workers)
+        signal = signal[self._e_cut[0]:self._e_cut[1]]
+        background = background[self._e_cut[0]:self._e_cut[1]]
+        trial_seeds = np.random.SeedSequence(seed).spawn(nTrials)
+        if workers == 1:
+            totals = [
+                self._trial(trial_seed, signal, background)
+                for trial_seed in tqdm(trial_seeds)
+            ]
+        else:
+            # The light yields and templates are sent once per worker
+            with ProcessPoolExecutor(
+                    max_workers=workers, initializer=_set_worker_detector,
+                    initargs=(self,)) as pool:
+                totals = list(tqdm(
+                    pool.map(
+                        _worker_trial, trial_seeds,
+                        [signal] * nTrials, [background] * nTrials,
+                        chunksize=max(nTrials // (4 * workers), 1)
+                    ),
+                    total=nTrials
+                ))
+        return np.array(totals, dtype=int).reshape(nTrials, 4).T
+
+    def _trial(
+            self, trial_seed: np.random.SeedSequence, signal: np.ndarray,
+            background: np.ndarray) -> tuple:
+        """ a single trial of the analysis
+
+        Parameters
+        ----------
+        trial_seed: np.random.SeedSequence
+            Seed of the random stream of the trial
+        signal: np.ndarray
+            The expected signal events in the energy cuts
+        background: np.ndarray
+            The expected background events in the energy cuts
+
+        Returns
+        -------
+        totals: tuple
+            The NC counts after and before the analysis cut, followed by the
+            CC counts after and before
+        """
+        rng_trial = np.random.RandomState(np.random.PCG64(trial_seed))
+        events_CC = self.event_generator(
+            rng_trial.poisson(signal),  # Sampling the events as well!
+            rng_trial,
+            type='CC'
+        )
+        events_NC = self.event_generator(
+            rng_trial.poisson(background),
+            rng_trial,
+            type='NC'
+        )
+        return (
+            np.sum(self._data_TvsS_cut(events_NC, 1.5023693639498166)),
+            np.sum(events_NC.cuts),
+            np.sum(self._data_TvsS_cut(events_CC, 1.5023693639498166)),
+            np.sum(events_CC.cuts),
+        )
 
-    def _example_analysis(self, nTrials):
+    def _example_analysis(self, nTrials, workers=1):
         return self._analysis_simulation(
             nTrials,
             self._rates['NuE CC'],
-            (self._rates['NuE NC'] + self._rates['NuMu NC'])
+            (self._rates['NuE NC'] + self._rates['NuMu NC']),
+            workers=workers
         )
\ No newline at end of file
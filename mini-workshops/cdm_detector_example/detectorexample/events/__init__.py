@@ -0,0 +1 @@
+from .event_batch import EventBatch
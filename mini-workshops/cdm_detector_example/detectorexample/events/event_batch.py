@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+# event_batch.py
+# Authors: Stephan Meighen-Berger
+# Columnar storage of generated events
+
+import numpy as np
+
+
+class EventBatch(object):
+    """ the events of a sample stored column wise. The events of all
+    energy bins are kept in contiguous arrays, ordered by energy bin,
+    and offsets mark where each bin starts
+    """
+    def __init__(
+            self, positions: np.ndarray, directions: np.ndarray,
+            cuts: np.ndarray, pulses: np.ndarray, offsets: np.ndarray):
+        """ initializes the class
+
+        Parameters
+        ----------
+        positions: np.ndarray
+            The interaction points (x, y, z) with shape (event, 3)
+        directions: np.ndarray
+            The outgoing directions (x, y, z), scaled by the length of the
+            event, with shape (event, 3)
+        cuts: np.ndarray
+            True for the events passing the spatial cuts
+        pulses: np.ndarray
+            The pulses with shape (event, time bin)
+        offsets: np.ndarray
+            Index of the first event of each energy bin, followed by the
+            number of events
+        """
+        self._positions = positions
+        self._directions = directions
+        self._cuts = cuts
+        self._pulses = pulses
+        self._offsets = offsets
+
+    def __len__(self):
+        return len(self._cuts)
+
+    @property
+    def positions(self):
+        return self._positions
+
+    @property
+    def directions(self):
+        return self._directions
+
+    @property
+    def cuts(self):
+        return self._cuts
+
+    @property
+    def pulses(self):
+        return self._pulses
+
+    @property
+    def offsets(self):
+        return self._offsets
+
+    @property
+    def n_bins(self):
+        return len(self._offsets) - 1
+
+    def energy_bin(self, idE: int) -> slice:
+        """ the events of an energy bin
+
+        Parameters
+        ----------
+        idE: int
+            The energy bin
+
+        Returns
+        -------
+        events: slice
+            Selects the events of the bin from any of the columns
+        """
+        return slice(self._offsets[idE], self._offsets[idE + 1])
+
+    def per_bin(self, values: np.ndarray) -> np.ndarray:
+        """ sums values of the events per energy bin, e.g. the cuts to
+        count the events passing them
+
+        Parameters
+        ----------
+        values: np.ndarray
+            One value per event
+
+        Returns
+        -------
+        totals: np.ndarray
+            The sum for each energy bin
+        """
+        cumulative = np.concatenate([[0], np.cumsum(values)])
+        return np.diff(cumulative[self._offsets])
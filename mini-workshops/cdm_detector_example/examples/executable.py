@@ -14,23 +14,19 @@ EventGenerator = DetectorExample()
 print("Random seed")
 rng = np.random.RandomState(1337)
 # Generating events
-spatial_samples_CC, timing_samples_CC, cuts_CC = EventGenerator.event_generator(
+events_CC = EventGenerator.event_generator(
     EventGenerator._rates['NuE CC'][EventGenerator._e_cut[0]:EventGenerator._e_cut[1]],
     rng, 'CC'
 )
 
-spatial_samples_NC, timing_samples_NC, cuts_NC = EventGenerator.event_generator(
+events_NC = EventGenerator.event_generator(
     (EventGenerator._rates['NuE NC'] + EventGenerator._rates['NuMu NC'])[EventGenerator._e_cut[0]:EventGenerator._e_cut[1]],
     rng, 'NC'
 )
 
 # Total counts
-CC_counts = np.array([
-    np.sum(cut_e) for cut_e in cuts_CC
-])
-NC_counts = np.array([
-    np.sum(cut_e) for cut_e in cuts_NC
-])
+CC_counts = events_CC.per_bin(events_CC.cuts)
+NC_counts = events_NC.per_bin(events_NC.cuts)
 
 # Let's plot it
 # -----------------------------------------------------------
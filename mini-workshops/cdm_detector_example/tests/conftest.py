@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+# conftest.py
+# Authors: Stephan Meighen-Berger
+# Shared fixtures of the tests
+
+import os
+from copy import deepcopy
+
+import pytest
+
+_data = os.path.join(os.path.dirname(__file__), "..", "data", "")
+
+
+@pytest.fixture(scope="session")
+def detector():
+    """ a DetectorExample with the default settings, using the flux tables
+    shipped with the package. The global config is restored afterwards
+    """
+    # Imported here, so modules without the optional fennel dependency
+    # can skip before the package is imported
+    from detectorexample import DetectorExample, config
+    defaults = deepcopy(dict(config))
+    yield DetectorExample({
+        "model": dict(config["model"], **{"mceq storage": _data})
+    })
+    config.clear()
+    config.update(defaults)
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+# test_analysis_simulation.py
+# Authors: Stephan Meighen-Berger
+# Checks of the parallel trials of the analysis simulation
+
+import numpy as np
+import pytest
+
+# The propagation module needs fennel
+pytest.importorskip("fennel")
+
+# Module import
+from detectorexample import config
+
+
+def _rates():
+    n_energies = len(config['advanced']['energy bins']) - 1
+    signal = np.zeros(n_energies)
+    background = np.zeros(n_energies)
+    signal[10:22] = 30.
+    background[10:22] = 25.
+    return signal, background
+
+
+@pytest.mark.parametrize("workers", [2, None])
+def test_workers(detector, workers):
+    """ the trials do not depend on the number of workers. None runs on
+    all CPUs
+    """
+    signal, background = _rates()
+    serial = detector._analysis_simulation(6, signal, background, seed=7)
+    parallel = detector._analysis_simulation(
+        6, signal, background, seed=7, workers=workers
+    )
+    assert parallel.shape == (4, 6)
+    np.testing.assert_array_equal(serial, parallel)
+
+
+@pytest.mark.parametrize("workers", [0, -2])
+def test_invalid_workers(detector, workers):
+    """ fewer than one worker is rejected before building the pool
+    """
+    signal, background = _rates()
+    with pytest.raises(ValueError):
+        detector._analysis_simulation(2, signal, background, workers=workers)
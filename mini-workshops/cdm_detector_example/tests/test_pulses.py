@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+# test_pulses.py
+# Authors: Stephan Meighen-Berger
+# Checks of the pulse shapes against histogramming each event
+
+import numpy as np
+import pytest
+from scipy.ndimage import gaussian_filter
+
+# The propagation module needs fennel
+pytest.importorskip("fennel")
+
+# Module import
+from detectorexample import config
+from detectorexample.constants import c_water
+
+
+def _reference_pulses(offsets: np.ndarray, distro: np.ndarray) -> np.ndarray:
+    """ the pulses histogrammed and smeared event by event
+    """
+    z_grid = config['advanced']['z grid']
+    ns_grid = config['advanced']['ns grid']
+    pulses = []
+    for offset in offsets:
+        hits_binned, _ = np.histogram(
+            ((offset + z_grid) / c_water) * 1e9, bins=ns_grid, weights=distro
+        )
+        pulses.append(gaussian_filter(hits_binned, sigma=2, radius=10))
+    return np.array(pulses)
+
+
+@pytest.fixture
+def light_yield():
+    """ a light yield along the z grid and the event offsets
+    """
+    z_grid = config['advanced']['z grid']
+    distro = (z_grid / 100.)**2 * np.exp(-z_grid / 300.)
+    rng = np.random.default_rng(7)
+    # Including events at the edge and outside of the time window
+    offsets = np.concatenate([[0., 1e3, 3e3], rng.uniform(0., 2e3, 200)])
+    return offsets, distro
+
+
+def test_histogram(detector, light_yield):
+    """ all events histogrammed at once give the per event pulses
+    """
+    offsets, distro = light_yield
+    np.testing.assert_allclose(
+        detector._pulses(offsets, distro),
+        _reference_pulses(offsets, distro), rtol=1e-12, atol=1e-12
+    )
+
+
+def test_templates(detector, light_yield):
+    """ the pulses looked up in the template bank agree with the per event
+    pulses up to rounding
+    """
+    offsets, distro = light_yield
+    templates = detector._template_bank(distro)
+    np.testing.assert_allclose(
+        detector._template_pulses(offsets, templates),
+        _reference_pulses(offsets, distro),
+        rtol=1e-10, atol=1e-10 * np.max(distro)
+    )
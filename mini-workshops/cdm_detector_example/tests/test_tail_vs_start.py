@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+# test_tail_vs_start.py
+# Authors: Stephan Meighen-Berger
+# Checks of the tail versus start ratio of the analysis
+
+import numpy as np
+import pytest
+
+# The propagation module needs fennel
+pytest.importorskip("fennel")
+
+
+def _reference_ratios(pulses: np.ndarray) -> np.ndarray:
+    """ the ratios calculated pulse by pulse
+    """
+    idmaxes = np.argmax(pulses, axis=1)
+    return np.array([
+        np.sum(pulses[idTest][idmaxes[idTest]+1:]) /
+        np.sum(pulses[idTest][:idmaxes[idTest]+1])
+        for idTest in range(len(pulses))
+    ])
+
+
+def test_masked_ratios(detector):
+    """ the masked sums give the ratios of the loop over the pulses
+    """
+    rng = np.random.default_rng(7)
+    pulses = rng.exponential(size=(300, 100))
+    # Maxima in the first and the last bin
+    pulses[0, 0] = 10.
+    pulses[1, -1] = 10.
+    np.testing.assert_allclose(
+        detector._tail_vs_start(pulses), _reference_ratios(pulses),
+        rtol=1e-12
+    )